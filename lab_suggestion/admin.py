@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Test, Lab, LabTestDetail, ContactMessage, ChatMessage, AIRecommendation, ContactMessage, ChatMessage, AIRecommendation
+from .models import Test, Lab, LabTestDetail, ContactMessage, ChatMessage, AIRecommendation, ContactMessage, ChatMessage, AIRecommendation, EmailOutbox
 
 class LabTestDetailInline(admin.TabularInline):
     model = LabTestDetail
@@ -39,5 +39,12 @@ class AIRecommendationAdmin(admin.ModelAdmin):
     filter_horizontal = ('recommended_tests',)
     readonly_fields = ('created_at',)
 
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'to')
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+
 # You might also want to register LabTestDetail if you want to manage it directly, but the inline handles most cases.
 # admin.site.register(LabTestDetail)
@@ -3,15 +3,42 @@ AI Service module for LabEase
 Provides AI-powered chatbot and recommendation functionality with RAG
 """
 import re
-from django.db.models import Q
+import threading
+from django.core.cache import cache
+from django.db.models import Q, prefetch_related_objects
+from .catalog import CatalogIndex
+from .intents import detect_intents
 from .models import Test, Lab, ChatMessage, AIRecommendation
+from .offerings import labs_offering
 from .rag_service import RAGService
+from .recommendations import (
+    RECOMMENDATION_CACHE_TIMEOUT, recommend_test_ids, recommendation_cache_key, symptoms_key,
+)
+from .response_cache import make_response_cache, response_key
 
 class AIChatbotService:
     """AI Chatbot service for answering questions about labs and tests"""
     
+    _instance = None
+    _instance_lock = threading.Lock()
+    
     def __init__(self):
-        self.context = self._load_context()
+        # Built on first use and rebuilt only when the catalog version changes
+        self._context = CatalogIndex(self._load_context)
+        self.responses = make_response_cache()
+    
+    @classmethod
+    def instance(cls):
+        """Shared per-process service; it holds no per-request state"""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+    
+    @property
+    def context(self):
+        return self._context.get()
     
     def _load_context(self):
         """Load context about available labs and tests"""
@@ -28,48 +55,59 @@ class AIChatbotService:
             'total_labs': labs.count()
         }
     
-    def generate_response(self, user_message, session_id=None):
+    def generate_response(self, user_message, session_id=None, intents=None):
         """Generate AI response based on user message using RAG"""
-        user_message_lower = user_message.lower()
+        if intents is None:
+            intents = detect_intents(user_message)
+        intent = intents.primary
         
         # Booking request patterns - prioritize this
-        if any(word in user_message_lower for word in ['book', 'booking', 'want to book', 'can i book', 'i need to book', 'book test', 'book a test', 'schedule', 'appointment']):
+        if intent == 'booking':
             response = self._handle_booking_request(user_message)
             suggestions = self._get_booking_suggestions()
             return response, suggestions
         
+        # Everything else depends only on the message and the catalog, so repeated questions are cached
+        response, suggestions = self.responses.get_or_build(
+            response_key(intent, user_message),
+            lambda: self._answer(intent, user_message),
+        )
+        return response, list(suggestions)
+    
+    def _answer(self, intent, user_message):
+        """(response, suggestions) for a non-booking intent"""
         # Greeting patterns
-        if any(word in user_message_lower for word in ['hello', 'hi', 'hey', 'greetings']):
+        if intent == 'greeting':
             response = self._greeting_response()
             suggestions = self._get_default_suggestions()
             return response, suggestions
         
         # Price queries - prioritize this as it's a common question
-        if any(word in user_message_lower for word in ['price', 'cost', 'expensive', 'cheap', 'affordable', 'how much']):
+        if intent == 'price':
             response = self._handle_price_query(user_message)
             suggestions = self._get_price_suggestions(user_message)
             return response, suggestions
         
         # Symptom-based recommendations
-        if any(word in user_message_lower for word in ['symptom', 'symptoms', 'feel', 'feeling', 'pain', 'recommend', 'suggest', 'should i take', 'what test']):
+        if intent == 'symptom':
             response = self._handle_symptom_query(user_message)
             suggestions = self._get_symptom_suggestions(user_message)
             return response, suggestions
         
         # Search for tests
-        if any(word in user_message_lower for word in ['test', 'tests', 'lab test', 'what test', 'which test', 'do you have']):
+        if intent == 'test':
             response = self._handle_test_query(user_message)
             suggestions = self._get_test_suggestions(user_message)
             return response, suggestions
         
         # Search for labs
-        if any(word in user_message_lower for word in ['lab', 'labs', 'laboratory', 'where', 'location', 'find lab', 'near me']):
+        if intent == 'lab':
             response = self._handle_lab_query(user_message)
             suggestions = self._get_lab_suggestions(user_message)
             return response, suggestions
         
         # General help
-        if any(word in user_message_lower for word in ['help', 'how', 'what can', 'what do', 'guide']):
+        if intent == 'help':
             response = self._help_response()
             suggestions = self._get_default_suggestions()
             return response, suggestions
@@ -348,13 +386,13 @@ I'm your intelligent healthcare assistant. Here's how I can help you:
     def _handle_test_query(self, user_message):
         """Handle queries about tests with professional, detailed responses"""
         # Use RAG to retrieve relevant tests
-        retrieved_tests = RAGService.retrieve_tests(user_message, limit=10)
+        retrieved_tests = list(RAGService.retrieve_tests(user_message, limit=10))
         
-        if retrieved_tests.exists():
-            response = f"I found {retrieved_tests.count()} test(s) matching your query. Here are the details:\n\n"
+        if retrieved_tests:
+            response = f"I found {len(retrieved_tests)} test(s) matching your query. Here are the details:\n\n"
             
             for test in retrieved_tests[:6]:
-                labs_offering = Lab.objects.filter(tests=test).distinct()[:3]
+                offered_at = labs_offering(test, 3)
                 response += f"**🧬 {test.name}**\n"
                 
                 if test.description:
@@ -365,15 +403,15 @@ I'm your intelligent healthcare assistant. Here's how I can help you:
                 else:
                     response += f"   💰 **Price:** Contact lab for rates\n"
                 
-                if labs_offering.exists():
-                    response += f"   🏥 **Available at:** {', '.join([lab.name for lab in labs_offering])}\n"
+                if offered_at:
+                    response += f"   🏥 **Available at:** {', '.join([lab.name for lab in offered_at])}\n"
                 else:
                     response += f"   🏥 **Available at:** Contact us for labs\n"
                 
                 response += "\n"
             
-            if retrieved_tests.count() > 6:
-                response += f"\n📌 *Showing 6 of {retrieved_tests.count()} results. Search for more!*\n\n"
+            if len(retrieved_tests) > 6:
+                response += f"\n📌 *Showing 6 of {len(retrieved_tests)} results. Search for more!*\n\n"
             
             response += "**What's Next?**\n"
             response += "✓ Interested? Say 'Book {test name}'\n"
@@ -383,20 +421,11 @@ I'm your intelligent healthcare assistant. Here's how I can help you:
             return response
         else:
             # List all available tests
-            all_tests = Test.objects.filter(
-                name__in=[
-                    'a', 'u', 'z', 'x', 'acer', 'xray', 'ICU', 'BED', 'SSCU',
-                    'AMBULANCE CHARG', 'VENTILATOR CHARGE', 'CABIN BED'
-                ]
-            ).values_list('id', flat=True)  # Exclude list
-            
-            valid_tests = Test.objects.exclude(
-                id__in=all_tests
-            ).order_by('-price')[:15]
+            valid_tests = Test.objects.filter(is_junk=False).order_by('-price')[:15]
             
             if valid_tests.exists():
                 response = f"📋 **Medical Tests Available**\n\n"
-                response += f"We have **{Test.objects.exclude(id__in=all_tests).count()} quality medical tests** available.\n\n"
+                response += f"We have **{Test.objects.filter(is_junk=False).count()} quality medical tests** available.\n\n"
                 response += f"**Popular Tests:**\n\n"
                 
                 for test in valid_tests[:10]:
@@ -512,7 +541,7 @@ I'm your intelligent healthcare assistant. Here's how I can help you:
         
         # If specific test found, provide detailed information
         if specific_test:
-            labs_offering = Lab.objects.filter(tests=specific_test).distinct()[:3]
+            offered_at = labs_offering(specific_test, 3)
             response = f"💰 **Pricing for {specific_test.name}**\n\n"
             
             if specific_test.description:
@@ -520,9 +549,9 @@ I'm your intelligent healthcare assistant. Here's how I can help you:
             
             response += f"**💵 Price:** Rs. {specific_test.price}\n\n"
             
-            if labs_offering.exists():
+            if offered_at:
                 response += f"**🏥 Available at:**\n"
-                for lab in labs_offering:
+                for lab in offered_at:
                     response += f"• **{lab.name}** - {lab.city}\n"
                     if lab.contact_phone:
                         response += f"  📞 {lab.contact_phone}\n"
@@ -611,21 +640,21 @@ I'm your intelligent healthcare assistant. Here's how I can help you:
     def _handle_symptom_query(self, user_message):
         """Handle symptom-based test recommendations with professional medical guidance"""
         # Use RAG to retrieve relevant tests based on symptoms
-        retrieved_tests = RAGService.retrieve_tests_for_symptoms(user_message)
+        retrieved_tests = list(RAGService.retrieve_tests_for_symptoms(user_message))
         
-        if retrieved_tests.exists():
+        if retrieved_tests:
             response = "🩺 **Suggested Tests Based on Your Symptoms**\n\n"
             response += "Here are relevant tests that may help:\n\n"
             
             for test in retrieved_tests[:5]:
-                labs_offering = Lab.objects.filter(tests=test).distinct()[:2]
+                offered_at = labs_offering(test, 2)
                 response += f"**🧬 {test.name}**\n"
                 if test.description:
                     response += f"   _{test.description}_\n"
                 if test.price:
                     response += f"   💵 **Rs. {test.price}**\n"
-                if labs_offering.exists():
-                    lab_names = ', '.join([lab.name for lab in labs_offering])
+                if offered_at:
+                    lab_names = ', '.join([lab.name for lab in offered_at])
                     response += f"   🏥 **Available at:** {lab_names}\n"
                 response += "\n"
             
@@ -838,83 +867,28 @@ class AIRecommendationService:
     @staticmethod
     def recommend_tests(symptoms_text, user=None):
         """Generate test recommendations based on symptoms"""
-        symptoms_lower = symptoms_text.lower()
-        
-        # Symptom to test mapping
-        recommendations = []
-        
-        # Diabetes related
-        if any(word in symptoms_lower for word in ['diabetes', 'blood sugar', 'glucose', 'thirsty', 'frequent urination']):
-            tests = Test.objects.filter(name__icontains='glucose') | Test.objects.filter(name__icontains='diabetes') | Test.objects.filter(name__icontains='hba1c')
-            recommendations.extend(list(tests))
-        
-        # Heart related
-        if any(word in symptoms_lower for word in ['chest pain', 'heart', 'cardiac', 'shortness of breath']):
-            tests = Test.objects.filter(name__icontains='cardiac') | Test.objects.filter(name__icontains='troponin') | Test.objects.filter(name__icontains='ekg')
-            recommendations.extend(list(tests))
-        
-        # Thyroid related
-        if any(word in symptoms_lower for word in ['thyroid', 'tired', 'fatigue', 'weight gain', 'weight loss']):
-            tests = Test.objects.filter(name__icontains='thyroid') | Test.objects.filter(name__icontains='tsh') | Test.objects.filter(name__icontains='t3') | Test.objects.filter(name__icontains='t4')
-            recommendations.extend(list(tests))
-        
-        # Liver related
-        if any(word in symptoms_lower for word in ['liver', 'jaundice', 'yellow', 'abdominal pain']):
-            tests = Test.objects.filter(name__icontains='liver') | Test.objects.filter(name__icontains='alt') | Test.objects.filter(name__icontains='ast') | Test.objects.filter(name__icontains='bilirubin')
-            recommendations.extend(list(tests))
-        
-        # Kidney related
-        if any(word in symptoms_lower for word in ['kidney', 'urine', 'kidney pain', 'back pain']):
-            tests = Test.objects.filter(name__icontains='kidney') | Test.objects.filter(name__icontains='creatinine') | Test.objects.filter(name__icontains='bun')
-            recommendations.extend(list(tests))
-        
-        # Cholesterol
-        if any(word in symptoms_lower for word in ['cholesterol', 'heart disease', 'high blood pressure']):
-            tests = Test.objects.filter(name__icontains='cholesterol') | Test.objects.filter(name__icontains='lipid')
-            recommendations.extend(list(tests))
-        
-        # Complete Blood Count
-        if any(word in symptoms_lower for word in ['anemia', 'weakness', 'pale', 'blood count']):
-            tests = Test.objects.filter(name__icontains='cbc') | Test.objects.filter(name__icontains='complete blood') | Test.objects.filter(name__icontains='hemoglobin')
-            recommendations.extend(list(tests))
-        
-        # Remove duplicates
-        seen = set()
-        unique_recommendations = []
-        for test in recommendations:
-            if test.id not in seen:
-                seen.add(test.id)
-                unique_recommendations.append(test)
-        
-        # If no specific matches, return popular/common tests
-        if not unique_recommendations:
-            # Return commonly used medical tests
-            popular_test_names = [
-                'BLOOD SUGAR F', 'CHOLESTEROL', 'LIPID PROFILE', 
-                'CREATININE', 'BUN', 'ALBUMIN', 'HB A1C',
-                'BILIRUBIN', 'BLOOD GAS ANALYSIS', 'LFT'
-            ]
-            common_tests = []
-            for name in popular_test_names:
-                test = Test.objects.filter(name__icontains=name).first()
-                if test:
-                    common_tests.append(test)
-            
-            if common_tests:
-                unique_recommendations = common_tests[:10]
-            else:
-                # Last resort: get first 5 tests only if nothing else works
-                fallback_tests = Test.objects.all()[:5]
-                if fallback_tests.exists():
-                    unique_recommendations = list(fallback_tests)
+        # Symptom groups are matched against a per-catalog-version symptom → test index
+        test_ids = recommend_test_ids(symptoms_text)
+        if not test_ids:
+            return None
+
+        # Identical symptoms with identical recommended tests share one recommendation row per user
+        key = symptoms_key(symptoms_text, test_ids)
+        cache_key = recommendation_cache_key(user.pk if user else None, key)
+        recommendation = cache.get(cache_key)
+        if recommendation is not None:
+            return recommendation
         
-        # Save recommendation only if we have tests
-        if unique_recommendations:
+        # The tests are prefetched so the cached copy answers recommended_tests.all() without a query
+        recommendation = AIRecommendation.objects.filter(symptoms_hash=key, user=user).prefetch_related('recommended_tests').first()
+        if recommendation is None:
             recommendation = AIRecommendation.objects.create(
                 symptoms=symptoms_text,
+                symptoms_hash=key,
                 user=user
             )
-            recommendation.recommended_tests.set(unique_recommendations[:10])
-            return recommendation
+            recommendation.recommended_tests.set(test_ids)
+            prefetch_related_objects([recommendation], 'recommended_tests')
         
-        return None
+        cache.set(cache_key, recommendation, RECOMMENDATION_CACHE_TIMEOUT)
+        return recommendation
@@ -1,6 +1,23 @@
+import logging
+
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+logger = logging.getLogger(__name__)
 
 
 class LabSuggestionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'lab_suggestion'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .email_utils import notification_renderer
+        from .search_service import install_fts_tables
+        # Compile the booking email templates now rather than in the first request that sends one. A broken
+        # template must not stop the project (or migrate) from starting; it fails again, loudly, when rendered
+        try:
+            notification_renderer.precompile()
+        except Exception:
+            logger.exception('Could not precompile the booking email templates')
+        post_migrate.connect(install_fts_tables, sender=self)
@@ -0,0 +1,697 @@
+"""
+Benchmarks for LabEase
+Run with: python manage.py benchmark <suite> [--size N]
+"""
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+SUITES = {}
+
+WORDS = [
+    'blood', 'sugar', 'glucose', 'fasting', 'lipid', 'profile', 'cholesterol', 'thyroid', 'tsh', 't3', 't4',
+    'liver', 'function', 'kidney', 'creatinine', 'urea', 'urine', 'culture', 'serum', 'vitamin', 'b12', 'd3',
+    'complete', 'count', 'hemoglobin', 'a1c', 'iron', 'ferritin', 'calcium', 'sodium', 'potassium', 'troponin',
+    'cardiac', 'panel', 'antibody', 'antigen', 'hepatitis', 'dengue', 'malaria', 'typhoid', 'stool', 'routine',
+    'electrolyte', 'bilirubin', 'albumin', 'protein', 'insulin', 'cortisol', 'prolactin', 'testosterone',
+]
+
+
+def suite(name, default_size):
+    def register(function):
+        SUITES[name] = (function, default_size)
+        return function
+    return register
+
+
+def per_call(function, repeat):
+    """Seconds per call of `function` averaged over `repeat` calls"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def synthetic_vocabulary(size=3000, seed=3):
+    """Common lab words followed by generated ones, most frequent first"""
+    rng = random.Random(seed)
+    syllables = ['ka', 'lo', 'mi', 'ne', 'ru', 'so', 'ti', 'va', 'ze', 'pho', 'gly', 'tro', 'cyt', 'ase', 'ine', 'ol']
+    vocabulary = list(WORDS)
+    seen = set(vocabulary)
+    while len(vocabulary) < size:
+        word = ''.join(rng.choices(syllables, k=rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            vocabulary.append(word)
+    return vocabulary
+
+
+def synthetic_catalog(size, seed=7):
+    """(id, name, description, price) rows resembling an imported hospital price list"""
+    rng = random.Random(seed)
+    vocabulary = synthetic_vocabulary()
+    # Zipf-like word frequencies: a few words (blood, serum...) appear everywhere
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    rows = []
+    for test_id in range(1, size + 1):
+        name = ' '.join(rng.choices(vocabulary, weights, k=rng.randint(2, 4))).upper()
+        description = ' '.join(rng.choices(vocabulary, weights, k=rng.randint(0, 12)))
+        rows.append((test_id, name, description, rng.choice([None, 100 + rng.randint(0, 5000)])))
+    return rows
+
+
+@suite('retrieval', 50000)
+def bench_retrieval(out, size):
+    """BM25 keyword index vs. a full scan counting matched words (the old icontains behaviour)"""
+    from .keyword_index import KeywordIndex, tokenize
+
+    rows = synthetic_catalog(size)
+    start = time.perf_counter()
+    index = KeywordIndex(rows)
+    build_seconds = time.perf_counter() - start
+    tracemalloc.start()
+    KeywordIndex(rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    out.write(f"catalog: {size} tests, {len(index.tokens)} distinct words")
+    out.write(f"index build: {build_seconds:.2f}s, peak {peak / 2**20:.1f} MiB while building")
+
+    # Each query is two words from a target test's name; the target should rank near the top
+    rng = random.Random(11)
+    queries = []
+    for test_id, name, _, _ in rng.sample(rows, 200):
+        words = sorted(set(tokenize(name)))
+        queries.append((test_id, rng.sample(words, min(2, len(words)))))
+
+    def scan(terms, limit=10):
+        scored = []
+        for test_id, name, description, _ in rows:
+            text = f'{name} {description}'.lower()
+            score = sum(1 for term in terms if term in text)
+            if score:
+                scored.append((-score, test_id))
+        scored.sort()
+        return [test_id for _, test_id in scored[:limit]]
+
+    for label, retrieve, sample in (('bm25 index', index.rank, queries), ('full scan', scan, queries[:20])):
+        reciprocal_ranks = []
+        start = time.perf_counter()
+        for target, terms in sample:
+            ranked = retrieve(terms, 10)
+            reciprocal_ranks.append(1 / (ranked.index(target) + 1) if target in ranked else 0)
+        elapsed = (time.perf_counter() - start) / len(sample)
+        hits = sum(1 for rank in reciprocal_ranks if rank)
+        out.write(
+            f"{label:>11}: {elapsed * 1000:8.3f} ms/query, "
+            f"recall@10 {hits / len(sample):.2f}, MRR {sum(reciprocal_ranks) / len(sample):.2f}"
+        )
+
+
+CHAT_MESSAGES = [
+    'Hello!', 'What is the price of CBC?', 'How much does a thyroid test cost?', 'I want to book a lipid profile',
+    'I feel tired and weak all the time', 'Which labs are near me in Kathmandu?', 'What tests do you have?',
+    'My name is Ram Sharma, email: ram@example.com, phone 9841000000', 'Can you recommend a test for fever?',
+    'Tomorrow at 10 am please', 'What can you do?', 'Is the liver function test available at City Lab?',
+]
+
+
+@suite('intents', 200000)
+def bench_intents(out, size):
+    """One compiled intent regex vs. the keyword scans chatbot_api and generate_response used to run"""
+    from .intents import detect_intents
+
+    # The lists the chatbot scanned before, in the order generate_response tried them
+    response_keywords = [
+        ['book', 'booking', 'want to book', 'can i book', 'i need to book', 'book test', 'book a test', 'schedule', 'appointment'],
+        ['hello', 'hi', 'hey', 'greetings'],
+        ['price', 'cost', 'expensive', 'cheap', 'affordable', 'how much'],
+        ['symptom', 'symptoms', 'feel', 'feeling', 'pain', 'recommend', 'suggest', 'should i take', 'what test'],
+        ['test', 'tests', 'lab test', 'what test', 'which test', 'do you have'],
+        ['lab', 'labs', 'laboratory', 'where', 'location', 'find lab', 'near me'],
+        ['help', 'how', 'what can', 'what do', 'guide'],
+    ]
+    booking_keywords = ['book', 'reserve', 'schedule', 'appointment']
+    detail_keywords = ['my name is', 'i am', 'email:', 'email is', 'book for me', '@']
+
+    def keyword_scans(message):
+        lowered = message.lower()
+        any(word in lowered for word in booking_keywords)
+        any(word in lowered for word in detail_keywords)
+        for keywords in response_keywords:
+            if any(word in lowered for word in keywords):
+                break
+
+    messages = [CHAT_MESSAGES[position % len(CHAT_MESSAGES)] for position in range(size)]
+    for label, classify in (('keyword scans', keyword_scans), ('intent regex', detect_intents)):
+        start = time.perf_counter()
+        for message in messages:
+            classify(message)
+        elapsed = time.perf_counter() - start
+        out.write(f"{label:>13}: {size / elapsed:12,.0f} messages/s")
+
+
+@suite('test_detection', 50000)
+def bench_test_detection(out, size):
+    """Chatbot test-name detection: name index lookups vs. looping over every test name"""
+    from .search_index import TestNameIndex
+
+    rows = synthetic_catalog(size)
+    start = time.perf_counter()
+    index = TestNameIndex({'id': test_id, 'name': name, 'price': price, 'description': ''} for test_id, name, _, price in rows)
+    out.write(f"catalog: {size} tests, index build {time.perf_counter() - start:.2f}s")
+
+    rng = random.Random(5)
+    messages = [f"I want to book {name.lower()} tomorrow morning" for _, name, _, _ in rng.sample(rows, 100)]
+    messages += ['What is the price of a thyroid test?', 'Hello there', 'Find labs near me']
+    names = [name for _, name, _, _ in rows]
+
+    def scan(message):
+        message = message.lower()
+        for name in names:
+            if name.lower() in message:
+                return name
+        return None
+
+    for label, detect, sample in (('name index', index.find_in, messages), ('full scan', scan, messages[::10])):
+        elapsed = per_call(lambda: [detect(message) for message in sample], 3) / len(sample)
+        out.write(f"{label:>10}: {elapsed * 1000:8.3f} ms/message")
+
+
+@contextmanager
+def throwaway_database(test_count, file_backed=False):
+    """A migrated test database seeded with `test_count` synthetic tests and a few labs offering them"""
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    from .models import Lab, LabTestDetail, Test
+
+    setup_test_environment()
+    database_name = connection.settings_dict['NAME']
+    test_settings = connection.settings_dict['TEST']
+    directory = tempfile.TemporaryDirectory()
+    if file_backed:
+        # In-memory SQLite serializes every connection anyway; a file shows real writer-lock contention
+        connection.settings_dict['TEST'] = {**test_settings, 'NAME': os.path.join(directory.name, 'benchmark.sqlite3')}
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        Test.objects.bulk_create(
+            Test(name=name[:200], description=description, price=price)
+            for _, name, description, price in synthetic_catalog(test_count)
+        )
+        test_ids = list(Test.objects.values_list('id', flat=True))
+        for number in range(5):
+            user = User.objects.create(username=f'bench_lab_{number}')
+            lab = Lab.objects.create(
+                user=user, name=f'Bench Lab {number}', address='Main Road', city='Kathmandu', state='Bagmati',
+                zip_code='44600', phone_number='01-4000000',
+            )
+            LabTestDetail.objects.bulk_create(LabTestDetail(lab=lab, test_id=test_id) for test_id in test_ids[number::3])
+        yield
+    finally:
+        connection.creation.destroy_test_db(database_name, verbosity=0)
+        connection.settings_dict['TEST'] = test_settings
+        directory.cleanup()
+        teardown_test_environment()
+
+
+def chat_payload(message, session):
+    return {'message': message, 'session_id': f'bench-{session}'}
+
+
+@suite('chatbot_ttfb', 2000)
+def bench_chatbot_ttfb(out, size):
+    """Time to first byte of the JSON chatbot endpoint vs. the streaming one, on a throwaway database"""
+    from asgiref.sync import async_to_sync
+    from django.test import AsyncClient, Client
+    from django.urls import reverse
+
+    def sync_timings():
+        client = Client()
+        timings = []
+        for number, message in enumerate(CHAT_MESSAGES):
+            start = time.perf_counter()
+            client.post(reverse('chatbot_api'), chat_payload(message, number), content_type='application/json')
+            elapsed = time.perf_counter() - start
+            timings.append((elapsed, elapsed))
+        return timings
+
+    async def stream_timings():
+        client = AsyncClient()
+        timings = []
+        for number, message in enumerate(CHAT_MESSAGES):
+            start = time.perf_counter()
+            response = await client.post(
+                reverse('chatbot_stream_api'), chat_payload(message, number), content_type='application/json'
+            )
+            chunks = aiter(response.streaming_content)
+            await anext(chunks)
+            first_byte = time.perf_counter() - start
+            async for _ in chunks:
+                pass
+            timings.append((first_byte, time.perf_counter() - start))
+        return timings
+
+    with throwaway_database(size):
+        # Warm the catalog indexes so both endpoints are measured in steady state
+        sync_timings()
+        for label, timings in (('json', sync_timings()), ('stream', async_to_sync(stream_timings)())):
+            first_bytes, totals = zip(*timings)
+            out.write(
+                f"{label:>6}: median time to first byte {statistics.median(first_bytes) * 1000:7.2f} ms, "
+                f"median full reply {statistics.median(totals) * 1000:7.2f} ms"
+            )
+
+
+@suite('chat_log', 400)
+def bench_chat_log(out, size):
+    """Chat throughput from 8 concurrent clients, saving each message inline vs. write-behind batches"""
+    from django.db import connection
+    from django.test import Client, override_settings
+    from django.urls import reverse
+
+    from .chat_log import chat_log, record_chat_message
+    from .models import ChatMessage
+
+    clients = 8
+
+    def chatbot_session(number):
+        client = Client()
+        for turn in range(size // clients):
+            message = CHAT_MESSAGES[(number + turn) % len(CHAT_MESSAGES)]
+            client.post(reverse('chatbot_api'), chat_payload(message, number), content_type='application/json')
+
+    def log_session(number):
+        for turn in range(size * 10 // clients):
+            record_chat_message(f'bench-{number}', CHAT_MESSAGES[turn % len(CHAT_MESSAGES)], 'answer')
+
+    def run(session):
+        try:
+            session()
+        finally:
+            connection.close()
+
+    with throwaway_database(2000, file_backed=True):
+        with override_settings(CHAT_LOG_WRITE_BEHIND=False):
+            Client().post(reverse('chatbot_api'), chat_payload('Hello', 'warm'), content_type='application/json')
+        for workload, session in (('chatbot_api', chatbot_session), ('logging only', log_session)):
+            for label, write_behind in (('inline', False), ('write-behind', True)):
+                ChatMessage.objects.all().delete()
+                with override_settings(CHAT_LOG_WRITE_BEHIND=write_behind):
+                    start = time.perf_counter()
+                    with ThreadPoolExecutor(clients) as pool:
+                        list(pool.map(run, [lambda number=number: session(number) for number in range(clients)]))
+                    chat_log.flush()
+                    elapsed = time.perf_counter() - start
+                saved = ChatMessage.objects.count()
+                out.write(f"{workload:>12}, {label:>12}: {saved / elapsed:8.0f} messages/s ({saved} saved)")
+        chat_log.close()
+
+
+@suite('chatbot_cache', 2000)
+def bench_chatbot_cache(out, size):
+    """generate_response on repeated FAQ-style questions with and without the response cache"""
+    from .ai_service import AIChatbotService
+    from .intents import detect_intents
+    from .response_cache import ResponseCache
+
+    questions = [message for message in CHAT_MESSAGES if detect_intents(message).primary != 'booking']
+    with throwaway_database(size):
+        for label, max_size in (('uncached', 0), ('cached', 512)):
+            chatbot = AIChatbotService()
+            chatbot.responses = ResponseCache(max_size)
+            chatbot.generate_response('hello')
+            elapsed = per_call(lambda: [chatbot.generate_response(question) for question in questions], 20)
+            out.write(f"{label:>8}: {elapsed / len(questions) * 1000:8.3f} ms/answer  {chatbot.responses.stats()}")
+
+
+SYMPTOM_DESCRIPTIONS = [
+    'I feel tired all the time and have gained weight', 'Always thirsty with frequent urination',
+    'Chest pain and shortness of breath when climbing stairs', 'My eyes look yellow and I have abdominal pain',
+    'Lower back pain and dark urine', 'Family history of heart disease and high blood pressure',
+    'Feeling weak and pale lately', 'Headache since yesterday', 'Annual health checkup',
+    'Diabetic, need to monitor blood sugar', 'Thyroid problems run in my family', 'Kidney stones last year',
+]
+
+
+@suite('recommendations', 20000)
+def bench_recommendations(out, size):
+    """Symptom → test recommendations: precomputed index vs. the icontains queries per symptom group"""
+    from .models import Test
+    from .recommendations import POPULAR_TEST_NAMES, SYMPTOM_GROUPS, recommend_test_ids, symptom_index
+
+    def icontains_queries(text):
+        text = text.lower()
+        tests = []
+        for symptoms, words in SYMPTOM_GROUPS.values():
+            if any(symptom in text for symptom in symptoms):
+                matches = Test.objects.none()
+                for word in words:
+                    matches = matches | Test.objects.filter(name__icontains=word)
+                tests.extend(matches)
+        if not tests:
+            for name in POPULAR_TEST_NAMES:
+                test = Test.objects.filter(name__icontains=name).first()
+                if test:
+                    tests.append(test)
+        return tests[:10]
+
+    def index_lookup(text):
+        return list(Test.objects.filter(id__in=recommend_test_ids(text)))
+
+    with throwaway_database(size):
+        start = time.perf_counter()
+        symptom_index.get()
+        out.write(f"catalog: {size} tests, index build {time.perf_counter() - start:.2f}s")
+        for label, recommend in (('icontains queries', icontains_queries), ('symptom index', index_lookup)):
+            elapsed = per_call(lambda: [recommend(text) for text in SYMPTOM_DESCRIPTIONS], 3)
+            out.write(f"{label:>17}: {elapsed / len(SYMPTOM_DESCRIPTIONS) * 1000:8.3f} ms/description")
+
+
+@suite('booking_slots', 2000)
+def bench_booking_slots(out, size):
+    """Booking attempts/s from 8 concurrent clients racing for a few slots, checking none is overfilled"""
+    import datetime
+
+    from django.db import connection
+    from django.utils import timezone
+
+    from .models import BookingSlot, LabTestDetail, TestBooking
+    from .slots import SlotFull, save_booking
+
+    clients = 8
+    hours = 10
+    with throwaway_database(200, file_backed=True):
+        offering = LabTestDetail.objects.select_related('lab', 'test').first()
+        first_hour = timezone.make_aware(datetime.datetime(2030, 1, 1, 8))
+        for capacity in (size // hours // 4, size // hours):
+            TestBooking.objects.all().delete()
+            BookingSlot.objects.all().delete()
+            LabTestDetail.objects.filter(pk=offering.pk).update(slots_per_hour=capacity)
+
+            def book(number):
+                outcomes = {'booked': 0, 'full': 0}
+                try:
+                    for attempt in range(size // clients):
+                        booking = TestBooking(
+                            name=f'Patient {number}', email='patient@example.com', lab=offering.lab, test=offering.test,
+                            booking_date=first_hour + datetime.timedelta(hours=attempt % hours, minutes=number),
+                        )
+                        try:
+                            save_booking(booking)
+                            outcomes['booked'] += 1
+                        except SlotFull:
+                            outcomes['full'] += 1
+                finally:
+                    connection.close()
+                return outcomes
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(clients) as pool:
+                results = list(pool.map(book, range(clients)))
+            elapsed = time.perf_counter() - start
+            booked = sum(result['booked'] for result in results)
+            attempts = booked + sum(result['full'] for result in results)
+            fullest = max(BookingSlot.objects.values_list('booked', flat=True))
+            out.write(
+                f"capacity {capacity:>4}/hour: {attempts / elapsed:8.0f} attempts/s, {booked} booked, "
+                f"fullest slot {fullest}, {TestBooking.objects.count()} rows"
+            )
+
+
+@suite('booking_ids', 20000)
+def bench_booking_ids(out, size):
+    """Bulk booking creation for one lab and test with the old 3-character random suffix vs. counter-numbered codes"""
+    import datetime
+    import string
+
+    from django.db import IntegrityError, transaction
+    from django.utils import timezone
+
+    from .models import LabTestDetail, TestBooking
+
+    def random_suffix_id(booking):
+        suffix = ''.join(random.choices(string.ascii_uppercase + string.digits, k=3))
+        return f"LAB{booking.lab.id}-TST{booking.test.id}-{suffix}"
+
+    with throwaway_database(200):
+        offering = LabTestDetail.objects.select_related('lab', 'test').first()
+        booking_date = timezone.make_aware(datetime.datetime(2030, 1, 1, 9))
+        for label, make_id in (('random suffix', random_suffix_id), ('counter', TestBooking.generate_booking_id)):
+            TestBooking.objects.all().delete()
+            bookings = [
+                TestBooking(name='Patient', email='patient@example.com', lab=offering.lab, test=offering.test, booking_date=booking_date)
+                for _ in range(size)
+            ]
+            start = time.perf_counter()
+            for booking in bookings:
+                booking.booking_id = make_id(booking)
+            generated = time.perf_counter() - start
+            repeats = size - len({booking.booking_id for booking in bookings})
+            try:
+                with transaction.atomic():
+                    TestBooking.objects.bulk_create(bookings, batch_size=500)
+                outcome = f"{TestBooking.objects.count()} saved"
+            except IntegrityError:
+                outcome = 'bulk_create failed on a duplicate booking_id'
+            elapsed = time.perf_counter() - start
+            out.write(
+                f"{label:>13}: {size / generated:10.0f} ids/s, {size / elapsed:8.0f} bookings/s, "
+                f"{repeats} repeated ids, {outcome}  e.g. {bookings[-1].booking_id}"
+            )
+
+
+@contextmanager
+def local_smtp_server(handshake_delay=0.0):
+    """A minimal SMTP server on localhost that accepts every message; `handshake_delay` stands in for TLS setup"""
+    import socketserver
+    import threading
+
+    stats = {'connections': 0, 'messages': 0}
+
+    class Handler(socketserver.StreamRequestHandler):
+        def reply(self, line):
+            self.wfile.write(line.encode() + b'\r\n')
+
+        def handle(self):
+            stats['connections'] += 1
+            time.sleep(handshake_delay)
+            self.reply('220 localhost ready')
+            for line in self.rfile:
+                command = line.decode(errors='replace').strip().upper()
+                if command.startswith('EHLO'):
+                    # One write, so delayed ACKs don't add a stall to every connection
+                    self.reply('250-localhost\r\n250 8BITMIME')
+                elif command == 'DATA':
+                    self.reply('354 End data with <CR><LF>.<CR><LF>')
+                    for data_line in self.rfile:
+                        if data_line in (b'.\r\n', b'.\n'):
+                            break
+                    stats['messages'] += 1
+                    self.reply('250 OK')
+                elif command == 'QUIT':
+                    self.reply('221 Bye')
+                    return
+                else:
+                    self.reply('250 OK')
+
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server.server_address[1], stats
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@suite('email_outbox', 1000)
+def bench_email_outbox(out, size):
+    """Outbox delivery to a local SMTP server, one connection per email vs. one pooled connection"""
+    from django.test import override_settings
+
+    from .models import EmailOutbox
+    from .outbox import PooledMailer, as_message, claim_due_emails, deliver_due_emails, queue_email, record_sent
+
+    def one_connection_per_email():
+        emails = claim_due_emails(size)
+        for email in emails:
+            as_message(email).send()
+        record_sent(emails)
+
+    def pooled():
+        mailer = PooledMailer()
+        while deliver_due_emails(mailer=mailer) != (0, 0):
+            pass
+        mailer.close()
+
+    with throwaway_database(10):
+        # 0 ms is a loopback server; 30 ms is roughly a TLS handshake with a remote mail provider
+        for handshake_delay in (0.0, 0.03):
+            with local_smtp_server(handshake_delay) as (port, stats):
+                smtp = dict(
+                    EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend', EMAIL_HOST='127.0.0.1', EMAIL_PORT=port,
+                    EMAIL_USE_SSL=False, EMAIL_USE_TLS=False, EMAIL_OUTBOX_BATCH_SIZE=100,
+                )
+                for label, deliver in (('per email', one_connection_per_email), ('pooled', pooled)):
+                    EmailOutbox.objects.all().delete()
+                    for number in range(size):
+                        queue_email('Booking Updated - Lipid Profile', 'Your test is done.', f'patient{number}@example.com', '<p>Your test is done.</p>')
+                    stats.update(connections=0, messages=0)
+                    with override_settings(**smtp):
+                        start = time.perf_counter()
+                        deliver()
+                        elapsed = time.perf_counter() - start
+                    out.write(
+                        f"handshake {handshake_delay * 1000:3.0f} ms, {label:>9}: {stats['messages'] / elapsed:8.0f} emails/s, "
+                        f"{stats['connections']} connection(s) for {stats['messages']} emails"
+                    )
+
+
+@suite('email_render', 10000)
+def bench_email_render(out, size):
+    """Booking email renders/s: render_to_string per part with a fresh context vs. the precompiled renderer"""
+    import datetime
+
+    from django.template.loader import render_to_string
+    from django.utils import timezone
+
+    from .email_utils import BOOKING_EMAILS, NotificationRenderer
+    from .models import LabTestDetail, TestBooking
+
+    def separately(kind, booking):
+        subject, name, action = BOOKING_EMAILS[kind]
+        context = {
+            'booking': booking, 'test': booking.test, 'lab': booking.lab, 'user_name': booking.name,
+            'booking_id': booking.booking_id, 'action': action,
+        }
+        html = render_to_string(f'{name}.html', context)
+        text = render_to_string(f'{name}.txt', context)
+        return f'{subject} - {booking.test.name} at {booking.lab.name}', text, html
+
+    with throwaway_database(200):
+        offering = LabTestDetail.objects.select_related('lab', 'test').first()
+        booking_date = timezone.make_aware(datetime.datetime(2030, 1, 1, 9))
+        bookings = [
+            TestBooking(booking_id=f'BENCH-{number}', name=f'Patient {number}', email='patient@example.com',
+                        lab=offering.lab, test=offering.test, booking_date=booking_date, notes='Fasting')
+            for number in range(size)
+        ]
+        renderer = NotificationRenderer()
+        renderer.precompile()
+        for label, render in (('render_to_string', separately), ('renderer', renderer.render)):
+            for kind in BOOKING_EMAILS:
+                start = time.perf_counter()
+                for booking in bookings:
+                    render(kind, booking)
+                elapsed = time.perf_counter() - start
+                out.write(f"{label:>16}, {kind:>12}: {size / elapsed:8.0f} emails/s")
+
+
+@suite('reminders', 1000000)
+def bench_reminders(out, size):
+    """send_booking_reminders on a table of `size` bookings: a run with reminders due, then the every-minute no-op"""
+    import datetime
+
+    from django.db import connection
+    from django.utils import timezone
+
+    from .models import EmailOutbox, Lab, TestBooking
+    from .reminders import queue_booking_reminders
+
+    with throwaway_database(200):
+        lab_ids = list(Lab.objects.values_list('id', flat=True))
+        test_id = TestBooking._meta.get_field('test').related_model.objects.values_list('id', flat=True).first()
+        # Two years of bookings, one every ~minute, a quarter of them still 'booked'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH RECURSIVE seq(n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < %s)
+                INSERT INTO {TestBooking._meta.db_table}
+                    (booking_id, name, test_id, lab_id, email, booking_date, booked_at, status)
+                SELECT 'BENCH-' || n, 'Patient', %s, %s + n %% %s, 'patient@example.com',
+                       datetime('2030-01-01', '+' || (n * 1051200 / %s) || ' minutes'), datetime('now'),
+                       CASE n %% 4 WHEN 0 THEN 'booked' WHEN 1 THEN 'test_done' WHEN 2 THEN 'not_arrived' ELSE 'cancelled' END
+                FROM seq
+                """,
+                [size - 1, test_id, lab_ids[0], len(lab_ids), size],
+            )
+            cursor.execute('ANALYZE')
+        now = timezone.make_aware(datetime.datetime(2031, 1, 1))
+        for label, hours in (('reminders due', 24 * 7 * 4), ('nothing due', 24 * 7 * 4)):
+            start = time.perf_counter()
+            queued = queue_booking_reminders(hours=hours, now=now)
+            elapsed = time.perf_counter() - start
+            out.write(f"{label:>14}: {elapsed * 1000:9.1f} ms, {queued} reminders queued ({EmailOutbox.objects.count()} in outbox)")
+
+
+def synthetic_price_list(path, rows, labs=20):
+    """Write an admin price-list workbook of `rows` rows with openpyxl's streaming writer"""
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append([
+        'Lab Name', 'Address', 'City', 'State', 'Zip Code', 'Phone Number', 'Contact Email', 'Contact Phone',
+        'Test Name', 'Test Description', 'Test Price',
+    ])
+    catalog = synthetic_catalog(max(rows // labs, 1))
+    for number in range(rows):
+        _, name, description, price = catalog[number // labs % len(catalog)]
+        lab = number % labs
+        sheet.append([
+            f'Bench Hospital {lab}', 'Main Road', 'Kathmandu', 'Bagmati', '44600', '01-4000000',
+            f'lab{lab}@example.com', '01-4000001', name[:100], description, price,
+        ])
+    workbook.save(path)
+
+
+@suite('excel_import', 200000)
+def bench_excel_import(out, size):
+    """Reading a `size`-row price list in full mode vs. read-only streaming, then the streaming import end to end"""
+    import openpyxl
+
+    from .excel_import import import_price_list
+    from .models import LabTestDetail
+
+    def measure(function):
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return result, elapsed, peak
+
+    def full_mode(path):
+        workbook = openpyxl.load_workbook(path)
+        sheet = workbook.active
+        return sum(1 for row_index in range(2, sheet.max_row + 1) if sheet[row_index][0].value)
+
+    def read_only(path):
+        workbook = openpyxl.load_workbook(path, read_only=True)
+        try:
+            return sum(1 for row in workbook.active.iter_rows(min_row=2, values_only=True) if row[0])
+        finally:
+            workbook.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'prices.xlsx')
+        synthetic_price_list(path, size)
+        out.write(f"workbook: {size} rows, {os.path.getsize(path) / 1e6:.1f} MB on disk")
+        for label, read in (('full mode', full_mode), ('read-only', read_only)):
+            rows, elapsed, peak = measure(lambda: read(path))
+            out.write(f"{label:>10} read: {rows / elapsed:8.0f} rows/s, peak {peak / 1e6:7.1f} MB")
+        with throwaway_database(0):
+            summary, elapsed, peak = measure(lambda: import_price_list(path))
+            out.write(
+                f"    import: {summary.rows / elapsed:8.0f} rows/s, peak {peak / 1e6:7.1f} MB, "
+                f"{summary.tests_created} tests created, {LabTestDetail.objects.count()} lab-test links"
+            )
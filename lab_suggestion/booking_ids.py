@@ -0,0 +1,25 @@
+"""
+Booking ID codes for LabEase
+Bookings for one test at one lab are numbered 1, 2, 3... by that pair's BookingCounter row. The code is the
+number in base 36, padded so codes stay short and sort in booking order within their LAB/TST prefix
+"""
+import string
+
+# 1.6 million bookings per lab and test before codes grow a character. Never shorter than the 3-character
+# random suffixes issued before the counter, so new codes cannot collide with those
+CODE_MIN_LENGTH = 4
+CODE_ALPHABET = string.digits + string.ascii_uppercase
+
+
+def to_base36(number):
+    digits = []
+    while True:
+        number, remainder = divmod(number, 36)
+        digits.append(CODE_ALPHABET[remainder])
+        if not number:
+            return ''.join(reversed(digits))
+
+
+def booking_code(number):
+    """The code for a pair's `number`th booking"""
+    return to_base36(number).rjust(CODE_MIN_LENGTH, '0')
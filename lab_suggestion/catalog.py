@@ -0,0 +1,74 @@
+"""
+Catalog versioning for LabEase
+Indexes and cached snapshots of the test catalog are rebuilt lazily whenever the catalog version changes.
+The version lives in the database so writes from any worker or management command reach every process;
+each process re-reads it at most every CATALOG_VERSION_TIMEOUT seconds.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = 'catalog_version'
+CATALOG_VERSION_TIMEOUT = 5  # Seconds another process's catalog write can go unnoticed
+POPULAR_TESTS_TIMEOUT = 900  # Rebuild at least every 15 minutes even without catalog writes
+
+
+def get_catalog_version():
+    """Return the current catalog version, reading the shared row when this process's copy has expired"""
+    from .models import CatalogVersion
+
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = CatalogVersion.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+        cache.set(CATALOG_VERSION_KEY, version, CATALOG_VERSION_TIMEOUT)
+    return version
+
+
+def bump_catalog_version():
+    """Mark every catalog index as stale, in this process at once and in the others within CATALOG_VERSION_TIMEOUT"""
+    from .models import CatalogVersion
+
+    # A fresh value rather than an increment, so a bump rolled back with its transaction is never reissued
+    version = time.time_ns()
+    if not CatalogVersion.objects.filter(pk=1).update(version=version):
+        CatalogVersion.objects.get_or_create(pk=1, defaults={'version': version})
+    cache.delete(CATALOG_VERSION_KEY)
+
+
+class CatalogIndex:
+    """Holds a value built from the catalog and rebuilds it when the catalog version changes"""
+
+    def __init__(self, builder):
+        self._builder = builder
+        self._lock = threading.Lock()
+        self._version = None
+        self._value = None
+
+    def get(self):
+        version = get_catalog_version()
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._value = self._builder()
+                    self._version = version
+        return self._value
+
+    def invalidate(self):
+        self._version = None
+
+
+def get_popular_tests():
+    """Return the homepage popular-tests snapshot for the current catalog version"""
+    from .models import Test
+
+    key = f'popular_tests_{get_catalog_version()}'
+    popular_tests = cache.get(key)
+    if popular_tests is None:
+        # Prioritize tests with prices, cheapest first; fall back to any valid tests
+        fields = ('id', 'name', 'price')
+        popular_tests = list(Test.objects.filter(is_junk=False, price__isnull=False).order_by('price').values(*fields)[:8])
+        if len(popular_tests) < 4:
+            popular_tests = list(Test.objects.filter(is_junk=False).values(*fields)[:8])
+        cache.set(key, popular_tests, POPULAR_TESTS_TIMEOUT)
+    return popular_tests
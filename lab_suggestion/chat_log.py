@@ -0,0 +1,139 @@
+"""
+Chatbot conversation log for LabEase
+Buffers ChatMessage rows in memory and saves them in batches, so a chat reply never waits on the SQLite writer lock
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+MAX_SAVE_ATTEMPTS = 5  # Consecutive failed saves before the queued messages are dropped
+MAX_RETRY_DELAY = 5.0  # Seconds; cap on the backoff between failed saves
+
+
+def write_behind_enabled():
+    return getattr(settings, 'CHAT_LOG_WRITE_BEHIND', True)
+
+
+class ChatLogWriter:
+    """Queues chat messages and saves them with bulk_create every `batch_size` messages or `flush_interval` seconds
+
+    A batch that fails to save (typically SQLite's "database is locked") goes back to the front of the queue and
+    is retried with exponential backoff; it is only dropped after `max_attempts` consecutive failures.
+    """
+
+    def __init__(self, batch_size, flush_interval, max_attempts=MAX_SAVE_ATTEMPTS):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._pending = []
+        self._failures = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._closed = False
+
+    def add(self, message):
+        """Queue an unsaved ChatMessage; the background thread saves it (or it is saved now once the writer is closed)"""
+        with self._lock:
+            if not self._closed:
+                self._pending.append(message)
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='chat-log-writer', daemon=True)
+                    self._thread.start()
+                if len(self._pending) >= self.batch_size:
+                    self._wakeup.set()
+                return
+        message.save()
+
+    def flush(self):
+        """Try once to save every queued message, returning how many were saved"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                ChatMessage.objects.bulk_create(batch, batch_size=self.batch_size)
+            except Exception:
+                self._failures += 1
+                if self._failures >= self.max_attempts:
+                    logger.exception('Dropping %d chat messages after %d failed saves', len(batch), self._failures)
+                    self._failures = 0
+                else:
+                    logger.warning('Could not save %d chat messages, will retry', len(batch), exc_info=True)
+                    with self._lock:
+                        self._pending[:0] = batch
+                return 0
+            self._failures = 0
+            return len(batch)
+
+    def retry_delay(self):
+        """Seconds to wait before the next flush: the interval, doubled for each consecutive failure"""
+        return min(self.flush_interval * 2 ** self._failures, MAX_RETRY_DELAY)
+
+    def close(self):
+        """Stop the background thread and save what is still queued, retrying failed saves"""
+        with self._lock:
+            self._closed = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        while self._failures:
+            time.sleep(self.retry_delay())
+            self.flush()
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.retry_delay())
+            self._wakeup.clear()
+            self.flush()
+            # This thread outlives requests, so it has to recycle its own connection
+            close_old_connections()
+
+
+chat_log = ChatLogWriter(
+    batch_size=getattr(settings, 'CHAT_LOG_BATCH_SIZE', 50),
+    flush_interval=getattr(settings, 'CHAT_LOG_FLUSH_INTERVAL_MS', 250) / 1000,
+)
+atexit.register(chat_log.close)
+
+
+def _chat_message(session_id, user_message, bot_response, user):
+    return ChatMessage(
+        session_id=session_id,
+        user_message=user_message,
+        bot_response=bot_response,
+        user=user if user is not None and user.is_authenticated else None,
+        created_at=timezone.now(),
+    )
+
+
+def record_chat_message(session_id, user_message, bot_response, user=None):
+    """Log one chatbot turn, returning its ChatMessage (not yet saved when write-behind is on)"""
+    message = _chat_message(session_id, user_message, bot_response, user)
+    if write_behind_enabled():
+        chat_log.add(message)
+    else:
+        message.save()
+    return message
+
+
+async def arecord_chat_message(session_id, user_message, bot_response, user=None):
+    """Async version of record_chat_message"""
+    message = _chat_message(session_id, user_message, bot_response, user)
+    if write_behind_enabled():
+        chat_log.add(message)
+    else:
+        await message.asave()
+    return message
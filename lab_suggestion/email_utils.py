@@ -1,105 +1,124 @@
 """
 Email sending utilities for LabEase
+Emails are rendered here and queued in the EmailOutbox; the send_queued_emails worker delivers them
 """
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
-from django.conf import settings
+from collections import namedtuple
 
+from django.db import transaction
+from django.dispatch import receiver
+from django.template import Context
+from django.template.loader import get_template
+from django.utils.autoreload import file_changed
 
-def send_booking_confirmation_email(booking):
-    """
-    Send booking confirmation email to the user
-    """
-    try:
-        # Prepare email context
-        context = {
+from .outbox import queue_email
+
+# Kind → (subject prefix, template name without extension, action shown in the email)
+BOOKING_EMAILS = {
+    'confirmation': ('Booking Confirmation', 'emails/booking_confirmation_email', None),
+    'update': ('Booking Updated', 'emails/booking_notification_email', 'updated'),
+    'cancellation': ('Booking Cancelled', 'emails/booking_cancellation_email', 'cancelled'),
+    'reminder': ('Booking Reminder', 'emails/booking_reminder_email', None),
+}
+
+RenderedEmail = namedtuple('RenderedEmail', ['subject', 'text', 'html'])
+
+
+class NotificationRenderer:
+    """Renders booking emails from templates compiled once per process, both parts from one context"""
+
+    def __init__(self, emails=BOOKING_EMAILS):
+        self.emails = emails
+        self._templates = {}
+
+    def _compiled(self, kind):
+        templates = self._templates.get(kind)
+        if templates is None:
+            name = self.emails[kind][1]
+            # get_template() goes through the cached loader; keeping the compiled templates here also skips its lookup
+            templates = (get_template(f'{name}.txt').template, get_template(f'{name}.html').template)
+            self._templates[kind] = templates
+        return templates
+
+    def precompile(self):
+        """Compile every template now instead of on first render; called at startup"""
+        for kind in self.emails:
+            self._compiled(kind)
+
+    def clear(self):
+        self._templates = {}
+
+    def render(self, kind, booking):
+        subject, _, action = self.emails[kind]
+        text_template, html_template = self._compiled(kind)
+        test = booking.test
+        lab = booking.lab
+        context = Context({
             'booking': booking,
-            'test': booking.test,
-            'lab': booking.lab,
+            'test': test,
+            'lab': lab,
             'user_name': booking.name,
             'booking_id': booking.booking_id,
-        }
-        
-        # Render HTML and plain text versions
-        html_message = render_to_string('emails/booking_confirmation_email.html', context)
-        plain_message = render_to_string('emails/booking_confirmation_email.txt', context)
-        
-        # Send email
-        send_mail(
-            subject=f'Booking Confirmation - {booking.test.name} at {booking.lab.name}',
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[booking.email],
-            html_message=html_message,
-            fail_silently=False,
+            'action': action,
+        })
+        return RenderedEmail(
+            f'{subject} - {test.name} at {lab.name}',
+            text_template.render(context),
+            html_template.render(context),
         )
-        
+
+
+notification_renderer = NotificationRenderer()
+
+
+@receiver(file_changed)
+def email_templates_changed(sender, file_path, **kwargs):
+    # The dev server reloads templates without restarting; pick up edited email templates too
+    if file_path.suffix in ('.txt', '.html'):
+        notification_renderer.clear()
+
+
+def queue_booking_email(kind, booking):
+    """Render a booking email and queue it for the user, returning its EmailOutbox row"""
+    email = notification_renderer.render(kind, booking)
+    return queue_email(subject=email.subject, message=email.text, recipient=booking.email, html_message=email.html)
+
+
+def try_queue_booking_email(kind, booking):
+    """queue_booking_email for callers that carry on without the email; returns whether it was queued"""
+    try:
+        with transaction.atomic():
+            queue_booking_email(kind, booking)
         return True
     except Exception as e:
-        print(f"Error sending email: {str(e)}")
+        print(f"Error queueing email: {str(e)}")
         return False
 
 
+def render_booking_emails(kind, bookings):
+    """Render one kind of email for many bookings (with test and lab loaded) as queue_emails() tuples"""
+    emails = []
+    for booking in bookings:
+        email = notification_renderer.render(kind, booking)
+        emails.append((email.subject, email.text, booking.email, email.html))
+    return emails
+
+
+def send_booking_confirmation_email(booking):
+    """
+    Send booking confirmation email to the user
+    """
+    return try_queue_booking_email('confirmation', booking)
+
+
 def send_booking_update_email(booking):
     """
     Send booking update notification email to the user
     """
-    try:
-        context = {
-            'booking': booking,
-            'test': booking.test,
-            'lab': booking.lab,
-            'user_name': booking.name,
-            'booking_id': booking.booking_id,
-            'action': 'updated',
-        }
-        
-        html_message = render_to_string('emails/booking_notification_email.html', context)
-        plain_message = render_to_string('emails/booking_notification_email.txt', context)
-        
-        send_mail(
-            subject=f'Booking Updated - {booking.test.name} at {booking.lab.name}',
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[booking.email],
-            html_message=html_message,
-            fail_silently=False,
-        )
-        
-        return True
-    except Exception as e:
-        print(f"Error sending email: {str(e)}")
-        return False
+    return try_queue_booking_email('update', booking)
 
 
 def send_booking_cancellation_email(booking):
     """
     Send booking cancellation notification email to the user
     """
-    try:
-        context = {
-            'booking': booking,
-            'test': booking.test,
-            'lab': booking.lab,
-            'user_name': booking.name,
-            'booking_id': booking.booking_id,
-            'action': 'cancelled',
-        }
-        
-        html_message = render_to_string('emails/booking_cancellation_email.html', context)
-        plain_message = render_to_string('emails/booking_cancellation_email.txt', context)
-        
-        send_mail(
-            subject=f'Booking Cancelled - {booking.test.name} at {booking.lab.name}',
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[booking.email],
-            html_message=html_message,
-            fail_silently=False,
-        )
-        
-        return True
-    except Exception as e:
-        print(f"Error sending email: {str(e)}")
-        return False
+    return try_queue_booking_email('cancellation', booking)
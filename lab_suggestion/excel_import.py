@@ -0,0 +1,166 @@
+"""
+Streaming price-list import for LabEase
+Reads the admin workbook row by row in read-only mode and writes it a chunk at a time, so memory stays flat
+and the database sees a few queries per chunk instead of several per row
+"""
+from itertools import islice
+
+import openpyxl
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .catalog import bump_catalog_version
+from .junk_filter import is_junk_test_name
+from .models import Lab, Test
+
+REQUIRED_LAB_COLUMNS = ['lab name', 'address', 'city', 'state', 'zip code', 'phone number', 'contact email', 'contact phone']
+REQUIRED_TEST_COLUMNS = ['test name', 'test description', 'test price']
+IMPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_SKIPS = 20  # Skipped rows listed individually before only being counted
+
+
+class ExcelImportError(Exception):
+    """The workbook cannot be imported as a price list"""
+
+
+class ImportSummary:
+    """What an import did, for the admin's success and warning messages"""
+
+    def __init__(self):
+        self.rows = 0
+        self.labs_created = []
+        self.tests_created = 0
+        self.associations = 0
+        self.skipped_rows = []
+        self.skipped = 0
+
+    def skip(self, row_number):
+        self.skipped += 1
+        if len(self.skipped_rows) < MAX_REPORTED_SKIPS:
+            self.skipped_rows.append(row_number)
+
+
+def read_price_list(excel_file):
+    """Yield (row number, {column: value}) for each data row, streaming the sheet in read-only mode"""
+    workbook = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        headers = [str(value).lower() if value else None for value in header]
+        missing = [column for column in REQUIRED_LAB_COLUMNS + REQUIRED_TEST_COLUMNS if column not in headers]
+        if missing:
+            raise ExcelImportError(
+                "Missing one or more required columns in the Excel file (case-insensitive). Required: Lab Name, Address, "
+                "City, State, Zip Code, Phone Number, Contact Email, Contact Phone, Test Name, Test Description, Test Price."
+            )
+        for row_number, values in enumerate(rows, start=2):
+            # Read-only sheets can report formatted but empty rows past the data
+            if any(value is not None for value in values):
+                yield row_number, dict(zip(headers, values))
+    finally:
+        workbook.close()
+
+
+class PriceListImporter:
+    """Creates missing labs and tests and links them, one chunk of rows per transaction"""
+
+    def __init__(self):
+        self.summary = ImportSummary()
+        self.labs = {}  # Case-folded name → Lab; a price list names only a handful of labs
+        self.test_ids = None  # Case-folded name → id for the whole catalog, loaded with the first chunk
+
+    def lab_for(self, row_data):
+        lab_name = str(row_data['lab name'])
+        key = lab_name.casefold()
+        lab = self.labs.get(key)
+        if lab is None:
+            lab = Lab.objects.filter(name__iexact=lab_name).first()
+            if lab is None:
+                user, created = User.objects.get_or_create(username=f"lab_{lab_name.replace(' ', '_').lower()}", defaults={'is_active': True})
+                if created:
+                    user.set_password('defaultpassword') # IMPORTANT: Change this for production!
+                    user.save()
+                lab = Lab.objects.create(
+                    user=user,
+                    name=lab_name,
+                    address=row_data.get('address', ''),
+                    city=row_data.get('city', ''),
+                    state=row_data.get('state', ''),
+                    zip_code=row_data.get('zip code', ''),
+                    phone_number=row_data.get('phone number', ''),
+                    contact_email=row_data.get('contact email', 'noreply@example.com'),
+                    contact_phone=row_data.get('contact phone', '000-000-0000')
+                )
+                self.summary.labs_created.append(lab_name)
+            self.labs[key] = lab
+        return lab
+
+    def test_ids_for(self, rows):
+        """Case-folded test name → id, creating the chunk's missing tests in one insert
+
+        Names are folded in Python rather than with SQL LOWER(), which on SQLite only folds ASCII letters.
+        """
+        if self.test_ids is None:
+            self.test_ids = {}
+            for test_id, name in Test.objects.order_by('id').values_list('id', 'name').iterator():
+                self.test_ids.setdefault(name.casefold(), test_id)
+
+        new_tests = {}
+        for row_data in rows:
+            name = str(row_data['test name'])
+            key = name.casefold()
+            if key not in self.test_ids and key not in new_tests:
+                # bulk_create skips Test.save(), which is where the junk flag is normally set
+                new_tests[key] = Test(
+                    name=name, description=row_data.get('test description', ''), price=row_data.get('test price', 0.00),
+                    is_junk=is_junk_test_name(name),
+                )
+        if new_tests:
+            Test.objects.bulk_create(new_tests.values())
+            if all(test.pk for test in new_tests.values()):
+                for key, test in new_tests.items():
+                    self.test_ids[key] = test.pk
+            else:
+                # Backends that don't return ids from bulk inserts: look the new tests up by their exact names
+                created = Test.objects.filter(name__in=[test.name for test in new_tests.values()]).order_by('id')
+                for test_id, name in created.values_list('id', 'name'):
+                    self.test_ids.setdefault(name.casefold(), test_id)
+            self.summary.tests_created += len(new_tests)
+            # Bulk-created tests send no post_save signals; bump once this chunk is committed
+            transaction.on_commit(bump_catalog_version)
+        return self.test_ids
+
+    def import_chunk(self, chunk):
+        rows = []
+        for row_number, row_data in chunk:
+            self.summary.rows += 1
+            if not row_data.get('lab name'):
+                self.summary.skip(row_number)
+                continue
+            rows.append(row_data)
+
+        with transaction.atomic():
+            offered = {}
+            test_rows = [row_data for row_data in rows if row_data.get('test name')]
+            test_ids = self.test_ids_for(test_rows) if test_rows else {}
+            for row_data in rows:
+                lab = self.lab_for(row_data)
+                if row_data.get('test name'):
+                    offered.setdefault(lab, set()).add(test_ids[str(row_data['test name']).casefold()])
+            for lab, ids in offered.items():
+                lab.tests.add(*ids)
+                self.summary.associations += len(ids)
+
+    def run(self, excel_file, chunk_size=IMPORT_CHUNK_SIZE):
+        rows = read_price_list(excel_file)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            self.import_chunk(chunk)
+        return self.summary
+
+
+def import_price_list(excel_file, chunk_size=IMPORT_CHUNK_SIZE):
+    """Import an admin price-list workbook, returning an ImportSummary; raises ExcelImportError for a bad header"""
+    return PriceListImporter().run(excel_file, chunk_size)
@@ -0,0 +1,141 @@
+"""
+Intent matcher for the LabEase chatbot
+Every intent keyword is compiled into one regex, so a message is scanned once no matter how many intents there are
+"""
+import re
+
+# Keywords are matched from the start of a word, so "hi" no longer fires inside "this" and "ill" no longer
+# fires inside "will". A keyword ending in "*" is a stem that also matches any word it begins ("book*" finds
+# "bookings", "pain*" finds "painful"), which keeps the routing the old substring checks gave inflected words;
+# the others must end at a word boundary too
+INTENT_KEYWORDS = {
+    'booking': ['book*', 'schedul*', 'appointment*'],
+    # Counts as asking to book in chatbot_api, but is not answered with the booking reply
+    'reservation': ['reserv*'],
+    'greeting': ['hello', 'hi', 'hey', 'greetings'],
+    'price': ['price*', 'pricing', 'cost*', 'expensive', 'cheap*', 'affordable', 'how much'],
+    'symptom': ['symptom*', 'feel*', 'pain*', 'recommend*', 'suggest*', 'should i take', 'what test*'],
+    'test': ['test*', 'lab test*', 'what test*', 'which test*', 'do you have'],
+    'lab': ['lab*', 'where', 'location*', 'find lab', 'near me'],
+    'help': ['help*', 'how', 'what can', 'what do', 'guid*'],
+    # Health concerns mentioned while a booking is in progress
+    'health_concern': [
+        'feel*', 'pain*', 'tired', 'fatigue*', 'weak*', 'fever*', 'headache*', 'worry', 'worried', 'concern*',
+        'symptom*', 'problem*', 'issue*', 'sick*', 'ill', 'illness', 'disease*', 'diabetes', 'heart*', 'thyroid',
+        'liver', 'kidney*', 'chest', 'stomach*', 'blood pressure',
+    ],
+    'introduction': ['my name is', 'i am', 'name:'],
+    'booking_details': ['my name is', 'i am', 'email:', 'email is', 'book for me', '@'],
+}
+
+# Order in which AIChatbotService.generate_response routes a message
+RESPONSE_INTENTS = ('booking', 'greeting', 'price', 'symptom', 'test', 'lab', 'help')
+
+WORD_CHARS = 'a-z0-9'
+
+
+class MessageIntents:
+    """The intents found in one chatbot message"""
+
+    __slots__ = ('names', 'has_email')
+
+    def __init__(self, names, has_email):
+        self.names = frozenset(names)
+        self.has_email = has_email
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __repr__(self):
+        return f'<MessageIntents {sorted(self.names)}>'
+
+    @property
+    def primary(self):
+        """The intent generate_response answers, or None for the default RAG answer"""
+        for name in RESPONSE_INTENTS:
+            if name in self.names:
+                return name
+        return None
+
+    @property
+    def is_booking_request(self):
+        return 'booking' in self.names or 'reservation' in self.names
+
+    @property
+    def has_health_concern(self):
+        return 'health_concern' in self.names and not self.has_email
+
+
+def _trie_pattern(node):
+    """Regex for a character trie, trying longer keywords first so each match is the longest one"""
+    branches = []
+    for char in sorted(key for key in node if key != ''):
+        child = node[char]
+        branches.append((r'\s+' if char == ' ' else re.escape(char)) + _trie_pattern(child))
+    if '' in node:
+        # A keyword ends here; it must also end at a word boundary
+        branches.append(node[''])
+    if len(branches) == 1:
+        return branches[0]
+    return '(?:%s)' % '|'.join(branches)
+
+
+class IntentMatcher:
+    """Finds every intent keyword in a message with one compiled regex"""
+
+    def __init__(self, intent_keywords):
+        self.phrase_intents = {}
+        stems = set()
+        for name, keywords in intent_keywords.items():
+            for keyword in keywords:
+                if keyword.endswith('*'):
+                    keyword = keyword[:-1]
+                    stems.add(keyword)
+                self.phrase_intents.setdefault(keyword, set()).add(name)
+
+        # A keyword that is a leading part of a longer one ("how" in "how much", the stem "pain" in "painful")
+        # starts at the same position and is shadowed by the longest match, so the longer phrase carries its
+        # intents too
+        for phrase, names in self.phrase_intents.items():
+            for keyword, keyword_names in self.phrase_intents.items():
+                if keyword != phrase and phrase.startswith(keyword) and (
+                    keyword in stems or not keyword[-1].isalnum() or not phrase[len(keyword)].isalnum()
+                ):
+                    names |= keyword_names
+        self.phrase_intents = {phrase: frozenset(names) for phrase, names in self.phrase_intents.items()}
+
+        trie = {}
+        for phrase in self.phrase_intents:
+            node = trie
+            for char in phrase:
+                node = node.setdefault(char, {})
+            node[''] = f'(?![{WORD_CHARS}])' if phrase[-1].isalnum() and phrase not in stems else ''
+        word_starts = {char: node for char, node in trie.items() if char.isalnum()}
+        others = {char: node for char, node in trie.items() if not char.isalnum()}
+        alternatives = []
+        if word_starts:
+            alternatives.append(f'(?<![{WORD_CHARS}])' + _trie_pattern(word_starts))
+        if others:
+            alternatives.append(_trie_pattern(others))
+        # A zero-width lookahead visits every start position, so overlapping keywords are all found
+        self.regex = re.compile('(?=(%s))' % '|'.join(alternatives))
+
+    def match(self, message):
+        message = message.lower()
+        names = set()
+        phrase_intents = self.phrase_intents
+        for phrase in self.regex.findall(message):
+            intents = phrase_intents.get(phrase)
+            if intents is None:
+                # Phrase keywords match any run of whitespace between their words
+                intents = phrase_intents[' '.join(phrase.split())]
+            names |= intents
+        return MessageIntents(names, '@' in message)
+
+
+intent_matcher = IntentMatcher(INTENT_KEYWORDS)
+
+
+def detect_intents(message):
+    """Return the MessageIntents for a chatbot message"""
+    return intent_matcher.match(message)
@@ -0,0 +1,45 @@
+"""
+Junk test classifier for LabEase
+Hospital price lists mix real tests with bed, room and ambulance charges; this decides which rows are junk
+"""
+import re
+
+# Placeholder rows left behind by bad imports, and hospital charges only junk as a whole name
+JUNK_TEST_NAMES = frozenset(['a', 'u', 'z', 'x', 'acer', 'xray', 'transplant room', 'ventilator charge', 'ambulance charg'])
+
+# Whole-word keywords marking hospital charges rather than tests; words that also name real tests
+# ("Transplant Panel", "Observation ...") only count in the exact names above
+JUNK_KEYWORDS = [
+    'AMBULANCE', 'VENTILATOR', 'VENTIL', 'CABIN', 'BED', 'ICU', 'SSCU', 'POST ANESTHESIA',
+]
+
+JUNK_KEYWORD_RE = re.compile(r'\b(?:%s)\b' % '|'.join(re.escape(keyword) for keyword in JUNK_KEYWORDS), re.IGNORECASE)
+
+
+def is_junk_test_name(name):
+    """Return True if a test name is a placeholder or a hospital charge"""
+    name = (name or '').strip()
+    if not name or name.lower() in JUNK_TEST_NAMES:
+        return True
+    return bool(JUNK_KEYWORD_RE.search(name))
+
+
+def refresh_junk_flags(batch_size=2000):
+    """Recompute Test.is_junk for every test, returning the number of junk tests"""
+    from .catalog import bump_catalog_version
+    from .models import Test
+
+    junk_ids = []
+    valid_ids = []
+    for test_id, name, is_junk in Test.objects.values_list('id', 'name', 'is_junk').iterator(chunk_size=batch_size):
+        junk = is_junk_test_name(name)
+        if junk != is_junk:
+            (junk_ids if junk else valid_ids).append(test_id)
+
+    for ids, flag in ((junk_ids, True), (valid_ids, False)):
+        for start in range(0, len(ids), batch_size):
+            Test.objects.filter(id__in=ids[start:start + batch_size]).update(is_junk=flag)
+
+    if junk_ids or valid_ids:
+        bump_catalog_version()
+    return Test.objects.filter(is_junk=True).count()
@@ -0,0 +1,160 @@
+"""
+Inverted keyword index for LabEase
+Maps word tokens in test names and descriptions to test ids so retrieval needs a single id__in fetch,
+and ranks tests for free-text queries with BM25
+"""
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from math import log
+
+from django.db.models import Case, When
+
+from .catalog import CatalogIndex
+from .models import Test
+from .search_service import TOKEN_RE
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+NAME_WEIGHT = 3  # A word in the test name counts as three occurrences
+PREFIX_MATCH_WEIGHT = 0.5  # "thyro" matching "thyroid" scores half of an exact match
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+class KeywordIndex:
+    """Token → test postings over the valid (non-junk) test catalog, with precomputed BM25 impacts"""
+
+    def __init__(self, rows):
+        self.test_ids = array('q')
+        self.prices = {}
+        frequencies = {}
+        doc_lengths = array('f')
+        for doc, (test_id, name, description, price) in enumerate(rows):
+            self.test_ids.append(test_id)
+            self.prices[test_id] = price
+            counts = Counter()
+            for token in tokenize(name):
+                counts[token] += NAME_WEIGHT
+            for token in tokenize(description):
+                counts[token] += 1
+            doc_lengths.append(sum(counts.values()))
+            for token, count in counts.items():
+                frequencies.setdefault(token, []).append((doc, count))
+
+        # Each posting stores its BM25 term score so a query only has to add them up
+        doc_count = len(self.test_ids)
+        average_length = (sum(doc_lengths) / doc_count) if doc_count else 0
+        self.postings = {}
+        for token, entries in frequencies.items():
+            idf = log(1 + (doc_count - len(entries) + 0.5) / (len(entries) + 0.5))
+            impacts = array('f', (
+                idf * count * (BM25_K1 + 1) / (count + BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths[doc] / average_length))
+                for doc, count in entries
+            ))
+            self.postings[token] = (array('I', (doc for doc, _ in entries)), impacts, max(impacts))
+
+        self.tokens = sorted(self.postings)
+        self.priced_ids = frozenset(test_id for test_id, price in self.prices.items() if price is not None)
+        self.cheapest_ids = sorted(self.priced_ids, key=lambda test_id: (self.prices[test_id], test_id))
+
+    def _expand(self, token):
+        """Index tokens starting with `token`, with the weight a match on each counts for"""
+        position = bisect_left(self.tokens, token)
+        while position < len(self.tokens) and self.tokens[position].startswith(token):
+            candidate = self.tokens[position]
+            yield candidate, 1.0 if candidate == token else PREFIX_MATCH_WEIGHT
+            position += 1
+
+    def token_ids(self, token):
+        """Ids of tests with a word starting with `token`"""
+        test_ids = self.test_ids
+        ids = set()
+        for candidate, _ in self._expand(token):
+            ids.update(test_ids[doc] for doc in self.postings[candidate][0])
+        return ids
+
+    def _term_postings(self, term):
+        """(docs, impacts, max impact) for a query word, scoring each test by its best exact or prefix match"""
+        expansions = list(self._expand(term))
+        if len(expansions) == 1 and expansions[0][1] == 1.0:
+            return self.postings[expansions[0][0]]
+        best = {}
+        for candidate, weight in expansions:
+            docs, impacts, _ = self.postings[candidate]
+            for doc, impact in zip(docs, impacts):
+                score = impact * weight
+                if score > best.get(doc, 0.0):
+                    best[doc] = score
+        docs = sorted(best)
+        return array('I', docs), array('f', (best[doc] for doc in docs)), max(best.values(), default=0.0)
+
+    def rank(self, terms, limit=10):
+        """Ids of the `limit` tests with the highest BM25 score for `terms`"""
+        lists = [postings for postings in map(self._term_postings, dict.fromkeys(terms)) if postings[0]]
+        lists.sort(key=lambda postings: len(postings[0]))
+
+        # MaxScore pruning: add up the rarest words in full until the remaining words together
+        # cannot lift an unseen test into the top `limit`
+        scores = {}
+        remaining = sum(max_impact for _, _, max_impact in lists)
+        position = 0
+        while position < len(lists):
+            if len(scores) >= limit and remaining <= heapq.nlargest(limit, scores.values())[-1]:
+                break
+            docs, impacts, max_impact = lists[position]
+            for doc, impact in zip(docs, impacts):
+                scores[doc] = scores.get(doc, 0.0) + impact
+            remaining -= max_impact
+            position += 1
+
+        # The common words only need scoring for tests already in the running
+        for docs, impacts, _ in lists[position:]:
+            size = len(docs)
+            for doc in scores:
+                found = bisect_left(docs, doc)
+                if found < size and docs[found] == doc:
+                    scores[doc] += impacts[found]
+
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [self.test_ids[doc] for doc, _ in top]
+
+    def keyword_ids(self, keyword):
+        """Ids of tests matching every word of `keyword` (a word or short phrase)"""
+        tokens = tokenize(keyword)
+        if not tokens:
+            return set()
+        ids = self.token_ids(tokens[0])
+        for token in tokens[1:]:
+            if not ids:
+                break
+            ids &= self.token_ids(token)
+        return ids
+
+    def any_keyword_ids(self, keywords, priced_only=False):
+        """Sorted ids of tests matching at least one of `keywords`"""
+        ids = set()
+        for keyword in keywords:
+            ids |= self.keyword_ids(keyword)
+        if priced_only:
+            ids &= self.priced_ids
+        return sorted(ids)
+
+
+def _build_keyword_index():
+    rows = Test.objects.filter(is_junk=False).values_list('id', 'name', 'description', 'price')
+    return KeywordIndex(rows.iterator())
+
+
+keyword_index = CatalogIndex(_build_keyword_index)
+
+
+def fetch_tests(ids):
+    """Fetch tests by id in one query, keeping the order of `ids`"""
+    if not ids:
+        return Test.objects.none()
+    order = Case(*[When(id=test_id, then=position) for position, test_id in enumerate(ids)])
+    return Test.objects.filter(id__in=ids).order_by(order)
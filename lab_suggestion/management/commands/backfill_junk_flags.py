@@ -0,0 +1,14 @@
+"""
+Django management command to (re)classify junk tests
+Usage: python manage.py backfill_junk_flags
+"""
+
+from django.core.management.base import BaseCommand
+from lab_suggestion.junk_filter import refresh_junk_flags
+
+class Command(BaseCommand):
+    help = 'Recompute the is_junk flag on every test'
+
+    def handle(self, *args, **options):
+        junk_count = refresh_junk_flags()
+        self.stdout.write(self.style.SUCCESS(f"✓ {junk_count} test(s) flagged as junk"))
@@ -0,0 +1,18 @@
+"""
+Django management command to run performance benchmarks
+Usage: python manage.py benchmark <suite> [--size N]
+"""
+
+from django.core.management.base import BaseCommand
+from lab_suggestion.benchmarks import SUITES
+
+class Command(BaseCommand):
+    help = 'Run a LabEase performance benchmark'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=sorted(SUITES))
+        parser.add_argument('--size', type=int, help='Dataset size (defaults to the suite\'s own)')
+
+    def handle(self, *args, **options):
+        function, default_size = SUITES[options['suite']]
+        function(self.stdout, options['size'] or default_size)
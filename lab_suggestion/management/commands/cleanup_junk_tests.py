@@ -5,26 +5,15 @@ Usage: python manage.py cleanup_junk_tests
 
 from django.core.management.base import BaseCommand
 from lab_suggestion.models import Test
+from lab_suggestion.junk_filter import refresh_junk_flags
 
 class Command(BaseCommand):
     help = 'Remove junk test records from database'
 
     def handle(self, *args, **options):
-        # Define patterns for junk tests
-        junk_keywords = [
-            'AMBULANCE', 'VENTILATOR', 'CABIN', 'BED', 'ICU', 'SSCU',
-            'POST ANESTHESIA', 'TRANSPLANT', 'OBSERVATION', 'CHARGE'
-        ]
-        
-        # Single letter tests
-        single_letter_tests = Test.objects.filter(name__in=['a', 'u', 'z', 'x', 'acer', 'xray'])
-        
-        # Find tests with junk keywords
-        junk_tests = Test.objects.none()
-        for keyword in junk_keywords:
-            junk_tests = junk_tests | Test.objects.filter(name__icontains=keyword)
-        
-        junk_tests = junk_tests | single_letter_tests
+        # Classify with the same rules the listings use, then pick up the flagged rows
+        refresh_junk_flags()
+        junk_tests = Test.objects.filter(is_junk=True)
         
         count = junk_tests.count()
         
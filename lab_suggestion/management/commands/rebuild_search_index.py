@@ -0,0 +1,19 @@
+"""
+Django management command to rebuild the full-text search index
+Usage: python manage.py rebuild_search_index
+"""
+
+from django.core.management.base import BaseCommand
+from lab_suggestion.search_service import fts_available, install_fts_tables, rebuild_fts_tables
+
+class Command(BaseCommand):
+    help = 'Create (if needed) and repopulate the SQLite FTS5 search tables'
+
+    def handle(self, *args, **options):
+        install_fts_tables()
+        if not fts_available():
+            self.stdout.write("FTS5 is not available on this database; searches use LIKE lookups")
+            return
+
+        rebuild_fts_tables()
+        self.stdout.write(self.style.SUCCESS("✓ Search index rebuilt"))
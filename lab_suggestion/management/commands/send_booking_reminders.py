@@ -0,0 +1,22 @@
+"""
+Django management command to queue reminder emails for upcoming bookings
+Usage: python manage.py send_booking_reminders [--hours N] [--batch-size N]
+Safe to run every minute (e.g. from cron): each booking gets at most one reminder
+"""
+
+from django.core.management.base import BaseCommand
+from lab_suggestion.email_utils import notification_renderer
+from lab_suggestion.reminders import queue_booking_reminders
+
+class Command(BaseCommand):
+    help = 'Queue reminder emails for booked tests starting within the next few hours'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=None, help='Remind bookings starting within this many hours (default BOOKING_REMINDER_HOURS)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Bookings rendered, then marked and queued together, per batch')
+
+    def handle(self, *args, **options):
+        # A broken template fails here, before any booking is touched
+        notification_renderer.precompile()
+        queued = queue_booking_reminders(hours=options['hours'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"✓ {queued} reminder(s) queued"))
@@ -0,0 +1,40 @@
+"""
+Django management command to deliver queued booking emails
+Usage: python manage.py send_queued_emails [--once] [--batch-size N] [--interval SECONDS] [--idle-timeout SECONDS]
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from lab_suggestion.outbox import PooledMailer, deliver_due_emails
+
+
+class Command(BaseCommand):
+    help = 'Send emails waiting in the EmailOutbox, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the due emails and exit instead of polling')
+        parser.add_argument('--batch-size', type=int, default=None, help='Emails claimed per batch (default EMAIL_OUTBOX_BATCH_SIZE)')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to wait when nothing is due')
+        parser.add_argument(
+            '--idle-timeout', type=float, default=None,
+            help='Seconds an unused SMTP connection stays open (default EMAIL_CONNECTION_IDLE_TIMEOUT)',
+        )
+
+    def handle(self, *args, **options):
+        # One SMTP connection serves every batch until it sits idle
+        mailer = PooledMailer(options['idle_timeout'])
+        try:
+            while True:
+                sent, failed = deliver_due_emails(options['batch_size'], mailer)
+                if sent or failed:
+                    self.stdout.write(f"✓ {sent} email(s) sent, {failed} failed")
+                elif options['once']:
+                    break
+                else:
+                    mailer.close_if_idle()
+                    close_old_connections()
+                    time.sleep(options['interval'])
+        finally:
+            mailer.close()
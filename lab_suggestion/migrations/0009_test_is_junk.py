@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-17 15:42
+
+import re
+
+from django.db import migrations, models
+
+# A frozen copy of lab_suggestion.junk_filter as of this migration, so later rule changes don't change what it does
+JUNK_TEST_NAMES = frozenset(['a', 'u', 'z', 'x', 'acer', 'xray', 'transplant room', 'ventilator charge', 'ambulance charg'])
+JUNK_KEYWORD_RE = re.compile(r'\b(?:AMBULANCE|VENTILATOR|VENTIL|CABIN|BED|ICU|SSCU|POST\ ANESTHESIA)\b', re.IGNORECASE)
+
+
+def is_junk_test_name(name):
+    name = (name or '').strip()
+    if not name or name.lower() in JUNK_TEST_NAMES:
+        return True
+    return bool(JUNK_KEYWORD_RE.search(name))
+
+
+def classify_existing_tests(apps, schema_editor):
+    Test = apps.get_model('lab_suggestion', 'Test')
+    junk_ids = [test_id for test_id, name in Test.objects.values_list('id', 'name') if is_junk_test_name(name)]
+    for start in range(0, len(junk_ids), 500):
+        Test.objects.filter(id__in=junk_ids[start:start + 500]).update(is_junk=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab_suggestion', '0008_alter_testbooking_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='test',
+            name='is_junk',
+            field=models.BooleanField(default=False, editable=False, help_text='Hospital charge or placeholder row, hidden from listings'),
+        ),
+        migrations.AddIndex(
+            model_name='test',
+            index=models.Index(fields=['is_junk', 'price'], name='lab_suggest_is_junk_99f342_idx'),
+        ),
+        migrations.RunPython(classify_existing_tests, migrations.RunPython.noop),
+    ]
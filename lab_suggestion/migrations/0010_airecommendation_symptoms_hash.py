@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab_suggestion', '0009_test_is_junk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='airecommendation',
+            name='symptoms_hash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='SHA-256 of the normalized symptoms and the recommended test ids', max_length=64),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-17 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab_suggestion', '0010_airecommendation_symptoms_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='testbooking',
+            index=models.Index(fields=['lab', 'booking_date'], name='lab_suggest_lab_id_f8d6db_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testbooking',
+            index=models.Index(fields=['lab', 'status', 'booking_date'], name='lab_suggest_lab_id_b2ff3c_idx'),
+        ),
+    ]
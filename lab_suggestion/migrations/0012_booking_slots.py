@@ -0,0 +1,51 @@
+# Generated by Django 5.2.8 on 2026-10-17 16:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+
+
+def count_existing_bookings(apps, schema_editor):
+    TestBooking = apps.get_model('lab_suggestion', 'TestBooking')
+    BookingSlot = apps.get_model('lab_suggestion', 'BookingSlot')
+    held = (
+        TestBooking.objects.exclude(status='cancelled')
+        .annotate(starts_at=TruncHour('booking_date'))
+        .values('lab_id', 'test_id', 'starts_at')
+        .annotate(booked=Count('id'))
+        .order_by()
+    )
+    BookingSlot.objects.bulk_create(
+        (BookingSlot(lab_id=row['lab_id'], test_id=row['test_id'], starts_at=row['starts_at'], booked=row['booked']) for row in held.iterator()),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab_suggestion', '0011_testbooking_lab_calendar_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='labtestdetail',
+            name='slots_per_hour',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Bookings accepted per hour for this test; blank uses the site default', null=True),
+        ),
+        migrations.CreateModel(
+            name='BookingSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('starts_at', models.DateTimeField()),
+                ('booked', models.PositiveIntegerField(default=0)),
+                ('lab', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_slots', to='lab_suggestion.lab')),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_slots', to='lab_suggestion.test')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('lab', 'test', 'starts_at'), name='unique_booking_slot')],
+            },
+        ),
+        migrations.RunPython(count_existing_bookings, migrations.RunPython.noop),
+    ]
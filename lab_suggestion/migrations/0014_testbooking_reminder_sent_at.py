@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-17 16:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab_suggestion', '0013_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testbooking',
+            name='reminder_sent_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='When the reminder email was queued', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='testbooking',
+            index=models.Index(condition=models.Q(('reminder_sent_at__isnull', True), ('status', 'booked')), fields=['booking_date'], name='booking_reminder_due_idx'),
+        ),
+    ]
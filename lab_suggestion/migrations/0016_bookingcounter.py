@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-17 17:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab_suggestion', '0015_catalogversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_number', models.PositiveIntegerField(default=0)),
+                ('lab', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_counters', to='lab_suggestion.lab')),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_counters', to='lab_suggestion.test')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('lab', 'test'), name='unique_booking_counter')],
+            },
+        ),
+    ]
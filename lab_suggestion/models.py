@@ -1,12 +1,30 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
+from django.utils import timezone
 import uuid
+from .booking_ids import booking_code
+from .junk_filter import is_junk_test_name
 
 class Test(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     # popularity = models.IntegerField(default=0) # Removed this line
+    is_junk = models.BooleanField(default=False, editable=False, help_text='Hospital charge or placeholder row, hidden from listings')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_junk', 'price']),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Classify once on write so listings can filter on the flag
+        self.is_junk = is_junk_test_name(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'is_junk'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -30,6 +48,7 @@ class LabTestDetail(models.Model):
     test = models.ForeignKey(Test, on_delete=models.CASCADE)
     lab_specific_description = models.TextField(blank=True, null=True)
     lab_specific_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    slots_per_hour = models.PositiveSmallIntegerField(blank=True, null=True, help_text='Bookings accepted per hour for this test; blank uses the site default')
 
     def __str__(self):
         return f'{self.lab.name} - {self.test.name}'
@@ -67,6 +86,7 @@ class ChatMessage(models.Model):
 class AIRecommendation(models.Model):
     """Model to store AI-powered test recommendations"""
     symptoms = models.TextField()
+    symptoms_hash = models.CharField(max_length=64, blank=True, default='', db_index=True, editable=False, help_text='SHA-256 of the normalized symptoms and the recommended test ids')
     recommended_tests = models.ManyToManyField(Test)
     created_at = models.DateTimeField(auto_now_add=True)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
@@ -93,23 +113,27 @@ class TestBooking(models.Model):
     booked_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=BOOKING_STATUS_CHOICES, default='booked')
     notes = models.TextField(blank=True, null=True)
+    reminder_sent_at = models.DateTimeField(null=True, blank=True, editable=False, help_text='When the reminder email was queued')
 
     class Meta:
         ordering = ['-booked_at']
         indexes = [
             models.Index(fields=['booking_id', 'email']),
             models.Index(fields=['email']),
+            # Lab calendar: one lab's bookings over a date range, optionally narrowed to one status
+            models.Index(fields=['lab', 'booking_date']),
+            models.Index(fields=['lab', 'status', 'booking_date']),
+            # Reminder queue: only upcoming bookings still waiting for a reminder are indexed
+            models.Index(
+                fields=['booking_date'], name='booking_reminder_due_idx',
+                condition=models.Q(status='booked', reminder_sent_at__isnull=True),
+            ),
         ]
 
     def generate_booking_id(self):
-        """Generate a lab-related short booking ID format: LAB{lab_id}-{test_id}-{random_suffix}"""
-        import string
-        import random
-        lab_code = f"LAB{self.lab.id}".upper()
-        test_code = f"TST{self.test.id}".upper()
-        # Generate random suffix (3 alphanumeric characters)
-        random_suffix = ''.join(random.choices(string.ascii_uppercase + string.digits, k=3))
-        return f"{lab_code}-{test_code}-{random_suffix}"
+        """Generate a lab-related short booking ID format: LAB{lab_id}-TST{test_id}-{booking number for the pair}"""
+        # Each number is issued once per lab and test, so no collision check (and no lab or test lookup) is needed
+        return f"LAB{self.lab_id}-TST{self.test_id}-{booking_code(BookingCounter.next_number(self.lab_id, self.test_id))}"
 
     def save(self, *args, **kwargs):
         if not self.booking_id:
@@ -119,3 +143,93 @@ class TestBooking(models.Model):
 
     def __str__(self):
         return f'{self.booking_id} - {self.test.name} at {self.lab.name}'
+
+
+class BookingSlot(models.Model):
+    """Bookings holding one hour of one test at one lab, the counter that enforces slot capacity"""
+    lab = models.ForeignKey(Lab, on_delete=models.CASCADE, related_name='booking_slots')
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='booking_slots')
+    starts_at = models.DateTimeField()
+    booked = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['lab', 'test', 'starts_at'], name='unique_booking_slot'),
+        ]
+
+    def __str__(self):
+        return f'{self.lab.name} - {self.test.name} at {self.starts_at:%Y-%m-%d %H:%M} ({self.booked} booked)'
+
+
+class BookingCounter(models.Model):
+    """The last booking number issued for one test at one lab, the counter booking ids are numbered from"""
+    lab = models.ForeignKey(Lab, on_delete=models.CASCADE, related_name='booking_counters')
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='booking_counters')
+    last_number = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['lab', 'test'], name='unique_booking_counter'),
+        ]
+
+    @classmethod
+    def next_number(cls, lab_id, test_id):
+        """
+        Issue the pair's next booking number. Only ever incremented by one UPDATE, which holds the row until the
+        surrounding transaction ends, so concurrent bookings get distinct numbers and a rolled-back booking gives
+        its number back
+        """
+        counter = cls.objects.filter(lab_id=lab_id, test_id=test_id)
+        with transaction.atomic():
+            # The write comes first so SQLite takes its write lock before the number is read back
+            if not counter.update(last_number=F('last_number') + 1):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(lab_id=lab_id, test_id=test_id, last_number=1)
+                    return 1
+                except IntegrityError:
+                    # A concurrent booking created the counter after our UPDATE
+                    counter.update(last_number=F('last_number') + 1)
+            return counter.values_list('last_number', flat=True).get()
+
+    def __str__(self):
+        return f'{self.lab.name} - {self.test.name}: {self.last_number} booked'
+
+
+class EmailOutbox(models.Model):
+    """An email waiting to be sent by the send_queued_emails worker, so requests never wait on SMTP"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True, default='')
+    from_email = models.CharField(max_length=254)
+    to = models.EmailField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, help_text='When the worker may (re)try this email')
+    claim_token = models.CharField(max_length=32, blank=True, default='', editable=False, help_text='Worker run currently sending this email')
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The worker's queue: due pending emails, oldest first
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} to {self.to} ({self.status})'
+
+
+class CatalogVersion(models.Model):
+    """The one shared catalog version, so a catalog write in any process invalidates every worker's indexes"""
+    version = models.BigIntegerField(default=0, help_text='Changed to a fresh value on every catalog write')
+
+    def __str__(self):
+        return f'Catalog version {self.version}'
@@ -0,0 +1,40 @@
+"""
+Lab offerings map for LabEase
+Answers "which labs offer this test" from a process-local test → labs map instead of a query per test
+"""
+from .catalog import CatalogIndex
+from .models import Lab, LabTestDetail
+
+
+class LabOfferings:
+    """Labs offering each test, in lab id order"""
+
+    def __init__(self, labs, pairs):
+        labs = {lab.id: lab for lab in labs}
+        offerings = {}
+        for test_id, lab_id in pairs:
+            lab = labs[lab_id]
+            test_labs = offerings.setdefault(test_id, [])
+            # A lab may list the same test twice; show it once
+            if lab not in test_labs:
+                test_labs.append(lab)
+        self.offerings = {test_id: tuple(test_labs) for test_id, test_labs in offerings.items()}
+
+    def labs_for(self, test, limit=None):
+        return list(self.offerings.get(test.id, ())[:limit])
+
+    def count_for(self, test):
+        return len(self.offerings.get(test.id, ()))
+
+
+def _build_lab_offerings():
+    pairs = LabTestDetail.objects.order_by('lab_id', 'id').values_list('test_id', 'lab_id')
+    return LabOfferings(Lab.objects.all(), pairs.iterator())
+
+
+lab_offerings = CatalogIndex(_build_lab_offerings)
+
+
+def labs_offering(test, limit=None):
+    """Labs offering `test`, at most `limit` of them"""
+    return lab_offerings.get().labs_for(test, limit)
@@ -0,0 +1,177 @@
+"""
+Email outbox for LabEase
+Views queue emails as EmailOutbox rows and return; the send_queued_emails worker delivers them through one
+reused SMTP connection, retrying failures with exponential backoff
+"""
+import datetime
+import smtplib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+CLAIM_SECONDS = 300  # A claimed email is retried by the next run if its worker dies before recording the outcome
+
+
+def outbox_batch_size():
+    return getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 100)
+
+
+def max_attempts():
+    return getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+
+
+def retry_delay(attempts):
+    """Wait before the next try after `attempts` failed ones: the base delay, doubling each time, capped at a day"""
+    return datetime.timedelta(seconds=min(getattr(settings, 'EMAIL_OUTBOX_RETRY_SECONDS', 60) * 2 ** (attempts - 1), 86400))
+
+
+def queue_email(subject, message, recipient, html_message=''):
+    """Queue one email for the worker to send"""
+    return EmailOutbox.objects.create(
+        subject=subject,
+        body=message,
+        html_body=html_message or '',
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=recipient,
+    )
+
+
+def queue_emails(emails, batch_size=500):
+    """Queue many (subject, message, recipient, html_message) emails with bulk inserts"""
+    from_email = settings.DEFAULT_FROM_EMAIL
+    return EmailOutbox.objects.bulk_create(
+        (
+            EmailOutbox(subject=subject, body=message, html_body=html_message or '', from_email=from_email, to=recipient)
+            for subject, message, recipient, html_message in emails
+        ),
+        batch_size=batch_size,
+    )
+
+
+def as_message(email, connection=None):
+    message = EmailMultiAlternatives(email.subject, email.body, email.from_email, [email.to], connection=connection)
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def claim_due_emails(batch_size):
+    """Claim up to `batch_size` due emails for this run, so concurrent workers never send the same one"""
+    now = timezone.now()
+    due = list(
+        EmailOutbox.objects.filter(status='pending', next_attempt_at__lte=now)
+        .order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size]
+    )
+    if not due:
+        return []
+    token = uuid.uuid4().hex
+    # Only rows still due are taken; another worker may have claimed some since the read above
+    EmailOutbox.objects.filter(id__in=due, status='pending', next_attempt_at__lte=now).update(
+        claim_token=token,
+        attempts=F('attempts') + 1,
+        next_attempt_at=now + datetime.timedelta(seconds=CLAIM_SECONDS),
+    )
+    return list(EmailOutbox.objects.filter(id__in=due, claim_token=token).order_by('next_attempt_at', 'id'))
+
+
+def record_sent(emails):
+    # Only rows still under this run's claim: once a claim expires another worker owns the email
+    claims = {}
+    for email in emails:
+        claims.setdefault(email.claim_token, []).append(email.pk)
+    for token, ids in claims.items():
+        EmailOutbox.objects.filter(pk__in=ids, claim_token=token).update(
+            status='sent', sent_at=timezone.now(), claim_token='', last_error='',
+        )
+
+
+def record_failure(email, error):
+    """Schedule a retry with backoff, or give up once the email has had its attempts"""
+    claimed = EmailOutbox.objects.filter(pk=email.pk, claim_token=email.claim_token)
+    if email.attempts >= max_attempts():
+        claimed.update(status='failed', claim_token='', last_error=str(error))
+    else:
+        claimed.update(next_attempt_at=timezone.now() + retry_delay(email.attempts), claim_token='', last_error=str(error))
+
+
+class PooledMailer:
+    """Sends every message through one SMTP connection, closed once it has been idle for `idle_timeout` seconds"""
+
+    def __init__(self, idle_timeout=None):
+        if idle_timeout is None:
+            idle_timeout = getattr(settings, 'EMAIL_CONNECTION_IDLE_TIMEOUT', 30)
+        self.idle_timeout = idle_timeout
+        self.connection = None
+        self.connections_opened = 0
+        self._last_used = 0.0
+
+    def _open(self):
+        self.connection = get_connection(fail_silently=False)
+        self.connection.open()
+        self.connections_opened += 1
+        return self.connection
+
+    def send(self, message):
+        """Send one message; a failure only affects that message, not the rest of the batch"""
+        self.close_if_idle()
+        reused = self.connection is not None
+        connection = self.connection or self._open()
+        try:
+            connection.send_messages([message])
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped a connection we kept open; retry once on a fresh one
+            self.close()
+            if not reused:
+                raise
+            self.send(message)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException):
+            # The server refused this message; smtplib has already reset the session for the next one
+            raise
+        except Exception:
+            # Anything else may have left the session mid-command, so don't reuse it
+            self.close()
+            raise
+        finally:
+            self._last_used = time.monotonic()
+
+    def close_if_idle(self):
+        if self.connection is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            self.close()
+
+    def close(self):
+        if self.connection is not None:
+            connection, self.connection = self.connection, None
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+
+def deliver_due_emails(batch_size=None, mailer=None):
+    """Send one batch of due emails; returns (sent, failed) counts"""
+    own_mailer = mailer is None
+    if own_mailer:
+        mailer = PooledMailer()
+    sent = []
+    failed = 0
+    try:
+        for email in claim_due_emails(batch_size or outbox_batch_size()):
+            try:
+                mailer.send(as_message(email))
+            except Exception as error:
+                record_failure(email, error)
+                failed += 1
+            else:
+                sent.append(email)
+    finally:
+        if own_mailer:
+            mailer.close()
+        if sent:
+            record_sent(sent)
+    return len(sent), failed
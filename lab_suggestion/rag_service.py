@@ -2,8 +2,9 @@
 RAG (Retrieval Augmented Generation) Service for LabEase
 Retrieves relevant information from the database to provide accurate answers
 """
-from .models import Test, Lab, LabTestDetail
-from django.db.models import Q
+from .keyword_index import keyword_index, fetch_tests
+from .offerings import labs_offering
+from .search_service import SearchService, search_terms
 
 
 class RAGService:
@@ -12,32 +13,15 @@ class RAGService:
     @staticmethod
     def retrieve_tests(query, limit=10):
         """Retrieve relevant tests based on query"""
-        query_lower = query.lower()
-        
-        # Search in test names and descriptions
-        tests = Test.objects.filter(
-            Q(name__icontains=query_lower) |
-            Q(description__icontains=query_lower)
-        ).distinct()[:limit]
-        
-        # If no direct match, try fuzzy matching with keywords
-        if not tests.exists():
-            keywords = query_lower.split()
-            for keyword in keywords:
-                if len(keyword) > 3:  # Only search for meaningful keywords
-                    tests = Test.objects.filter(
-                        Q(name__icontains=keyword) |
-                        Q(description__icontains=keyword)
-                    ).distinct()[:limit]
-                    if tests.exists():
-                        break
-        
-        return tests
+        # BM25 over names and descriptions; name matches weigh more
+        terms = [term for term in search_terms(query, match_all=False) if len(term) > 1]
+        return fetch_tests(keyword_index.get().rank(terms, limit))
     
     @staticmethod
     def retrieve_tests_by_price(query):
         """Retrieve tests with price information - enhanced matching"""
         query_lower = query.lower()
+        index = keyword_index.get()
         
         # Extract price-related keywords to remove
         price_keywords = ['price', 'cost', 'expensive', 'cheap', 'affordable', 'how', 'much', 'what', 'is', 'the', 'of', 'a', 'an', 'does', 'do']
@@ -48,18 +32,13 @@ class RAGService:
             if word not in price_keywords and len(word) > 2:
                 test_keywords.append(word)
         
+        # Candidate keyword groups, most specific first; the first group with priced matches wins
+        keyword_groups = []
+        
         # Handle specific test patterns with better matching
         if 'blood' in query_lower:
             # Prioritize CBC and blood-related tests
-            tests = Test.objects.filter(price__isnull=False).filter(
-                Q(name__icontains='cbc') |
-                Q(name__icontains='complete blood') |
-                Q(name__icontains='blood count') |
-                Q(name__icontains='blood') |
-                Q(description__icontains='blood')
-            ).distinct()
-            if tests.exists():
-                return tests[:10]
+            keyword_groups.append(['cbc', 'complete blood', 'blood count', 'blood'])
         
         # Handle other common test patterns
         test_patterns = {
@@ -74,41 +53,25 @@ class RAGService:
         
         for pattern, keywords in test_patterns.items():
             if pattern in query_lower:
-                tests = Test.objects.filter(price__isnull=False)
-                q_objects = Q()
-                for keyword in keywords:
-                    q_objects |= Q(name__icontains=keyword) | Q(description__icontains=keyword)
-                tests = tests.filter(q_objects).distinct()
-                if tests.exists():
-                    return tests[:10]
+                keyword_groups.append(keywords)
         
         # Search for tests using extracted keywords
         if test_keywords:
-            tests = Test.objects.filter(price__isnull=False)
-            q_objects = Q()
-            for keyword in test_keywords:
-                q_objects |= Q(name__icontains=keyword) | Q(description__icontains=keyword)
-            tests = tests.filter(q_objects).distinct()
-            if tests.exists():
-                return tests[:10]
+            keyword_groups.append(test_keywords)
+        
+        for keywords in keyword_groups:
+            test_ids = index.any_keyword_ids(keywords, priced_only=True)
+            if test_ids:
+                return fetch_tests(test_ids[:10])
         
         # Return popular tests with prices as fallback
-        return Test.objects.filter(price__isnull=False).order_by('price')[:10]
+        return fetch_tests(index.cheapest_ids[:10])
     
     @staticmethod
     def retrieve_labs(query, limit=10):
         """Retrieve relevant labs based on query"""
-        query_lower = query.lower()
-        
-        # Search by location
-        labs = Lab.objects.filter(
-            Q(name__icontains=query_lower) |
-            Q(city__icontains=query_lower) |
-            Q(state__icontains=query_lower) |
-            Q(address__icontains=query_lower)
-        ).distinct()[:limit]
-        
-        return labs
+        # Search by name and location
+        return SearchService.search_labs(query, match_all=False)[:limit]
     
     @staticmethod
     def retrieve_tests_for_symptoms(symptoms_text):
@@ -152,26 +115,18 @@ class RAGService:
                 if len(keyword) > 3:
                     matching_keywords.append(keyword)
         
-        # Retrieve tests
-        tests = Test.objects.none()
-        for keyword in matching_keywords[:5]:  # Limit to avoid too many queries
-            keyword_tests = Test.objects.filter(
-                Q(name__icontains=keyword) |
-                Q(description__icontains=keyword)
-            )
-            tests = tests | keyword_tests
-        
-        return tests.distinct()[:10]
+        # Resolve every keyword from the index, then fetch the matches in one query
+        test_ids = keyword_index.get().any_keyword_ids(matching_keywords[:5])
+        return fetch_tests(test_ids[:10])
     
     @staticmethod
     def format_test_info(test):
         """Format test information for LLM context"""
-        labs_offering = Lab.objects.filter(tests=test)[:3]
         info = {
             'name': test.name,
             'description': test.description or 'No description available',
             'price': str(test.price) if test.price else 'Price not available',
-            'labs': [lab.name for lab in labs_offering]
+            'labs': [lab.name for lab in labs_offering(test, 3)]
         }
         return info
     
@@ -0,0 +1,122 @@
+"""
+Symptom → test index for LabEase
+Compiles the symptom taxonomy against the test catalog once per catalog version, so a recommendation is a lookup
+"""
+import hashlib
+import re
+
+from .catalog import CatalogIndex
+from .intents import IntentMatcher
+from .keyword_index import tokenize
+from .models import Test
+
+MAX_RECOMMENDATIONS = 10
+FALLBACK_RECOMMENDATIONS = 5
+RECOMMENDATION_CACHE_TIMEOUT = 3600
+
+# Symptom group → (symptom phrases, words that start matching test names)
+SYMPTOM_GROUPS = {
+    'diabetes': (
+        ['diabetes', 'diabetic', 'blood sugar', 'glucose', 'thirsty', 'thirst', 'frequent urination'],
+        ['glucose', 'diabetes', 'hba1c'],
+    ),
+    'heart': (
+        ['chest pain', 'heart', 'cardiac', 'shortness of breath'],
+        ['cardiac', 'troponin', 'ekg'],
+    ),
+    'thyroid': (
+        ['thyroid', 'tired', 'tiredness', 'fatigue', 'weight gain', 'weight loss'],
+        ['thyroid', 'tsh', 't3', 't4'],
+    ),
+    'liver': (
+        ['liver', 'jaundice', 'yellow', 'yellowish', 'abdominal pain'],
+        ['liver', 'alt', 'ast', 'bilirubin'],
+    ),
+    'kidney': (
+        ['kidney', 'kidneys', 'urine', 'kidney pain', 'back pain'],
+        ['kidney', 'creatinine', 'bun'],
+    ),
+    'cholesterol': (
+        ['cholesterol', 'heart disease', 'high blood pressure'],
+        ['cholesterol', 'lipid'],
+    ),
+    'blood_count': (
+        ['anemia', 'anaemia', 'weakness', 'pale', 'blood count'],
+        ['cbc', 'complete blood', 'hemoglobin'],
+    ),
+}
+
+# Commonly ordered tests, recommended when no symptom group matches
+POPULAR_TEST_NAMES = [
+    'BLOOD SUGAR F', 'CHOLESTEROL', 'LIPID PROFILE',
+    'CREATININE', 'BUN', 'ALBUMIN', 'HB A1C',
+    'BILIRUBIN', 'BLOOD GAS ANALYSIS', 'LFT',
+]
+
+symptom_matcher = IntentMatcher({group: symptoms for group, (symptoms, _) in SYMPTOM_GROUPS.items()})
+
+# Test-name words match at word starts, so "ast" finds "AST (SGOT)" but not "FASTING"
+GROUP_NAME_RES = {
+    group: re.compile(r'(?<![a-z0-9])(?:%s)' % '|'.join(re.escape(word) for word in words))
+    for group, (_, words) in SYMPTOM_GROUPS.items()
+}
+
+
+class SymptomIndex:
+    """Test ids for every symptom group, plus the popular-test fallback"""
+
+    def __init__(self, rows):
+        # Rows arrive in id order, which is the order recommendations list tests in
+        self.group_ids = {group: [] for group in SYMPTOM_GROUPS}
+        popular = {}
+        self.fallback_ids = []
+        for test_id, name in rows:
+            name = name.lower()
+            for group, name_re in GROUP_NAME_RES.items():
+                if name_re.search(name):
+                    self.group_ids[group].append(test_id)
+            for popular_name in POPULAR_TEST_NAMES:
+                if popular_name not in popular and popular_name.lower() in name:
+                    popular[popular_name] = test_id
+            if len(self.fallback_ids) < FALLBACK_RECOMMENDATIONS:
+                self.fallback_ids.append(test_id)
+        popular_ids = [popular[name] for name in POPULAR_TEST_NAMES if name in popular]
+        self.popular_ids = list(dict.fromkeys(popular_ids))
+
+    def recommend(self, symptoms_text):
+        """Ids of the tests to recommend for a symptom description, most relevant group first"""
+        groups = symptom_matcher.match(symptoms_text).names
+        test_ids = {}
+        for group in SYMPTOM_GROUPS:
+            if group in groups:
+                test_ids.update(dict.fromkeys(self.group_ids[group]))
+        if test_ids:
+            return list(test_ids)[:MAX_RECOMMENDATIONS]
+        return (self.popular_ids or self.fallback_ids)[:MAX_RECOMMENDATIONS]
+
+
+def _build_symptom_index():
+    rows = Test.objects.filter(is_junk=False).order_by('id').values_list('id', 'name')
+    return SymptomIndex(rows.iterator())
+
+
+symptom_index = CatalogIndex(_build_symptom_index)
+
+
+def recommend_test_ids(symptoms_text):
+    """Ids of up to MAX_RECOMMENDATIONS tests for a symptom description"""
+    return symptom_index.get().recommend(symptoms_text)
+
+
+def symptoms_key(symptoms_text, test_ids):
+    """Content address of a recommendation: the normalized symptoms and the tests recommended for them
+
+    Both come from the database alone, so every worker computes the same key, and a catalog change only
+    gets a new row when it changes what is recommended.
+    """
+    normalized = ' '.join(tokenize(symptoms_text))
+    return hashlib.sha256(f"{normalized}:{','.join(map(str, test_ids))}".encode()).hexdigest()
+
+
+def recommendation_cache_key(user_id, symptoms_hash):
+    return f"ai_recommendation_{user_id or 'anon'}_{symptoms_hash}"
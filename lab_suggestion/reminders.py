@@ -0,0 +1,49 @@
+"""
+Booking reminders for LabEase
+Finds upcoming bookings that have not been reminded with one indexed range query and renders their emails
+outside any transaction. Marking the bookings and queueing their emails then commit together in one short
+transaction, so running it again never sends a second reminder and a failed batch is left for the next run
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .email_utils import render_booking_emails
+from .models import TestBooking
+from .outbox import queue_emails
+
+
+def reminder_hours():
+    return getattr(settings, 'BOOKING_REMINDER_HOURS', 24)
+
+
+def due_reminders(now, hours):
+    """Booked, not yet reminded bookings starting within `hours` of `now`; served by booking_reminder_due_idx"""
+    return TestBooking.objects.filter(
+        status='booked',
+        reminder_sent_at__isnull=True,
+        booking_date__gte=now,
+        booking_date__lt=now + datetime.timedelta(hours=hours),
+    )
+
+
+def queue_booking_reminders(hours=None, batch_size=500, now=None):
+    """Queue reminder emails for every booking due one; returns how many were queued"""
+    now = now or timezone.now()
+    hours = reminder_hours() if hours is None else hours
+    queued = 0
+    while True:
+        due = list(due_reminders(now, hours).select_related('test', 'lab').order_by('booking_date')[:batch_size])
+        if not due:
+            return queued
+        # Rendering holds no lock; a batch that fails to render is left unmarked
+        emails = dict(zip((booking.id for booking in due), render_booking_emails('reminder', due)))
+        with transaction.atomic():
+            # The marker doubles as this run's claim: a concurrent run marks with its own time, so each booking
+            # is picked up by exactly one run. The UPDATE comes first so SQLite takes its write lock straight away
+            claimed_at = timezone.now()
+            TestBooking.objects.filter(id__in=emails, status='booked', reminder_sent_at__isnull=True).update(reminder_sent_at=claimed_at)
+            claimed = set(TestBooking.objects.filter(id__in=emails, reminder_sent_at=claimed_at).values_list('id', flat=True))
+            queued += len(queue_emails([email for booking_id, email in emails.items() if booking_id in claimed]))
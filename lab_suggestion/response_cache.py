@@ -0,0 +1,70 @@
+"""
+Chatbot response cache for LabEase
+Answers that depend only on the message and the catalog are kept in a bounded per-process LRU cache
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .catalog import get_catalog_version
+from .keyword_index import tokenize
+
+# Intents whose answers ignore the wording of the message entirely
+FIXED_ANSWER_INTENTS = frozenset(['greeting', 'help'])
+
+
+def response_key(intent, message):
+    """(intent, entities) identifying every message that gets the same answer"""
+    if intent in FIXED_ANSWER_INTENTS:
+        return intent, ()
+    return intent, tuple(tokenize(message))
+
+
+class ResponseCache:
+    """LRU cache of chatbot answers for the current catalog version, with hit/miss counters"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        """The cached answer for `key`, calling `build()` to make it on a miss"""
+        version = get_catalog_version()
+        with self._lock:
+            if version != self._version:
+                # Every cached answer was built from an older catalog
+                self._entries.clear()
+                self._version = version
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        value = build()
+        with self._lock:
+            # Skip storing if the catalog changed while the answer was being built
+            if self.max_size and self._version == version:
+                self._entries[key] = value
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'max_size': self.max_size}
+
+
+def make_response_cache():
+    return ResponseCache(getattr(settings, 'CHATBOT_RESPONSE_CACHE_SIZE', 512))
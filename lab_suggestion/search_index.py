@@ -0,0 +1,123 @@
+"""
+In-memory test-name index for LabEase
+Answers test-name autocomplete and chatbot test detection from a process-local index instead of table scans
+"""
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+from .catalog import CatalogIndex
+from .models import Test
+
+AUTOCOMPLETE_LIMIT = 20
+MAX_GRAM = 3
+
+# Where a test name may start inside a chat message
+NAME_START_RE = re.compile(r'(?<!\w)\S')
+
+
+def _common_prefix_length(first, second):
+    length = 0
+    for a, b in zip(first, second):
+        if a != b:
+            break
+        length += 1
+    return length
+
+
+class TestNameIndex:
+    """N-gram index over test names, ranked prefix matches first then infix matches"""
+
+    def __init__(self, rows):
+        # Keep the first row per exact name, mirroring the old dedupe by name
+        by_name = {}
+        for row in rows:
+            by_name.setdefault(row['name'], row)
+
+        self.entries = sorted(by_name.values(), key=lambda row: (row['name'].lower(), row['id']))
+        self.names_lower = [row['name'].lower() for row in self.entries]
+
+        postings = defaultdict(lambda: array('I'))
+        for position, name in enumerate(self.names_lower):
+            for gram in self._grams(name):
+                postings[gram].append(position)
+        self.postings = dict(postings)
+
+    @staticmethod
+    def _grams(text):
+        grams = set()
+        for size in range(1, MAX_GRAM + 1):
+            for start in range(len(text) - size + 1):
+                grams.add(text[start:start + size])
+        return grams
+
+    def search(self, query, limit=AUTOCOMPLETE_LIMIT):
+        query = query.lower()
+        if not query:
+            return []
+
+        # Prefix matches form a contiguous run in the sorted name list
+        start = bisect_left(self.names_lower, query)
+        end = start
+        while end < len(self.names_lower) and end - start < limit and self.names_lower[end].startswith(query):
+            end += 1
+        positions = list(range(start, end))
+
+        if len(positions) < limit:
+            # Walk the rarest n-gram's postings and verify each candidate
+            if len(query) <= MAX_GRAM:
+                candidates = self.postings.get(query, ())
+            else:
+                grams = [query[i:i + MAX_GRAM] for i in range(len(query) - MAX_GRAM + 1)]
+                candidates = min((self.postings.get(gram, ()) for gram in grams), key=len)
+            for position in candidates:
+                if start <= position < end:
+                    continue
+                if query in self.names_lower[position]:
+                    positions.append(position)
+                    if len(positions) >= limit:
+                        break
+
+        return [self.entries[position] for position in positions]
+
+    def _longest_name_at(self, text):
+        """Position of the longest name that `text` starts with, or None"""
+        names = self.names_lower
+        position = bisect_right(names, text) - 1
+        while position >= 0:
+            name = names[position]
+            if text.startswith(name):
+                # Equal names sort by id; report the first one
+                while position and names[position - 1] == name:
+                    position -= 1
+                return position
+            # Any shorter name that fits must be a prefix of what this one shares with `text`
+            common = _common_prefix_length(name, text)
+            if not common:
+                return None
+            position = bisect_right(names, text[:common]) - 1
+        return None
+
+    def find_in(self, message):
+        """The entry for the longest test name mentioned in `message`, or None"""
+        message = message.lower()
+        best = None
+        for start in NAME_START_RE.finditer(message):
+            position = self._longest_name_at(message[start.start():])
+            if position is not None and (best is None or len(self.names_lower[position]) > len(self.names_lower[best])):
+                best = position
+        return self.entries[best] if best is not None else None
+
+
+def _build_test_name_index():
+    rows = Test.objects.filter(is_junk=False).order_by('id').values('id', 'name', 'price', 'description')
+    return TestNameIndex(rows.iterator())
+
+
+test_name_index = CatalogIndex(_build_test_name_index)
+
+
+def autocomplete_tests(query, limit=AUTOCOMPLETE_LIMIT):
+    """Return up to `limit` test rows whose name contains `query`"""
+    return test_name_index.get().search(query, limit)
@@ -0,0 +1,164 @@
+"""
+Full-text search service for LabEase
+Uses SQLite FTS5 tables ranked by bm25 when available, falling back to LIKE lookups otherwise
+"""
+import re
+from functools import lru_cache
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Test, Lab
+
+TOKEN_RE = re.compile(r'\w+')
+
+# FTS5 matches whole tokens and their prefixes only; queries made of nothing but shorter fragments
+# (say "bc" for "CBC") are more likely infixes, so they keep using LIKE
+MIN_FTS_TERM_LENGTH = 3
+
+# Words that carry no meaning for matching tests or labs in chat-style queries
+STOPWORDS = frozenset([
+    'a', 'an', 'the', 'is', 'are', 'of', 'for', 'in', 'at', 'to', 'do', 'does', 'you', 'your',
+    'i', 'me', 'my', 'what', 'which', 'where', 'how', 'have', 'has', 'can', 'show', 'tell',
+    'about', 'find', 'near', 'any', 'test', 'tests', 'lab', 'labs', 'price', 'cost', 'much',
+])
+
+# FTS5 index definitions: (fts table, content table, columns, bm25 column weights)
+FTS_TABLES = {
+    'test': ('lab_suggestion_test_fts', 'lab_suggestion_test', ('name', 'description'), (10.0, 1.0)),
+    'lab': ('lab_suggestion_lab_fts', 'lab_suggestion_lab', ('name', 'city', 'state', 'address'), (5.0, 3.0, 1.0, 1.0)),
+}
+
+
+def _trigger_sql(fts_table, content_table, columns):
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'new.{column}' for column in columns)
+    old_values = ', '.join(f'old.{column}' for column in columns)
+    delete_old = (
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) "
+        f"VALUES ('delete', old.id, {old_values});"
+    )
+    insert_new = f"INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values});"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {content_table} BEGIN {insert_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {content_table} BEGIN {delete_old} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE ON {content_table} BEGIN {delete_old} {insert_new} END",
+    ]
+
+
+def install_fts_tables(using='default', **kwargs):
+    """Create the FTS5 tables and sync triggers (post_migrate handler, safe to rerun)"""
+    from django.db import connections
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+
+    with db.cursor() as cursor:
+        existing = set(db.introspection.table_names(cursor))
+        for fts_table, content_table, columns, _ in FTS_TABLES.values():
+            if content_table not in existing:
+                continue
+            created = fts_table not in existing
+            if created:
+                try:
+                    cursor.execute(
+                        f"CREATE VIRTUAL TABLE {fts_table} USING fts5("
+                        f"{', '.join(columns)}, content='{content_table}', content_rowid='id')"
+                    )
+                except Exception:
+                    # SQLite built without FTS5; searches keep using LIKE
+                    return
+            # Triggers are dropped whenever a migration rebuilds the content table
+            for statement in _trigger_sql(fts_table, content_table, columns):
+                cursor.execute(statement)
+            if created:
+                cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+    fts_available.cache_clear()
+
+
+def rebuild_fts_tables():
+    """Repopulate the FTS5 tables from their content tables"""
+    with connection.cursor() as cursor:
+        for fts_table, _, _, _ in FTS_TABLES.values():
+            cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+
+
+@lru_cache(maxsize=None)
+def fts_available():
+    """True when the database has the FTS5 tables installed"""
+    if connection.vendor != 'sqlite':
+        return False
+    tables = set(connection.introspection.table_names())
+    return all(fts_table in tables for fts_table, _, _, _ in FTS_TABLES.values())
+
+
+def search_terms(query, match_all=True):
+    """Split a query into search terms, dropping filler words for any-term searches"""
+    terms = TOKEN_RE.findall((query or '').lower())
+    if not match_all:
+        terms = [term for term in terms if term not in STOPWORDS]
+    return terms
+
+
+class SearchService:
+    """Ranked search over tests and labs"""
+
+    @staticmethod
+    def _use_fts(terms):
+        return fts_available() and any(len(term) >= MIN_FTS_TERM_LENGTH for term in terms)
+
+    @staticmethod
+    def _fts_match(terms, columns, match_all):
+        expression = (' AND ' if match_all else ' OR ').join(f'"{term}"*' for term in terms)
+        if columns:
+            expression = '{%s} : (%s)' % (' '.join(columns), expression)
+        return expression
+
+    @staticmethod
+    def _ranked(model, kind, terms, columns, match_all):
+        fts_table, _, _, weights = FTS_TABLES[kind]
+        match = SearchService._fts_match(terms, columns, match_all)
+        bm25 = f"bm25({fts_table}, {', '.join(str(weight) for weight in weights)})"
+        # Join the FTS table once: the MATCH both filters the rows and scores them for bm25()
+        return model.objects.extra(
+            select={'search_rank': bm25},
+            tables=[fts_table],
+            where=[f'{fts_table}.rowid = "{model._meta.db_table}"."id"', f'{fts_table} MATCH %s'],
+            params=[match],
+        ).order_by('search_rank', 'id')
+
+    @staticmethod
+    def _like(model, query, terms, columns, match_all):
+        def contains(value):
+            condition = Q()
+            for column in columns:
+                condition |= Q(**{f'{column}__icontains': value})
+            return condition
+
+        # Whole-query substring match, then (for any-term searches) individual keywords
+        condition = contains(query.strip())
+        if not match_all:
+            for term in terms:
+                if len(term) > 3:
+                    condition |= contains(term)
+        return model.objects.filter(condition).distinct()
+
+    @staticmethod
+    def search_tests(query, columns=None, match_all=True):
+        """Return tests matching `query`, best matches first when FTS5 is available"""
+        terms = search_terms(query, match_all)
+        if not terms:
+            return Test.objects.none()
+        if SearchService._use_fts(terms):
+            return SearchService._ranked(Test, 'test', terms, columns, match_all)
+        return SearchService._like(Test, query, terms, columns or FTS_TABLES['test'][2], match_all)
+
+    @staticmethod
+    def search_labs(query, columns=None, match_all=True):
+        """Return labs matching `query`, best matches first when FTS5 is available"""
+        terms = search_terms(query, match_all)
+        if not terms:
+            return Lab.objects.none()
+        if SearchService._use_fts(terms):
+            return SearchService._ranked(Lab, 'lab', terms, columns, match_all)
+        return SearchService._like(Lab, query, terms, columns or FTS_TABLES['lab'][2], match_all)
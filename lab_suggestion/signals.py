@@ -0,0 +1,44 @@
+"""
+Signal handlers for LabEase
+Keep catalog-derived caches and indexes fresh when tests, labs or their offerings change,
+drop cached recommendations when their rows are deleted, and give back the slot of a deleted booking
+"""
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .catalog import bump_catalog_version
+from .models import Test, Lab, LabTestDetail, AIRecommendation, TestBooking
+from .recommendations import recommendation_cache_key
+from .slots import held_slot, release_slot
+
+
+@receiver(post_save, sender=Test)
+@receiver(post_delete, sender=Test)
+@receiver(post_save, sender=Lab)
+@receiver(post_delete, sender=Lab)
+@receiver(post_save, sender=LabTestDetail)
+@receiver(post_delete, sender=LabTestDetail)
+def catalog_changed(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(m2m_changed, sender=Lab.tests.through)
+def lab_tests_changed(sender, action, **kwargs):
+    # lab.tests.add()/remove()/clear() bypass LabTestDetail save/delete signals
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_catalog_version()
+
+
+@receiver(post_delete, sender=AIRecommendation)
+def recommendation_deleted(sender, instance, **kwargs):
+    # Stop serving a cached copy of a deleted recommendation
+    cache.delete(recommendation_cache_key(instance.user_id, instance.symptoms_hash))
+
+
+@receiver(post_delete, sender=TestBooking)
+def booking_deleted(sender, instance, **kwargs):
+    # Deleting a booking (e.g. from the admin) frees its place in the hour, like cancelling it does
+    slot = held_slot(instance)
+    if slot is not None:
+        release_slot(*slot)
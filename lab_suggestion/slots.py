@@ -0,0 +1,95 @@
+"""
+Slot capacity for LabEase bookings
+A lab takes a limited number of bookings per test per hour. Each hour has a BookingSlot counter that is only
+ever incremented by one conditional UPDATE, so concurrent bookings cannot overfill it on any database backend
+"""
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .email_utils import queue_booking_email
+from .models import BookingSlot, LabTestDetail
+
+
+class SlotFull(Exception):
+    """The requested hour has no capacity left for this test at this lab"""
+
+    def __init__(self, message='That hour is fully booked for this test. Please choose another time.'):
+        super().__init__(message)
+
+
+def default_slots_per_hour():
+    return getattr(settings, 'BOOKING_SLOTS_PER_HOUR', 4)
+
+
+def slot_start(booking_date):
+    """The hour a booking time falls in"""
+    if timezone.is_naive(booking_date):
+        booking_date = timezone.make_aware(booking_date)
+    return booking_date.replace(minute=0, second=0, microsecond=0)
+
+
+def slot_capacity(lab_id, test_id):
+    """Bookings the lab accepts per hour for the test"""
+    capacity = (
+        LabTestDetail.objects.filter(lab_id=lab_id, test_id=test_id, slots_per_hour__isnull=False)
+        .values_list('slots_per_hour', flat=True).first()
+    )
+    return default_slots_per_hour() if capacity is None else capacity
+
+
+def held_slot(booking):
+    """The (lab id, test id, hour) a booking holds capacity in, or None once it is cancelled"""
+    if booking.status == 'cancelled':
+        return None
+    return booking.lab_id, booking.test_id, slot_start(booking.booking_date)
+
+
+def reserve_slot(lab_id, test_id, starts_at, capacity):
+    """Take one place in a slot or raise SlotFull; call inside a transaction that also saves the booking"""
+    slot = BookingSlot.objects.filter(lab_id=lab_id, test_id=test_id, starts_at=starts_at)
+    # The write comes first so SQLite takes its write lock before reading anything; a read-then-write
+    # transaction there fails with "database is locked" instead of waiting when another booking is in flight
+    if slot.filter(booked__lt=capacity).update(booked=F('booked') + 1):
+        return
+    if capacity < 1:
+        raise SlotFull()
+    try:
+        with transaction.atomic():
+            BookingSlot.objects.create(lab_id=lab_id, test_id=test_id, starts_at=starts_at, booked=1)
+    except IntegrityError:
+        # The slot exists: either it is full, or a concurrent booking created it after our UPDATE
+        if not slot.filter(booked__lt=capacity).update(booked=F('booked') + 1):
+            raise SlotFull()
+
+
+def release_slot(lab_id, test_id, starts_at):
+    BookingSlot.objects.filter(lab_id=lab_id, test_id=test_id, starts_at=starts_at, booked__gt=0).update(booked=F('booked') - 1)
+
+
+def save_booking(booking, held=None, email=None):
+    """
+    Save a booking, reserving capacity in its slot and giving back the slot it `held` before the change
+    (from held_slot()); raises SlotFull and leaves everything unchanged if the new slot is full.
+    `email` names a booking email (a BOOKING_EMAILS kind) queued in the same transaction as the save, so the
+    booking and its email are committed together or not at all
+    """
+    slot = held_slot(booking)
+    moved = slot != held
+    if not moved and not email:
+        booking.save()
+        return booking
+    if moved and slot is not None:
+        # Looked up before the transaction starts, so the reservation below is its first statement
+        capacity = slot_capacity(booking.lab_id, booking.test_id)
+    with transaction.atomic():
+        if moved:
+            if slot is not None:
+                reserve_slot(*slot, capacity)
+            if held is not None:
+                release_slot(*held)
+        booking.save()
+        if email:
+            queue_booking_email(email, booking)
+    return booking
@@ -1,3 +1,1234 @@
-from django.test import TestCase
+import io
+import json
+import smtplib
+import threading
+import datetime
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.template import TemplateSyntaxError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Test, Lab, LabTestDetail, ChatMessage, AIRecommendation, TestBooking, BookingSlot, EmailOutbox, CatalogVersion
+from .ai_service import AIChatbotService, AIRecommendationService
+from .benchmarks import synthetic_catalog
+from .booking_ids import booking_code
+from .catalog import CATALOG_VERSION_KEY, bump_catalog_version
+from .chat_log import ChatLogWriter, record_chat_message
+from .email_utils import BOOKING_EMAILS, NotificationRenderer, notification_renderer, render_booking_emails
+from .excel_import import PriceListImporter, import_price_list
+from .intents import detect_intents
+from .offerings import labs_offering
+from .outbox import PooledMailer, claim_due_emails, deliver_due_emails, queue_email, record_failure, record_sent
+from .junk_filter import is_junk_test_name
+from .keyword_index import KeywordIndex
+from .rag_service import RAGService
+from .recommendations import recommend_test_ids, recommendation_cache_key
+from .reminders import due_reminders, queue_booking_reminders
+from .response_cache import ResponseCache
+from .search_index import test_name_index
+from .search_service import SearchService, fts_available
+from .slots import SlotFull, held_slot, save_booking, slot_start
+from .views import SEARCH_RESULTS_PER_PAGE, _lab_bookings_on
+
+
+def make_lab(name, city='Kathmandu'):
+    user = User.objects.create(username=name.lower().replace(' ', '_'))
+    return Lab.objects.create(
+        user=user, name=name, address='Main Road', city=city, state='Bagmati',
+        zip_code='44600', phone_number='01-4000000',
+    )
+
+
+class SearchTestsAutocompleteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for name in ['Lipid Profile', 'Blood Sugar F', 'Complete Blood Count', 'BLOOD GAS ANALYSIS', 'ICU']:
+            Test.objects.create(name=name, price=100)
+
+    def autocomplete(self, query):
+        response = self.client.get(reverse('search_tests_autocomplete'), {'q': query})
+        return [result['name'] for result in response.json()['results']]
+
+    def test_prefix_matches_rank_before_infix_matches(self):
+        self.assertEqual(self.autocomplete('blood'), ['BLOOD GAS ANALYSIS', 'Blood Sugar F', 'Complete Blood Count'])
+
+    def test_short_queries_and_junk_names(self):
+        self.assertEqual(self.autocomplete('ic'), [])
+        self.assertEqual(self.autocomplete('L'), ['Lipid Profile', 'BLOOD GAS ANALYSIS', 'Blood Sugar F', 'Complete Blood Count'])
+
+    def test_duplicate_names_are_returned_once(self):
+        Test.objects.create(name='Lipid Profile', price=200)
+        self.assertEqual(self.autocomplete('lipid'), ['Lipid Profile'])
+
+    def test_index_follows_catalog_changes(self):
+        self.assertEqual(self.autocomplete('thyroid'), [])
+        test = Test.objects.create(name='Thyroid Panel')
+        self.assertEqual(self.autocomplete('thyroid'), ['Thyroid Panel'])
+        test.delete()
+        self.assertEqual(self.autocomplete('thyroid'), [])
+
+    def test_index_follows_catalog_writes_from_other_processes(self):
+        self.assertEqual(self.autocomplete('thyroid'), [])
+        # Another worker or a management command: the rows and the shared version change, this process's cache does not
+        Test.objects.bulk_create([Test(name='Thyroid Panel')])
+        CatalogVersion.objects.update_or_create(pk=1, defaults={'version': 42})
+        self.assertEqual(self.autocomplete('thyroid'), [])
+        cache.delete(CATALOG_VERSION_KEY)  # What CATALOG_VERSION_TIMEOUT does
+        self.assertEqual(self.autocomplete('thyroid'), ['Thyroid Panel'])
+
+    def test_autocomplete_does_not_query_database_when_warm(self):
+        self.autocomplete('blood')
+        with self.assertNumQueries(0):
+            self.autocomplete('sugar')
+
+
+class SearchLabsTests(TestCase):
+    def setUp(self):
+        self.labs = [make_lab(f'Lab {index}') for index in range(5)]
+        for index in range(10):
+            test = Test.objects.create(name=f'Blood Test {index:02d}', price=500)
+            for lab in self.labs:
+                LabTestDetail.objects.create(lab=lab, test=test)
+
+    def search(self, **params):
+        return self.client.get(reverse('search_labs'), params).context
+
+    def test_query_count_does_not_grow_with_matches(self):
+        # Session/auth lookups aside: one count query and one page query
+        with self.assertNumQueries(2):
+            context = self.search(query='blood')
+        self.assertEqual(len(context['display_results']), SEARCH_RESULTS_PER_PAGE)
+        self.assertEqual(context['page_obj'].paginator.count, 50)
+
+    def test_results_are_paginated(self):
+        context = self.search(query='blood', page=3)
+        self.assertEqual(len(context['display_results']), 50 - 2 * SEARCH_RESULTS_PER_PAGE)
+        self.assertEqual(context['display_results'][-1]['test_name'], 'Blood Test 09')
+
+    def test_lab_specific_price_overrides_test_price(self):
+        LabTestDetail.objects.filter(lab=self.labs[0], test__name='Blood Test 00').update(lab_specific_price=350)
+        results = self.search(query='Blood Test 00')['display_results']
+        prices = {result['lab_name']: result['test_price'] for result in results}
+        self.assertEqual(prices['Lab 0'], 350)
+        self.assertEqual(prices['Lab 1'], 500)
+
+
+class SearchServiceTests(TestCase):
+    def setUp(self):
+        Test.objects.create(name='Thyroid Panel', description='TSH, T3 and T4 levels')
+        Test.objects.create(name='Vitamin D', description='Checked when fatigue comes with thyroid symptoms')
+        Test.objects.create(name='Lipid Profile', description='Cholesterol and triglycerides')
+        make_lab('City Diagnostics', city='Lalitpur')
+        make_lab('Kathmandu Pathology')
+
+    def names(self, queryset):
+        return [item.name for item in queryset]
+
+    def test_fts_is_installed_on_sqlite(self):
+        self.assertTrue(fts_available())
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.names(SearchService.search_tests('thyroid', match_all=False)), ['Thyroid Panel', 'Vitamin D'])
+
+    def test_chat_queries_ignore_filler_words(self):
+        self.assertEqual(self.names(SearchService.search_tests('what is the price of lipid test', match_all=False)), ['Lipid Profile'])
+        self.assertEqual(self.names(RAGService.retrieve_labs('find labs in lalitpur')), ['City Diagnostics'])
+
+    def test_index_tracks_updates_and_deletes(self):
+        Test.objects.filter(name='Lipid Profile').update(name='Cholesterol Panel')
+        self.assertEqual(self.names(SearchService.search_tests('lipid', columns=('name',))), [])
+        self.assertEqual(self.names(SearchService.search_tests('cholest', columns=('name',))), ['Cholesterol Panel'])
+        Test.objects.filter(name='Cholesterol Panel').delete()
+        self.assertEqual(self.names(SearchService.search_tests('cholesterol')), [])
+
+    def test_match_runs_once_per_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.names(SearchService.search_tests('thyroid', match_all=False)), ['Thyroid Panel', 'Vitamin D'])
+        self.assertEqual(queries[0]['sql'].count('MATCH'), 1)
+
+    def test_short_fragments_use_like(self):
+        Test.objects.create(name='CBC')
+        self.assertEqual(self.names(SearchService.search_tests('bc', columns=('name',))), ['CBC'])
+
+    @mock.patch('lab_suggestion.search_service.fts_available', return_value=False)
+    def test_like_fallback_without_fts(self, _):
+        self.assertEqual(set(self.names(SearchService.search_tests('thyroid', match_all=False))), {'Thyroid Panel', 'Vitamin D'})
+        self.assertEqual(self.names(SearchService.search_tests('pane', columns=('name',))), ['Thyroid Panel'])
+        self.assertEqual(self.names(RAGService.retrieve_labs('lalitpur')), ['City Diagnostics'])
+
+
+class JunkFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_classifier(self):
+        for name in ['ICU', 'Cabin Bed', 'AMBULANCE CHARG', 'post anesthesia bed', 'x', ' ']:
+            self.assertTrue(is_junk_test_name(name), name)
+        for name in ['Complete Blood Count', 'Urine Vesicular Cells', 'Bedside Glucose', 'X-Ray Chest']:
+            self.assertFalse(is_junk_test_name(name), name)
+
+    def test_charge_words_only_mark_exact_junk_names(self):
+        for name in ['Transplant Room', 'VENTILATOR CHARGE', 'Observation Bed']:
+            self.assertTrue(is_junk_test_name(name), name)
+        for name in ['Transplant Panel', 'Kidney Transplant Profile', 'Observation Urine Culture', 'Sample Collection Charge']:
+            self.assertFalse(is_junk_test_name(name), name)
+
+    def test_flag_is_set_on_save(self):
+        test = Test.objects.create(name='Observation Bed', price=1500)
+        self.assertTrue(test.is_junk)
+        test.name = 'Thyroid Panel'
+        test.save(update_fields=['name'])
+        test.refresh_from_db()
+        self.assertFalse(test.is_junk)
+
+    def test_backfill_command_fixes_bulk_writes(self):
+        test = Test.objects.create(name='Lipid Profile')
+        Test.objects.filter(id=test.id).update(name='Ventilator Charge')
+        call_command('backfill_junk_flags', stdout=mock.Mock())
+        test.refresh_from_db()
+        self.assertTrue(test.is_junk)
+
+    def test_homepage_hides_junk_tests(self):
+        Test.objects.create(name='ICU', price=10)
+        Test.objects.create(name='Lipid Profile', price=900)
+        popular = self.client.get(reverse('index')).context['popular_tests']
+        self.assertEqual([test['name'] for test in popular], ['Lipid Profile'])
+
+
+class HomepagePopularTestsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for index in range(6):
+            Test.objects.create(name=f'Panel {index}', price=100 + index)
+
+    def test_warm_homepage_does_no_queries(self):
+        self.client.get(reverse('index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Panel 0')
+
+    def test_snapshot_refreshes_after_catalog_change(self):
+        self.client.get(reverse('index'))
+        Test.objects.create(name='Cheapest Panel', price=5)
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['popular_tests'][0]['name'], 'Cheapest Panel')
+        self.assertContains(response, 'Cheapest Panel')
+
+    def test_falls_back_to_unpriced_tests(self):
+        Test.objects.update(price=None)
+        cache.clear()
+        popular = self.client.get(reverse('index')).context['popular_tests']
+        self.assertEqual(len(popular), 6)
+
+
+class RAGServiceRetrievalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Test.objects.create(name='Complete Blood Count', description='CBC with differential', price=400)
+        Test.objects.create(name='Blood Sugar F', description='Fasting glucose', price=150)
+        Test.objects.create(name='Thyroid Panel', description='TSH, T3 and T4', price=900)
+        Test.objects.create(name='Salt Balance Panel', price=50)
+        Test.objects.create(name='ALT (SGPT)', price=None)
+        Test.objects.create(name='ICU Bed', price=10)
+
+    def names(self, queryset):
+        return [test.name for test in queryset]
+
+    def test_each_retrieval_is_a_single_query_when_warm(self):
+        RAGService.retrieve_tests('blood')
+        with self.assertNumQueries(1):
+            self.names(RAGService.retrieve_tests('blood sugar'))
+        with self.assertNumQueries(1):
+            self.names(RAGService.retrieve_tests_by_price('what is the price of thyroid test'))
+        with self.assertNumQueries(1):
+            self.names(RAGService.retrieve_tests_for_symptoms('I feel tired all the time'))
+
+    def test_tests_matching_more_terms_rank_first(self):
+        self.assertEqual(self.names(RAGService.retrieve_tests('blood sugar')), ['Blood Sugar F', 'Complete Blood Count'])
+
+    def test_name_matches_outrank_description_matches(self):
+        Test.objects.create(name='Glucose Tolerance', description='Two hour sugar curve', price=300)
+        self.assertEqual(self.names(RAGService.retrieve_tests('glucose')), ['Glucose Tolerance', 'Blood Sugar F'])
+
+    def test_pruned_ranking_matches_exhaustive_scoring(self):
+        index = KeywordIndex(synthetic_catalog(3000))
+        for terms in (['blood', 'kalo'], ['serum'], ['glucose', 'fasting', 'sugar'], ['thyro', 'panel']):
+            scores = {}
+            for docs, impacts, _ in map(index._term_postings, terms):
+                for doc, impact in zip(docs, impacts):
+                    scores[doc] = scores.get(doc, 0.0) + impact
+            expected = sorted(scores, key=lambda doc: (-scores[doc], doc))[:10]
+            self.assertEqual(index.rank(terms, 10), [index.test_ids[doc] for doc in expected])
+
+    def test_keywords_match_word_starts_only(self):
+        # 'alt' must not match 'Salt', which a substring search would
+        self.assertEqual(self.names(RAGService.retrieve_tests_for_symptoms('jaundice')), ['ALT (SGPT)'])
+
+    def test_price_retrieval_skips_unpriced_and_junk_tests(self):
+        cheapest = ['Salt Balance Panel', 'Blood Sugar F', 'Complete Blood Count', 'Thyroid Panel']
+        self.assertEqual(self.names(RAGService.retrieve_tests_by_price('liver test price')), cheapest)
+        self.assertEqual(self.names(RAGService.retrieve_tests_by_price('blood test cost')), ['Complete Blood Count', 'Blood Sugar F'])
+
+
+class ChatbotServiceContextTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        make_lab('City Diagnostics')
+
+    def test_service_is_shared(self):
+        self.assertIs(AIChatbotService.instance(), AIChatbotService.instance())
+
+    def test_context_is_built_once_per_catalog_version(self):
+        chatbot = AIChatbotService()
+        self.assertEqual(chatbot.context['total_labs'], 1)
+        with self.assertNumQueries(0):
+            chatbot.context
+        make_lab('Kathmandu Pathology')
+        self.assertEqual(chatbot.context['total_labs'], 2)
+
+    def test_lab_offering_changes_invalidate_context(self):
+        chatbot = AIChatbotService()
+        lab = Lab.objects.get()
+        self.assertEqual(chatbot.context['total_tests'], 0)
+        Test.objects.bulk_create([Test(name='Lipid Profile')])  # No signal for bulk writes
+        lab.tests.add(Test.objects.get())
+        self.assertEqual(chatbot.context['total_tests'], 1)
+
+
+# The substring checks the chatbot ran before the intent matcher, in generate_response's order
+BASELINE_RESPONSE_KEYWORDS = [
+    ('booking', ['book', 'booking', 'want to book', 'can i book', 'i need to book', 'book test', 'book a test', 'schedule', 'appointment']),
+    ('greeting', ['hello', 'hi', 'hey', 'greetings']),
+    ('price', ['price', 'cost', 'expensive', 'cheap', 'affordable', 'how much']),
+    ('symptom', ['symptom', 'symptoms', 'feel', 'feeling', 'pain', 'recommend', 'suggest', 'should i take', 'what test']),
+    ('test', ['test', 'tests', 'lab test', 'what test', 'which test', 'do you have']),
+    ('lab', ['lab', 'labs', 'laboratory', 'where', 'location', 'find lab', 'near me']),
+    ('help', ['help', 'how', 'what can', 'what do', 'guide']),
+]
+BASELINE_BOOKING_KEYWORDS = ['book', 'reserve', 'schedule', 'appointment']
+BASELINE_DETAIL_KEYWORDS = ['my name is', 'i am', 'email:', 'email is', 'book for me', '@']
+BASELINE_HEALTH_KEYWORDS = [
+    'feel', 'pain', 'tired', 'fatigue', 'weak', 'fever', 'headache', 'worry', 'concern', 'symptom', 'problem', 'issue',
+    'sick', 'ill', 'disease', 'diabetes', 'heart', 'thyroid', 'liver', 'kidney', 'chest', 'stomach', 'blood pressure',
+]
+
+
+def baseline_routing(message):
+    lowered = message.lower()
+    primary = next((name for name, keywords in BASELINE_RESPONSE_KEYWORDS if any(word in lowered for word in keywords)), None)
+    return (
+        primary,
+        any(word in lowered for word in BASELINE_BOOKING_KEYWORDS),
+        any(word in lowered for word in BASELINE_DETAIL_KEYWORDS),
+        any(word in lowered for word in BASELINE_HEALTH_KEYWORDS) and '@' not in message,
+    )
+
+
+def matcher_routing(message):
+    intents = detect_intents(message)
+    return intents.primary, intents.is_booking_request, 'booking_details' in intents, intents.has_health_concern
+
+
+class IntentMatcherTests(SimpleTestCase):
+    def test_routes_baseline_messages_like_the_substring_checks(self):
+        messages = [
+            'Hello!', 'What is the price of CBC?', 'How much does a thyroid test cost?', 'I want to book a lipid profile',
+            'I feel tired and weak all the time', 'What tests do you have?', 'Can you recommend a test for fever?',
+            'My name is Ram Sharma, email: ram@example.com, phone 9841000000', 'Tomorrow at 10 am please',
+            'What can you do?', 'Is the liver function test available at City Lab?', 'show my bookings',
+            'my stomach feels bad', 'painful joints', 'pains in my back', 'I booked yesterday', 'Can I reserve a slot?',
+            'appointments on Monday', 'prices for vitamin d', 'costs of an x-ray', 'cheapest lipid profile',
+            'any recommendations?', 'suggestions please', 'Where is the laboratory?', 'I have been feeling feverish',
+            'I am worried about my heart', 'kidneys hurt', 'testing options', 'helpful guides', 'symptoms of anemia',
+            'chest problems and headaches', 'book for me, sita@example.com', 'Locations in Pokhara',
+        ]
+        for message in messages:
+            with self.subTest(message=message):
+                self.assertEqual(matcher_routing(message), baseline_routing(message))
+
+    def test_routes_like_the_response_chain(self):
+        self.assertEqual(detect_intents('I want to book a lab test').primary, 'booking')
+        self.assertEqual(detect_intents('How much is the thyroid test?').primary, 'price')
+        self.assertEqual(detect_intents('Which labs are near me?').primary, 'lab')
+        self.assertIsNone(detect_intents('Tomorrow at 10 am').primary)
+        self.assertEqual(detect_intents('Scheduling a visit for Friday').primary, 'booking')
+
+    def test_keywords_match_whole_words(self):
+        self.assertNotIn('greeting', detect_intents('Is this open on Sunday?'))
+        self.assertNotIn('health_concern', detect_intents('I will come tomorrow'))
+        self.assertIn('health_concern', detect_intents('I have high blood   pressure'))
+
+    def test_overlapping_keywords_are_all_found(self):
+        intents = detect_intents('how much for a lab test')
+        self.assertEqual(intents.names, {'price', 'help', 'lab', 'test'})
+
+    def test_booking_details(self):
+        intents = detect_intents('My name is Sita, email: sita@example.com')
+        self.assertIn('booking_details', intents)
+        self.assertIn('introduction', intents)
+        self.assertTrue(intents.has_email)
+        self.assertFalse(detect_intents('I feel sick, sita@example.com').has_health_concern)
+
+
+@override_settings(CHAT_LOG_WRITE_BEHIND=False)
+class ChatbotTestDetectionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for name in ['Blood Sugar', 'Blood Sugar Fasting', 'Lipid Profile', 'Thyroid Panel', 'ICU BED CHARGE']:
+            Test.objects.create(name=name)
+
+    def detect(self, message):
+        cache.delete('booking_test_s1')
+        self.client.post(reverse('chatbot_api'), {'message': message, 'session_id': 's1'}, content_type='application/json')
+        return cache.get('booking_test_s1')
+
+    def test_longest_mentioned_name_wins(self):
+        names = test_name_index.get()
+        self.assertEqual(names.find_in('Price of BLOOD SUGAR FASTING please')['name'], 'Blood Sugar Fasting')
+        self.assertEqual(names.find_in('is blood sugar cheap?')['name'], 'Blood Sugar')
+        self.assertIsNone(names.find_in('book an icu bed charge'))
+
+    def test_chatbot_detects_mentioned_and_partial_names(self):
+        self.assertEqual(self.detect('I want the lipid profile'), 'Lipid Profile')
+        self.assertEqual(self.detect('book thyroid'), 'Thyroid Panel')
+        self.assertIsNone(self.detect('hello'))
+
+    def test_detection_follows_catalog_changes(self):
+        Test.objects.create(name='Vitamin D3')
+        self.assertEqual(self.detect('is vitamin d3 available?'), 'Vitamin D3')
+
+
+class LabOfferingsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.labs = [make_lab(name) for name in ['City Diagnostics', 'Kathmandu Pathology', 'Valley Lab']]
+
+    def add_tests(self, count):
+        for number in range(count):
+            test = Test.objects.create(name=f'Blood Panel {number}', price=500 + number)
+            for lab in self.labs[:number % 3 + 1]:
+                LabTestDetail.objects.create(lab=lab, test=test)
+
+    def handler_queries(self):
+        chatbot = AIChatbotService()
+        chatbot._handle_test_query('blood panel')
+        with CaptureQueriesContext(connection) as queries:
+            chatbot._handle_test_query('blood panel')
+        return len(queries)
+
+    def test_labs_listed_in_lab_order_without_duplicates(self):
+        self.add_tests(3)
+        test = Test.objects.get(name='Blood Panel 2')
+        LabTestDetail.objects.create(lab=self.labs[0], test=test)
+        self.assertEqual([lab.name for lab in labs_offering(test)], ['City Diagnostics', 'Kathmandu Pathology', 'Valley Lab'])
+        self.assertEqual(len(labs_offering(test, 2)), 2)
+
+    def test_answer_queries_do_not_grow_with_tests_shown(self):
+        self.add_tests(1)
+        one_test = self.handler_queries()
+        self.add_tests(6)
+        self.assertEqual(self.handler_queries(), one_test)
+
+
+@override_settings(CHAT_LOG_WRITE_BEHIND=False)
+class ChatbotStreamTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def post(self, url, message, session_id):
+        return self.async_client.post(
+            reverse(url), {'message': message, 'session_id': session_id}, content_type='application/json'
+        )
+
+    async def test_streams_the_same_reply_as_the_json_endpoint(self):
+        expected = json.loads((await self.post('chatbot_api', 'hello', 'sync')).content)
+        response = await self.post('chatbot_stream_api', 'hello', 'stream')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        events = []
+        for frame in body.strip().split('\n\n'):
+            event, data = frame.split('\n')
+            events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+
+        self.assertEqual(events[0], ('start', {'session_id': 'stream'}))
+        self.assertEqual(events[-1][0], 'done')
+        self.assertEqual(events[-1][1]['suggestions'], expected['suggestions'])
+        reply = ''.join(data['text'] for event, data in events if event == 'chunk')
+        self.assertEqual(reply, expected['response'])
+        self.assertTrue(await ChatMessage.objects.filter(session_id='stream', bot_response=reply).aexists())
+
+    async def test_rejects_empty_messages(self):
+        response = await self.post('chatbot_stream_api', '  ', 'stream')
+        self.assertEqual(response.status_code, 400)
+
+    async def test_rejects_malformed_bodies(self):
+        for body in ('[]', '"hi"', '{"message": null}', '{"message": 5}', '{"message": "hi", "session_id": 5}', 'not json'):
+            for url in ('chatbot_api', 'chatbot_stream_api'):
+                with self.subTest(body=body, url=url):
+                    response = await self.async_client.post(reverse(url), body, content_type='application/json')
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn('error', json.loads(response.content))
+
+
+class ChatLogWriterTests(TestCase):
+    def message(self, number):
+        return ChatMessage(session_id='s1', user_message=f'question {number}', bot_response='answer')
+
+    def test_full_batch_wakes_the_writer(self):
+        writer = ChatLogWriter(batch_size=3, flush_interval=3600)
+        with mock.patch.object(ChatLogWriter, '_run'):
+            writer.add(self.message(1))
+            writer.add(self.message(2))
+            self.assertFalse(writer._wakeup.is_set())
+            writer.add(self.message(3))
+            self.assertTrue(writer._wakeup.is_set())
+        self.assertFalse(ChatMessage.objects.exists())
+        with self.assertNumQueries(1):
+            self.assertEqual(writer.flush(), 3)
+        self.assertEqual(ChatMessage.objects.count(), 3)
+
+    def test_writer_flushes_on_its_interval(self):
+        writer = ChatLogWriter(batch_size=100, flush_interval=0.01)
+        flushed = threading.Event()
+        with mock.patch.object(writer, 'flush', side_effect=flushed.set):
+            self.addCleanup(writer.close)
+            writer.add(self.message(1))
+            self.assertTrue(flushed.wait(5))
+            writer.close()
+        self.assertFalse(writer._thread.is_alive())
+
+    def test_failed_save_is_requeued_and_retried(self):
+        writer = ChatLogWriter(batch_size=10, flush_interval=0.01)
+        with mock.patch.object(ChatLogWriter, '_run'):
+            writer.add(self.message(1))
+            writer.add(self.message(2))
+        with mock.patch.object(ChatMessage.objects, 'bulk_create', side_effect=OperationalError('database is locked')), \
+                self.assertLogs('lab_suggestion.chat_log', 'WARNING'):
+            self.assertEqual(writer.flush(), 0)
+        self.assertEqual(len(writer._pending), 2)
+        self.assertGreater(writer.retry_delay(), writer.flush_interval)
+        writer.add(self.message(3))
+        self.assertEqual(writer.flush(), 3)
+        self.assertEqual(list(ChatMessage.objects.values_list('user_message', flat=True).order_by('id')),
+                         ['question 1', 'question 2', 'question 3'])
+
+    def test_batch_is_dropped_after_max_attempts(self):
+        writer = ChatLogWriter(batch_size=10, flush_interval=0.01, max_attempts=3)
+        with mock.patch.object(ChatLogWriter, '_run'):
+            writer.add(self.message(1))
+        with mock.patch.object(ChatMessage.objects, 'bulk_create', side_effect=OperationalError('database is locked')), \
+                self.assertLogs('lab_suggestion.chat_log', 'WARNING') as logs:
+            for attempt in range(2):
+                writer.flush()
+                self.assertEqual(len(writer._pending), 1)
+            writer.flush()
+        self.assertIn('Dropping 1 chat messages after 3 failed saves', logs.output[-1])
+        self.assertEqual(writer._pending, [])
+
+    def test_messages_added_after_close_are_saved_immediately(self):
+        writer = ChatLogWriter(batch_size=10, flush_interval=3600)
+        writer.close()
+        writer.add(self.message(1))
+        self.assertIsNone(writer._thread)
+        self.assertEqual(ChatMessage.objects.count(), 1)
+
+    @override_settings(CHAT_LOG_WRITE_BEHIND=False)
+    def test_synchronous_setting_saves_immediately(self):
+        message = record_chat_message('s1', 'hello', 'hi there')
+        self.assertTrue(ChatMessage.objects.filter(pk=message.pk).exists())
+
+
+class ChatbotResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        make_lab('City Diagnostics')
+        Test.objects.create(name='Lipid Profile', price=900)
+        self.chatbot = AIChatbotService()
+
+    def test_repeated_questions_skip_retrieval(self):
+        answer = self.chatbot.generate_response('How much is the lipid profile?')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.chatbot.generate_response('how much is the  LIPID profile'), answer)
+        self.assertEqual(self.chatbot.responses.stats()['hits'], 1)
+
+    def test_booking_answers_are_not_cached(self):
+        self.chatbot.generate_response('Book lipid profile')
+        self.chatbot.generate_response('Book lipid profile')
+        self.assertEqual(self.chatbot.responses.stats()['hits'] + self.chatbot.responses.stats()['misses'], 0)
+
+    def test_catalog_changes_drop_cached_answers(self):
+        self.chatbot.generate_response('How much is the lipid profile?')
+        test = Test.objects.get(name='Lipid Profile')
+        test.price = 750
+        test.save()
+        response, _ = self.chatbot.generate_response('How much is the lipid profile?')
+        self.assertIn('750', response)
+        self.assertEqual(self.chatbot.responses.stats()['misses'], 2)
+
+    def test_least_recently_used_answer_is_evicted(self):
+        responses = ResponseCache(max_size=2)
+        for key in ['a', 'b', 'a', 'c']:
+            responses.get_or_build(key, lambda: key.upper())
+        self.assertEqual(list(responses._entries), ['a', 'c'])
+        self.assertEqual(responses.stats(), {'hits': 1, 'misses': 3, 'size': 2, 'max_size': 2})
+
+
+class SymptomRecommendationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for name in ['Blood Sugar Fasting', 'AST (SGOT)', 'Liver Function Test', 'Cardiac Troponin', 'Lipid Profile', 'ICU CHARGE']:
+            Test.objects.create(name=name)
+
+    def names(self, symptoms):
+        return list(Test.objects.filter(id__in=recommend_test_ids(symptoms)).order_by('id').values_list('name', flat=True))
+
+    def test_matched_groups_recommend_their_tests(self):
+        self.assertEqual(self.names('My eyes look yellow'), ['AST (SGOT)', 'Liver Function Test'])
+        self.assertEqual(self.names('chest pain and high cholesterol'), ['Cardiac Troponin', 'Lipid Profile'])
+
+    def test_unmatched_symptoms_fall_back_to_popular_tests(self):
+        self.assertEqual(self.names('headache'), ['Blood Sugar Fasting', 'Lipid Profile'])
+
+    def test_recommendation_is_a_lookup_when_warm(self):
+        recommend_test_ids('tired')
+        with self.assertNumQueries(0):
+            recommend_test_ids('always thirsty')
+
+    def test_view_saves_recommended_tests(self):
+        response = self.client.post(reverse('ai_recommendations'), {'symptoms': 'chest pain'})
+        self.assertEqual([test.name for test in response.context['recommended_tests']], ['Cardiac Troponin'])
+
+
+class RecommendationReuseTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Test.objects.create(name='Cardiac Troponin')
+
+    def test_identical_symptoms_reuse_one_row(self):
+        first = AIRecommendationService.recommend_tests('Chest pain!')
+        with self.assertNumQueries(0):
+            second = AIRecommendationService.recommend_tests('  chest   PAIN ')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(AIRecommendation.objects.count(), 1)
+
+    def test_rows_are_reused_after_the_cache_is_lost(self):
+        first = AIRecommendationService.recommend_tests('chest pain')
+        cache.delete(recommendation_cache_key(None, first.symptoms_hash))
+        self.assertEqual(AIRecommendationService.recommend_tests('chest pain').pk, first.pk)
+
+    def test_users_and_catalog_versions_get_their_own_rows(self):
+        user = User.objects.create(username='patient')
+        anonymous = AIRecommendationService.recommend_tests('chest pain')
+        self.assertNotEqual(AIRecommendationService.recommend_tests('chest pain', user=user).pk, anonymous.pk)
+        Test.objects.create(name='Cardiac Enzymes')
+        refreshed = AIRecommendationService.recommend_tests('chest pain')
+        self.assertNotEqual(refreshed.pk, anonymous.pk)
+        self.assertEqual(refreshed.recommended_tests.count(), 2)
+
+    def test_catalog_changes_that_keep_the_tests_reuse_the_row(self):
+        first = AIRecommendationService.recommend_tests('chest pain')
+        cache.delete(recommendation_cache_key(None, first.symptoms_hash))
+        bump_catalog_version()
+        self.assertEqual(AIRecommendationService.recommend_tests('chest pain').pk, first.pk)
+        self.assertEqual(AIRecommendation.objects.count(), 1)
+
+    def test_repeat_recommendation_reads_its_tests_without_queries(self):
+        AIRecommendationService.recommend_tests('chest pain')
+        with self.assertNumQueries(0):
+            recommendation = AIRecommendationService.recommend_tests('chest pain')
+            self.assertTrue(recommendation.recommended_tests.exists())
+            self.assertEqual([test.name for test in recommendation.recommended_tests.all()], ['Cardiac Troponin'])
+
+    def test_deleted_rows_are_not_served_from_cache(self):
+        AIRecommendationService.recommend_tests('chest pain').delete()
+        AIRecommendationService.recommend_tests('chest pain')
+        self.assertEqual(AIRecommendation.objects.count(), 1)
+
+
+class LabBookingsViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.lab = make_lab('City Diagnostics')
+        self.test = Test.objects.create(name='Lipid Profile')
+        self.day = datetime.datetime(2026, 3, 2, tzinfo=datetime.timezone.utc)
+        self.client.force_login(self.lab.user)
+
+    def book(self, hour, status='booked', lab=None, day_offset=0):
+        return TestBooking.objects.create(
+            test=self.test, lab=lab or self.lab, email='patient@example.com', status=status,
+            booking_date=self.day + datetime.timedelta(days=day_offset, hours=hour),
+        )
+
+    def bookings(self, **params):
+        response = self.client.get(reverse('view_lab_bookings'), {'filter_date': '2026-03-02', **params})
+        return response.context
+
+    def test_lists_one_day_filtered_and_sorted_in_sql(self):
+        late, early = self.book(15), self.book(9)
+        self.book(11, status='cancelled')
+        self.book(10, day_offset=1)
+        self.book(12, lab=make_lab('Other Lab'))
+        self.assertEqual(self.bookings(filter_status='booked')['bookings'], [early, late])
+        self.assertEqual(self.bookings(time_sort='desc', filter_status='booked')['bookings'], [late, early])
+
+    def test_query_count_does_not_grow_with_bookings(self):
+        self.book(9)
+        with CaptureQueriesContext(connection) as few:
+            self.bookings()
+        for hour in range(10, 20):
+            self.book(hour)
+        with CaptureQueriesContext(connection) as many:
+            self.bookings()
+        self.assertEqual(len(many), len(few))
+
+    def test_keyset_pages_walk_both_ways(self):
+        booked = [self.book(hour) for hour in (8, 9, 9, 10, 11)]
+        with mock.patch('lab_suggestion.views.BOOKINGS_PER_PAGE', 2):
+            first = self.bookings()
+            self.assertEqual(first['bookings'], booked[:2])
+            self.assertIsNone(first['previous_cursor'])
+            second = self.bookings(after=first['next_cursor'])
+            self.assertEqual(second['bookings'], booked[2:4])
+            last = self.bookings(after=second['next_cursor'])
+            self.assertEqual(last['bookings'], booked[4:])
+            self.assertIsNone(last['next_cursor'])
+            self.assertEqual(self.bookings(before=last['previous_cursor'])['bookings'], booked[2:4])
+            self.assertEqual(self.bookings(before=second['previous_cursor'])['bookings'], booked[:2])
+
+
+class BookingQueryPlanTests(TestCase):
+    BOOKINGS = 1_000_000
+    LABS = 50
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.labs = [make_lab(f'Lab {number}') for number in range(cls.LABS)]
+        test = Test.objects.create(name='Lipid Profile')
+        # Three years of bookings spread over every lab and status, generated inside SQLite
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH RECURSIVE seq(n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < %s)
+                INSERT INTO {TestBooking._meta.db_table}
+                    (booking_id, name, test_id, lab_id, email, booking_date, booked_at, status, notes)
+                SELECT 'BENCH-' || n, 'Patient', %s, %s + n %% %s, 'patient@example.com',
+                       datetime('2024-01-01', '+' || (n * 97 %% 1576800) || ' minutes'), datetime('now'),
+                       CASE n %% 4 WHEN 0 THEN 'booked' WHEN 1 THEN 'test_done'
+                                   WHEN 2 THEN 'not_arrived' ELSE 'cancelled' END,
+                       NULL
+                FROM seq
+                """,
+                [cls.BOOKINGS - 1, test.id, cls.labs[0].id, cls.LABS],
+            )
+            cursor.execute('ANALYZE')
+
+    def plan(self, bookings):
+        return bookings.order_by('booking_date', 'id')[:51].explain()
+
+    def test_day_listing_uses_lab_date_index(self):
+        plan = self.plan(_lab_bookings_on(self.labs[7], datetime.date(2025, 6, 1)))
+        self.assertIn('lab_suggest_lab_id_f8d6db_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_reminder_scan_uses_partial_index(self):
+        now = timezone.make_aware(datetime.datetime(2025, 6, 1, 8))
+        plan = due_reminders(now, 24).order_by('booking_date').values_list('id', flat=True)[:500].explain()
+        self.assertIn('booking_reminder_due_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_status_listing_uses_lab_status_date_index(self):
+        plan = self.plan(_lab_bookings_on(self.labs[7], datetime.date(2025, 6, 1), 'cancelled'))
+        self.assertIn('lab_suggest_lab_id_b2ff3c_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class BookingSlotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.lab = make_lab('City Diagnostics')
+        self.test = Test.objects.create(name='Lipid Profile', price=800)
+        LabTestDetail.objects.create(lab=self.lab, test=self.test, slots_per_hour=2)
+        self.hour = timezone.make_aware(datetime.datetime(2030, 3, 4, 9))
+
+    def book(self, minute=0, **fields):
+        return save_booking(TestBooking(
+            name='Patient', email='patient@example.com', test=self.test, lab=self.lab,
+            booking_date=self.hour + datetime.timedelta(minutes=minute), **fields,
+        ))
+
+    def booked(self, starts_at=None):
+        slot = BookingSlot.objects.get(lab=self.lab, test=self.test, starts_at=starts_at or self.hour)
+        return slot.booked
+
+    def test_slot_takes_the_labs_capacity_then_refuses(self):
+        self.book(0)
+        self.book(45)
+        with self.assertRaises(SlotFull):
+            self.book(30)
+        self.assertEqual(TestBooking.objects.count(), 2)
+        self.assertEqual(self.booked(), 2)
+        # The next hour is a new slot
+        self.book(60)
+        self.assertEqual(self.booked(self.hour + datetime.timedelta(hours=1)), 1)
+
+    @override_settings(BOOKING_SLOTS_PER_HOUR=1)
+    def test_tests_without_their_own_capacity_use_the_default(self):
+        other = Test.objects.create(name='Thyroid Profile')
+        save_booking(TestBooking(name='Patient', email='patient@example.com', test=other, lab=self.lab, booking_date=self.hour))
+        with self.assertRaises(SlotFull):
+            save_booking(TestBooking(name='Patient', email='patient@example.com', test=other, lab=self.lab, booking_date=self.hour))
+
+    def test_cancelling_and_rescheduling_move_the_reservation(self):
+        first = self.book(0)
+        second = self.book(15)
+        held = held_slot(first)
+        first.status = 'cancelled'
+        save_booking(first, held)
+        self.assertEqual(self.booked(), 1)
+
+        held = held_slot(second)
+        second.booking_date = self.hour + datetime.timedelta(hours=2)
+        save_booking(second, held)
+        self.assertEqual(self.booked(), 0)
+        self.assertEqual(self.booked(slot_start(second.booking_date)), 1)
+
+        # A status change within the same slot keeps its place
+        held = held_slot(second)
+        second.status = 'test_done'
+        with self.assertNumQueries(1):
+            save_booking(second, held)
+
+    def test_deleting_a_booking_frees_its_place(self):
+        first = self.book(0)
+        self.book(15)
+        first.delete()
+        self.assertEqual(self.booked(), 1)
+        TestBooking.objects.all().delete()
+        self.assertEqual(self.booked(), 0)
+
+    def test_book_test_view_reports_a_full_slot(self):
+        self.book(0)
+        self.book(5)
+        response = self.client.post(reverse('book_test', args=[self.test.id, self.lab.id]), {
+            'name': 'Late Patient', 'email': 'late@example.com', 'booking_date': '2030-03-04T09:30',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('fully booked', response.context['form'].errors['booking_date'][0])
+        self.assertFalse(TestBooking.objects.filter(email='late@example.com').exists())
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    THREADS = 8
+    ATTEMPTS_PER_THREAD = 50
+    HOURS = 4
+    CAPACITY = 30
+
+    def test_concurrent_bookings_never_overfill_a_slot(self):
+        lab = make_lab('City Diagnostics')
+        test = Test.objects.create(name='Lipid Profile')
+        LabTestDetail.objects.create(lab=lab, test=test, slots_per_hour=self.CAPACITY)
+        first_hour = timezone.make_aware(datetime.datetime(2030, 3, 4, 9))
+        start = threading.Barrier(self.THREADS)
+        outcomes = []
+
+        def book(worker):
+            start.wait()
+            try:
+                for attempt in range(self.ATTEMPTS_PER_THREAD):
+                    booking = TestBooking(
+                        name=f'Patient {worker}-{attempt}', email='patient@example.com', test=test, lab=lab,
+                        booking_date=first_hour + datetime.timedelta(hours=attempt % self.HOURS, minutes=worker),
+                    )
+                    try:
+                        save_booking(booking)
+                        outcomes.append('booked')
+                    except SlotFull:
+                        outcomes.append('full')
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=book, args=(worker,)) for worker in range(self.THREADS)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        # Every attempt either booked or was refused; none failed, and no hour took more than its capacity
+        self.assertEqual(len(outcomes), self.THREADS * self.ATTEMPTS_PER_THREAD)
+        self.assertEqual(outcomes.count('booked'), self.HOURS * self.CAPACITY)
+        for slot in BookingSlot.objects.all():
+            bookings = TestBooking.objects.filter(
+                lab=lab, test=test, booking_date__gte=slot.starts_at,
+                booking_date__lt=slot.starts_at + datetime.timedelta(hours=1),
+            ).count()
+            self.assertEqual(slot.booked, self.CAPACITY)
+            self.assertEqual(bookings, self.CAPACITY)
+        # Booking ids are numbered without gaps or repeats, however the bookings interleaved
+        booking_ids = sorted(TestBooking.objects.values_list('booking_id', flat=True))
+        self.assertEqual(booking_ids, [
+            f'LAB{lab.id}-TST{test.id}-{booking_code(number)}' for number in range(1, self.HOURS * self.CAPACITY + 1)
+        ])
+
+
+class BookingIdTests(TestCase):
+    def setUp(self):
+        self.lab = make_lab('City Diagnostics')
+        self.test = Test.objects.create(name='Lipid Profile')
+
+    def test_booking_ids_count_up_per_lab_and_test(self):
+        other_test = Test.objects.create(name='Thyroid Profile')
+        booking_ids = [TestBooking(lab_id=self.lab.id, test_id=self.test.id).generate_booking_id() for _ in range(3)]
+        prefix = f'LAB{self.lab.id}-TST{self.test.id}-'
+        self.assertEqual(booking_ids, [f'{prefix}0001', f'{prefix}0002', f'{prefix}0003'])
+        self.assertEqual(
+            TestBooking(lab_id=self.lab.id, test_id=other_test.id).generate_booking_id(),
+            f'LAB{self.lab.id}-TST{other_test.id}-0001',
+        )
+
+    def test_codes_sort_in_booking_order(self):
+        codes = [booking_code(number) for number in (1, 35, 36, 1295, 1296, 36 ** 4 - 1)]
+        self.assertEqual(codes, sorted(codes))
+        self.assertEqual(booking_code(36 ** 4 - 1), 'ZZZZ')
+
+    def test_rolled_back_booking_gives_its_number_back(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TestBooking(lab_id=self.lab.id, test_id=self.test.id).generate_booking_id()
+            raise IntegrityError()
+        booking_id = TestBooking(lab_id=self.lab.id, test_id=self.test.id).generate_booking_id()
+        self.assertTrue(booking_id.endswith('-0001'))
+
+
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.lab = make_lab('City Diagnostics')
+        self.test = Test.objects.create(name='Lipid Profile', price=800)
+
+    def test_booking_queues_the_confirmation_instead_of_sending_it(self):
+        response = self.client.post(reverse('book_test', args=[self.test.id, self.lab.id]), {
+            'name': 'Sita', 'email': 'sita@example.com', 'booking_date': '2030-03-04T09:30',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+        email = EmailOutbox.objects.get()
+        self.assertEqual((email.to, email.status), ('sita@example.com', 'pending'))
+        self.assertIn('Booking Confirmation - Lipid Profile at City Diagnostics', email.subject)
+
+        call_command('send_queued_emails', '--once', stdout=mock.Mock())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['sita@example.com'])
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('sent', 1))
+        self.assertIsNotNone(email.sent_at)
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2, EMAIL_OUTBOX_RETRY_SECONDS=60)
+    def test_failures_back_off_then_give_up(self):
+        email = queue_email('Reminder', 'See you tomorrow', 'sita@example.com')
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('connection refused')):
+            self.assertEqual(deliver_due_emails(), (0, 1))
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts, email.last_error), ('pending', 1, 'connection refused'))
+            self.assertGreater(email.next_attempt_at, timezone.now() + datetime.timedelta(seconds=50))
+            # Not due again until the backoff has passed
+            self.assertEqual(deliver_due_emails(), (0, 0))
+
+            EmailOutbox.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+            self.assertEqual(deliver_due_emails(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('failed', 2))
+        self.assertEqual(mail.outbox, [])
+
+    def test_claimed_emails_are_not_sent_twice(self):
+        queue_email('Reminder', 'See you tomorrow', 'sita@example.com')
+        # A second worker finds nothing due while the first one holds the claim
+        with mock.patch('lab_suggestion.outbox.record_sent'):
+            self.assertEqual(deliver_due_emails(), (1, 0))
+        self.assertEqual(deliver_due_emails(), (0, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+
+    def test_expired_claim_cannot_mark_the_new_claim_sent(self):
+        email = queue_email('Reminder', 'See you tomorrow', 'sita@example.com')
+        stale = claim_due_emails(10)
+        # The first worker's lease runs out and a second worker claims the email
+        EmailOutbox.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+        current = claim_due_emails(10)
+        record_sent(stale)
+        record_failure(stale[0], OSError('too late'))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.claim_token, email.last_error), ('pending', current[0].claim_token, ''))
+        record_sent(current)
+        email.refresh_from_db()
+        self.assertEqual(email.status, 'sent')
+
+    def test_booking_and_its_email_are_committed_together(self):
+        booking = TestBooking(name='Sita', email='sita@example.com', test=self.test, lab=self.lab,
+                              booking_date=timezone.now() + datetime.timedelta(days=1))
+        with mock.patch('lab_suggestion.email_utils.notification_renderer.render', side_effect=RuntimeError('bad template')), \
+                self.assertRaises(RuntimeError):
+            save_booking(booking, email='confirmation')
+        self.assertFalse(TestBooking.objects.exists())
+        self.assertFalse(BookingSlot.objects.filter(booked__gt=0).exists())
+        self.assertFalse(EmailOutbox.objects.exists())
+
+        save_booking(booking, email='confirmation')
+        self.assertEqual(EmailOutbox.objects.get().to, 'sita@example.com')
+
+
+class PooledMailerTests(TestCase):
+    def queue(self, count):
+        for number in range(count):
+            queue_email(f'Booking Updated {number}', 'Your test is done', f'patient{number}@example.com')
+
+    def test_batches_share_one_connection(self):
+        self.queue(5)
+        mailer = PooledMailer(idle_timeout=60)
+        self.assertEqual(deliver_due_emails(batch_size=3, mailer=mailer), (3, 0))
+        self.assertEqual(deliver_due_emails(batch_size=3, mailer=mailer), (2, 0))
+        self.assertEqual(mailer.connections_opened, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(EmailOutbox.objects.filter(status='sent').count(), 5)
+
+    def test_idle_connection_is_closed(self):
+        self.queue(1)
+        mailer = PooledMailer(idle_timeout=0)
+        deliver_due_emails(mailer=mailer)
+        self.assertIsNotNone(mailer.connection)
+        mailer.close_if_idle()
+        self.assertIsNone(mailer.connection)
+
+    def test_dropped_connection_is_reopened_once(self):
+        self.queue(2)
+        mailer = PooledMailer(idle_timeout=60)
+        deliver_due_emails(batch_size=1, mailer=mailer)
+        with mock.patch.object(mailer.connection, 'send_messages', side_effect=smtplib.SMTPServerDisconnected()):
+            # The stale connection fails; the message goes out on a fresh one
+            self.assertEqual(deliver_due_emails(mailer=mailer), (1, 0))
+        self.assertEqual(mailer.connections_opened, 2)
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class NotificationRendererTests(TestCase):
+    def setUp(self):
+        lab = make_lab('City Diagnostics')
+        test = Test.objects.create(name='Lipid Profile', description='Cholesterol and triglycerides', price=800)
+        self.booking = TestBooking.objects.create(
+            name='Sita', email='sita@example.com', test=test, lab=lab, notes='Fasting since 8 pm',
+            booking_date=timezone.make_aware(datetime.datetime(2030, 3, 4, 9, 30)),
+        )
+
+    def test_matches_rendering_each_template_separately(self):
+        from django.template.loader import render_to_string
+
+        renderer = NotificationRenderer()
+        for kind, (subject, name, action) in BOOKING_EMAILS.items():
+            context = {
+                'booking': self.booking, 'test': self.booking.test, 'lab': self.booking.lab,
+                'user_name': 'Sita', 'booking_id': self.booking.booking_id, 'action': action,
+            }
+            email = renderer.render(kind, self.booking)
+            self.assertEqual(email.subject, f'{subject} - Lipid Profile at City Diagnostics')
+            self.assertEqual(email.text, render_to_string(f'{name}.txt', context))
+            self.assertEqual(email.html, render_to_string(f'{name}.html', context))
+
+    def test_precompiled_templates_are_not_loaded_again(self):
+        renderer = NotificationRenderer()
+        renderer.precompile()
+        with mock.patch('lab_suggestion.email_utils.get_template') as get_template:
+            for kind in BOOKING_EMAILS:
+                renderer.render(kind, self.booking)
+        get_template.assert_not_called()
+
+    def test_templates_are_compiled_at_startup(self):
+        self.assertEqual(set(notification_renderer._templates), set(BOOKING_EMAILS))
+
+    def test_broken_template_is_logged_instead_of_stopping_startup(self):
+        with mock.patch.object(notification_renderer, 'precompile', side_effect=TemplateSyntaxError('bad tag')), \
+                self.assertLogs('lab_suggestion.apps', 'ERROR'):
+            apps.get_app_config('lab_suggestion').ready()
+
+
+class BookingReminderTests(TestCase):
+    def setUp(self):
+        self.lab = make_lab('City Diagnostics')
+        self.test = Test.objects.create(name='Lipid Profile', price=800)
+        self.now = timezone.make_aware(datetime.datetime(2030, 3, 4, 8))
+
+    def book(self, hours_ahead, status='booked', email='sita@example.com'):
+        return TestBooking.objects.create(
+            name='Sita', email=email, test=self.test, lab=self.lab, status=status,
+            booking_date=self.now + datetime.timedelta(hours=hours_ahead),
+        )
+
+    def test_reminds_upcoming_bookings_once(self):
+        due = [self.book(1), self.book(23)]
+        self.book(25)
+        self.book(-1)
+        self.book(2, status='cancelled')
+        self.assertEqual(queue_booking_reminders(hours=24, now=self.now), 2)
+        self.assertEqual(EmailOutbox.objects.count(), 2)
+        email = EmailOutbox.objects.first()
+        self.assertEqual(email.subject, 'Booking Reminder - Lipid Profile at City Diagnostics')
+        self.assertIn(due[0].booking_id, email.body)
+        self.assertEqual(
+            set(TestBooking.objects.filter(reminder_sent_at__isnull=False).values_list('id', flat=True)),
+            {booking.id for booking in due},
+        )
+        # Running again (e.g. the next minute) finds nothing left to remind
+        self.assertEqual(queue_booking_reminders(hours=24, now=self.now), 0)
+        self.assertEqual(EmailOutbox.objects.count(), 2)
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        for number in range(3):
+            self.book(1 + number, email=f'patient{number}@example.com')
+        with CaptureQueriesContext(connection) as small:
+            queue_booking_reminders(now=self.now)
+        for number in range(30):
+            self.book(1 + number % 20, email=f'patient{number}@example.com')
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(queue_booking_reminders(now=self.now), 30)
+        self.assertEqual(len(large), len(small))
+
+    def test_batch_that_fails_to_render_is_left_for_the_next_run(self):
+        booking = self.book(1)
+        with mock.patch('lab_suggestion.reminders.render_booking_emails', side_effect=RuntimeError('bad template')), \
+                self.assertRaises(RuntimeError):
+            queue_booking_reminders(now=self.now)
+        booking.refresh_from_db()
+        self.assertIsNone(booking.reminder_sent_at)
+        self.assertEqual(queue_booking_reminders(now=self.now), 1)
+
+    def test_batch_that_fails_to_queue_is_left_for_the_next_run(self):
+        booking = self.book(1)
+        with mock.patch('lab_suggestion.reminders.queue_emails', side_effect=OperationalError('disk full')), \
+                self.assertRaises(OperationalError):
+            queue_booking_reminders(now=self.now)
+        booking.refresh_from_db()
+        self.assertIsNone(booking.reminder_sent_at)
+        self.assertEqual(queue_booking_reminders(now=self.now), 1)
+
+    def test_booking_claimed_by_another_run_is_not_queued_twice(self):
+        booking = self.book(1)
+        self.book(2)
+        def render_while_another_run_claims(kind, bookings):
+            # The other run marks the first booking while this one is still rendering
+            TestBooking.objects.filter(id=booking.id).update(reminder_sent_at=self.now)
+            return render_booking_emails(kind, bookings)
+
+        with mock.patch('lab_suggestion.reminders.render_booking_emails', side_effect=render_while_another_run_claims):
+            self.assertEqual(queue_booking_reminders(now=self.now), 1)
+        self.assertNotIn(booking.booking_id, EmailOutbox.objects.get().body)
+
+    def test_rescheduled_booking_is_reminded_again(self):
+        booking = self.book(1)
+        queue_booking_reminders(now=self.now)
+        self.client.post(reverse('update_booking', args=[booking.booking_id]), {
+            'name': 'Sita', 'email': 'sita@example.com', 'booking_date': '2030-03-05T10:00',
+        })
+        booking.refresh_from_db()
+        self.assertIsNone(booking.reminder_sent_at)
+
+
+PRICE_LIST_HEADER = [
+    'Lab Name', 'Address', 'City', 'State', 'Zip Code', 'Phone Number', 'Contact Email', 'Contact Phone',
+    'Test Name', 'Test Description', 'Test Price',
+]
+
+
+def price_list(rows, header=PRICE_LIST_HEADER):
+    import openpyxl
+
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def price_row(lab, test, price=500):
+    return [lab, 'Main Road', 'Kathmandu', 'Bagmati', '44600', '01-4000000', 'lab@example.com', '01-4000001', test, 'Routine test', price]
+
+
+class ExcelImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.admin)
+
+    def upload(self, workbook):
+        upload = SimpleUploadedFile('prices.xlsx', workbook.getvalue())
+        return self.client.post(reverse('admin_upload_excel'), {'excel_file': upload}, follow=True)
+
+    def test_upload_creates_labs_tests_and_links(self):
+        existing = Test.objects.create(name='Lipid Profile', price=800)
+        response = self.upload(price_list([
+            price_row('City Diagnostics', 'LIPID PROFILE'),
+            price_row('City Diagnostics', 'Thyroid Profile'),
+            price_row('Valley Labs', 'Thyroid Profile'),
+            price_row(None, 'Orphan Test'),
+            price_row('Valley Labs', 'Cabin Bed Charge'),
+        ]))
+        self.assertRedirects(response, reverse('admin_lab_list'))
+        city = Lab.objects.get(name='City Diagnostics')
+        valley = Lab.objects.get(name='Valley Labs')
+        thyroid = Test.objects.get(name='Thyroid Profile')
+        self.assertEqual(set(city.tests.all()), {existing, thyroid})
+        self.assertEqual(set(valley.tests.values_list('name', flat=True)), {'Thyroid Profile', 'Cabin Bed Charge'})
+        self.assertFalse(Test.objects.filter(name='Orphan Test').exists())
+        # Bulk-created tests still get their junk flag
+        self.assertTrue(Test.objects.get(name='Cabin Bed Charge').is_junk)
+        sent = [str(message) for message in response.context['messages']]
+        self.assertIn('Skipped 1 row(s) with no Lab Name: 5.', sent)
+        self.assertIn('Created 2 new test(s)', sent)
+
+    def test_missing_columns_are_reported(self):
+        response = self.upload(price_list([['City Diagnostics', 'Lipid Profile']], header=['Lab Name', 'Test Name']))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Missing one or more required columns', str(list(response.context['messages'])[0]))
+        self.assertFalse(Lab.objects.exists())
+
+    def test_reimporting_non_ascii_names_reuses_their_tests(self):
+        import_price_list(price_list([price_row('City Diagnostics', 'ÄBC Profile')]))
+        import_price_list(price_list([price_row('City Diagnostics', 'ÄBC Profile'), price_row('Valley Labs', 'äbc profile')]))
+        self.assertEqual(Test.objects.filter(name__in=['ÄBC Profile', 'äbc profile']).count(), 1)
+        self.assertEqual(Lab.objects.get(name='Valley Labs').tests.get().name, 'ÄBC Profile')
+
+    def test_committed_chunks_bump_the_catalog_version_when_a_later_chunk_fails(self):
+        import_chunk = PriceListImporter.import_chunk
+
+        def fail_after_first_chunk(importer, chunk):
+            if importer.summary.rows:
+                raise RuntimeError('disk full')
+            import_chunk(importer, chunk)
+
+        rows = [price_row('City Diagnostics', 'Thyroid Profile'), price_row('City Diagnostics', 'Lipid Profile')]
+        with mock.patch.object(PriceListImporter, 'import_chunk', fail_after_first_chunk), \
+                self.captureOnCommitCallbacks() as callbacks, self.assertRaises(RuntimeError):
+            import_price_list(price_list(rows), chunk_size=1)
+        self.assertIn(bump_catalog_version, callbacks)
+        self.assertTrue(Test.objects.filter(name='Thyroid Profile').exists())
+
+    def test_query_count_grows_per_chunk_not_per_row(self):
+        def queries(row_count):
+            rows = [price_row('City Diagnostics', f'Test {row_count}-{number}') for number in range(row_count)]
+            with CaptureQueriesContext(connection) as captured:
+                import_price_list(price_list(rows), chunk_size=1000)
+            return len(captured)
+
+        queries(1)  # Creates the lab
+        self.assertEqual(queries(10), queries(150))
@@ -25,6 +25,7 @@ urlpatterns = [
     path('lab/upload_tests_excel/', views.lab_upload_tests_excel, name='lab_upload_tests_excel'), # New URL for lab users
     # AI Features
     path('api/chatbot/', views.chatbot_api, name='chatbot_api'),
+    path('api/chatbot/stream/', views.chatbot_stream_api, name='chatbot_stream_api'),
     path('ai/recommendations/', views.ai_recommendations_view, name='ai_recommendations'),
     path('chatbot/history/', views.chatbot_history, name='chatbot_history'),
     # Test Booking Features
@@ -1,5 +1,5 @@
 from django.shortcuts import render, redirect
-from .models import Test, Lab, ContactMessage, ChatMessage, AIRecommendation, TestBooking
+from .models import Test, Lab, LabTestDetail, ContactMessage, ChatMessage, AIRecommendation, TestBooking
 from django.contrib.auth.decorators import user_passes_test, login_required
 from django.shortcuts import get_object_or_404
 from .forms import LabUserRegistrationForm, TestForm, ContactForm, LabForm, ExcelUploadForm, AdminLabEditForm, TestBookingForm
@@ -10,13 +10,29 @@ import openpyxl
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.models import User
 from django.forms import modelformset_factory # Import modelformset_factory
-from django.http import JsonResponse
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+import asyncio
+import datetime
 import json
 import uuid
+from asgiref.sync import sync_to_async
 from .ai_service import AIChatbotService, AIRecommendationService
-from .email_utils import send_booking_confirmation_email, send_booking_update_email, send_booking_cancellation_email
+from .chat_log import record_chat_message, arecord_chat_message
+from .catalog import get_catalog_version, get_popular_tests, POPULAR_TESTS_TIMEOUT
+from .intents import detect_intents
+from .offerings import lab_offerings
+from .search_index import autocomplete_tests, test_name_index
+from .excel_import import ExcelImportError, import_price_list
+from .search_service import SearchService
+from .slots import SlotFull, held_slot, save_booking
+
+SEARCH_RESULTS_PER_PAGE = 24
+BOOKINGS_PER_PAGE = 50
 
 def register(request):
     if request.method == 'POST':
@@ -30,23 +46,12 @@ def register(request):
 
 # Create your views here.
 def index(request):
-    # Get popular tests - prioritize tests with prices, limit to 8 for better display
-    # Filter out obviously invalid test names
-    valid_tests = Test.objects.exclude(
-        name__in=['a', 'u', 'z', 'x', 'acer', 'xray', 'ICU', 'BED', 'SSCU',
-                  'AMBULANCE CHARG', 'VENTILATOR CHARGE', 'CABIN BED', 'OBSERVATION BED',
-                  'POST ANESTHESIA BED', 'TRANSPLANT ROOM', 'TRIPLE BED']
-    ).filter(price__isnull=False).order_by('price')[:8]
-    
-    if valid_tests.count() < 4:
-        # Fallback to any valid tests if not enough with prices
-        valid_tests = Test.objects.exclude(
-            name__in=['a', 'u', 'z', 'x', 'acer', 'xray', 'ICU', 'BED', 'SSCU',
-                      'AMBULANCE CHARG', 'VENTILATOR CHARGE', 'CABIN BED', 'OBSERVATION BED',
-                      'POST ANESTHESIA BED', 'TRANSPLANT ROOM', 'TRIPLE BED']
-        )[:8]
-    
-    return render(request, 'index.html', {'popular_tests': valid_tests})
+    # Popular tests come from a cached snapshot; the rendered cards are fragment-cached per catalog version
+    return render(request, 'index.html', {
+        'popular_tests': get_popular_tests(),
+        'catalog_version': get_catalog_version(),
+        'popular_tests_timeout': POPULAR_TESTS_TIMEOUT,
+    })
 
 
 @require_http_methods(["GET"])
@@ -57,31 +62,16 @@ def search_tests_autocomplete(request):
     if not query or len(query) < 1:
         return JsonResponse({'results': []})
     
-    # Define junk test names to exclude
-    junk_tests = ['a', 'u', 'z', 'x', 'acer', 'xray', 'ICU', 'BED', 'SSCU',
-                  'AMBULANCE CHARG', 'VENTILATOR CHARGE', 'CABIN BED', 'OBSERVATION BED',
-                  'POST ANESTHESIA BED', 'TRANSPLANT ROOM', 'TRIPLE BED', 'VENTIL']
-    
-    # Search for tests matching the query (case-insensitive)
-    # Filter out junk tests
-    tests = Test.objects.filter(
-        name__icontains=query
-    ).exclude(
-        name__in=junk_tests
-    )[:20]
-    
-    # Remove duplicates by using a dictionary with test name as key
-    seen_names = {}
-    for test in tests:
-        if test.name not in seen_names:
-            seen_names[test.name] = {
-                'id': test.id,
-                'name': test.name,
-                'price': float(test.price) if test.price else None,
-                'description': test.description
-            }
-    
-    results = list(seen_names.values())
+    # Served from the in-memory name index (junk names excluded, deduped by name)
+    results = [
+        {
+            'id': test['id'],
+            'name': test['name'],
+            'price': float(test['price']) if test['price'] else None,
+            'description': test['description']
+        }
+        for test in autocomplete_tests(query)
+    ]
     return JsonResponse({'results': results})
 
 def lab_login_view(request):
@@ -201,43 +191,36 @@ def contact_page(request):
 
 def search_labs(request):
     query = request.GET.get('query')
-    print(f"Search query received: {query}")
     display_results = [] # This will store a list of dictionaries, each representing a test-lab pair
+    page_obj = None
 
     if query:
-        # Define junk test names to exclude
-        junk_tests = ['a', 'u', 'z', 'x', 'acer', 'xray', 'ICU', 'BED', 'SSCU',
-                      'AMBULANCE CHARG', 'VENTILATOR CHARGE', 'CABIN BED', 'OBSERVATION BED',
-                      'POST ANESTHESIA BED', 'TRANSPLANT ROOM', 'TRIPLE BED', 'VENTIL']
-        
-        # Find tests that match the query (case-insensitive)
-        # Filter out junk tests
-        matching_tests = Test.objects.filter(
-            name__icontains=query
-        ).exclude(
-            name__in=junk_tests
-        )
-        print(f"Matching tests found: {matching_tests}")
-
-        for test in matching_tests:
-            # For each test, find all labs that offer it
-            labs_offering_test = test.lab_set.all()
-            print(f"Labs offering test '{test.name}': {labs_offering_test}")
-
-            for lab in labs_offering_test:
-                display_results.append({
-                    'test_id': test.id,
-                    'test_name': test.name,
-                    'test_description': test.description,
-                    'test_price': test.price,
-                    'lab_id': lab.id,
-                    'lab_name': lab.name,
-                    'lab_address': lab.address,
-                    'lab_contact_email': lab.contact_email,
-                    'lab_contact_phone': lab.contact_phone,
-                })
+        # One joined query over the lab/test pairs instead of a lab query per matching test
+        matching_tests = SearchService.search_tests(query, columns=('name',)).values('id')
+        offerings = LabTestDetail.objects.filter(
+            test__in=matching_tests,
+            test__is_junk=False
+        ).select_related('lab', 'test').order_by('test__name', 'test_id', 'lab__name', 'lab_id')
+
+        paginator = Paginator(offerings, SEARCH_RESULTS_PER_PAGE)
+        page_obj = paginator.get_page(request.GET.get('page'))
+
+        for offering in page_obj:
+            test = offering.test
+            lab = offering.lab
+            display_results.append({
+                'test_id': test.id,
+                'test_name': test.name,
+                'test_description': test.description,
+                'test_price': offering.lab_specific_price if offering.lab_specific_price is not None else test.price,
+                'lab_id': lab.id,
+                'lab_name': lab.name,
+                'lab_address': lab.address,
+                'lab_contact_email': lab.contact_email,
+                'lab_contact_phone': lab.contact_phone,
+            })
 
-    return render(request, 'labdetails.html', {'display_results': display_results, 'query': query})
+    return render(request, 'labdetails.html', {'display_results': display_results, 'query': query, 'page_obj': page_obj})
 
 def lab_registration(request):
     if request.method == 'POST':
@@ -457,74 +440,27 @@ def upload_excel(request):
         if form.is_valid():
             excel_file = request.FILES['excel_file']
             try:
-                workbook = openpyxl.load_workbook(excel_file)
-                sheet = workbook.active
-
-                # Assuming the first row is headers
-                headers = [cell.value.lower() if cell.value else None for cell in sheet[1]]
-
-                # Basic validation for required columns
-                required_lab_cols = ['lab name', 'address', 'city', 'state', 'zip code', 'phone number', 'contact email', 'contact phone']
-                required_test_cols = ['test name', 'test description', 'test price']
-
-                if not all(col in headers for col in required_lab_cols + required_test_cols):
-                    messages.error(request, "Missing one or more required columns in the Excel file (case-insensitive). Required: Lab Name, Address, City, State, Zip Code, Phone Number, Contact Email, Contact Phone, Test Name, Test Description, Test Price.")
-                    return render(request, 'admin_upload_excel.html', {'form': form})
-
-                for row_index in range(2, sheet.max_row + 1):
-                    row_data = {headers[i]: cell.value for i, cell in enumerate(sheet[row_index])}
-
-                    # Create or get Lab
-                    lab_name = row_data.get('lab name')
-                    if not lab_name:
-                        messages.warning(request, f"Skipping row {row_index}: Lab Name is missing.")
-                        continue
-
-                    try:
-                        lab = Lab.objects.get(name__iexact=lab_name) # Case-insensitive search for existing lab
-                    except Lab.DoesNotExist:
-                        user, created = User.objects.get_or_create(username=f"lab_{lab_name.replace(' ', '_').lower()}", defaults={'is_active': True})
-                        if created:
-                            user.set_password('defaultpassword') # IMPORTANT: Change this for production!
-                            user.save()
-                        lab = Lab.objects.create(
-                            user=user,
-                            name=lab_name,
-                            address=row_data.get('address', ''),
-                            city=row_data.get('city', ''),
-                            state=row_data.get('state', ''),
-                            zip_code=row_data.get('zip code', ''),
-                            phone_number=row_data.get('phone number', ''),
-                            contact_email=row_data.get('contact email', 'noreply@example.com'),
-                            contact_phone=row_data.get('contact phone', '000-000-0000')
-                        )
-                        messages.info(request, f"Created new lab: {lab_name}")
-
-                    # Create or get Test and associate with Lab
-                    test_name = row_data.get('test name')
-                    if test_name:
-                        # Case-insensitive search for existing test
-                        try:
-                            test = Test.objects.get(name__iexact=test_name)
-                            created = False
-                        except Test.DoesNotExist:
-                            test = Test.objects.create(
-                                name=test_name,
-                                description=row_data.get('test description', ''),
-                                price=row_data.get('test price', 0.00)
-                            )
-                            created = True
-                        
-                        if created:
-                            messages.info(request, f"Created new test: {test_name}")
-                        lab.tests.add(test)
-                        messages.info(request, f"Associated test '{test_name}' with lab '{lab_name}'")
+                # Streamed in read-only mode and written in chunks, so large price lists don't load into memory
+                summary = import_price_list(excel_file)
+            except ExcelImportError as e:
+                messages.error(request, str(e))
+                return render(request, 'admin_upload_excel.html', {'form': form})
+            except Exception as e:
+                messages.error(request, f"Error processing Excel file: {e}")
+            else:
+                if summary.skipped:
+                    listed = ', '.join(str(row_number) for row_number in summary.skipped_rows)
+                    more = f" and {summary.skipped - len(summary.skipped_rows)} more" if summary.skipped > len(summary.skipped_rows) else ''
+                    messages.warning(request, f"Skipped {summary.skipped} row(s) with no Lab Name: {listed}{more}.")
+                for lab_name in summary.labs_created:
+                    messages.info(request, f"Created new lab: {lab_name}")
+                if summary.tests_created:
+                    messages.info(request, f"Created {summary.tests_created} new test(s)")
+                messages.info(request, f"Associated {summary.associations} test(s) with their labs")
 
                 messages.success(request, "Excel file uploaded and processed successfully!")
                 return redirect('admin_lab_list') # Redirect to admin lab list after successful upload
 
-            except Exception as e:
-                messages.error(request, f"Error processing Excel file: {e}")
     else:
         form = ExcelUploadForm()
     return render(request, 'admin_upload_excel.html', {'form': form})
@@ -647,18 +583,19 @@ def admin_delete_message(request, message_id):
 
 
 # Helper function for AI booking processing
-def _process_ai_booking(user_message, session_id, user):
+def _process_ai_booking(user_message, session_id, user, intents=None):
     """Collect booking details (name, email, phone) - doesn't create booking yet"""
     import re
     from datetime import datetime, timedelta
     from django.core.cache import cache
     
-    # Check if user is providing symptoms/health concerns (not booking details yet)
-    symptoms_keywords = ['feel', 'pain', 'tired', 'fatigue', 'weak', 'fever', 'headache', 'worry', 'concern', 'symptom', 'problem', 'issue', 'sick', 'ill', 'disease', 'diabetes', 'heart', 'thyroid', 'liver', 'kidney', 'chest', 'stomach', 'blood pressure']
+    if intents is None:
+        intents = detect_intents(user_message)
     
-    has_symptoms = any(word in user_message.lower() for word in symptoms_keywords) and '@' not in user_message
-    has_email = '@' in user_message
-    has_name = any(phrase in user_message.lower() for phrase in ['my name is', 'i am', 'name:'])
+    # Check if user is providing symptoms/health concerns (not booking details yet)
+    has_symptoms = intents.has_health_concern
+    has_email = intents.has_email
+    has_name = 'introduction' in intents
     
     # Extract booking details using regex patterns
     name_match = re.search(r'(?:my name is|i am|name:?\s*)\s*([A-Za-z\s]+?)(?:,|email|$)', user_message, re.IGNORECASE)
@@ -845,7 +782,6 @@ def _process_date_selection(user_message, session_id, user):
     import re
     from datetime import datetime, timedelta
     from django.core.cache import cache
-    from .email_utils import send_booking_confirmation_email
     
     # Get saved booking details
     booking_details = cache.get(f"booking_details_{session_id}")
@@ -916,20 +852,14 @@ def _process_date_selection(user_message, session_id, user):
     
     # Create the booking
     try:
-        booking = TestBooking.objects.create(
+        booking = save_booking(TestBooking(
             name=booking_details['name'],
             email=booking_details['email'],
             test_id=booking_details['test_id'],
             lab_id=booking_details['lab_id'],
             booking_date=preferred_date,
             status='booked'
-        )
-        
-        # Send confirmation email
-        try:
-            send_booking_confirmation_email(booking)
-        except Exception as e:
-            print(f"Email sending error: {str(e)}")
+        ), email='confirmation')
         
         # Get test and lab for response
         test = booking.test
@@ -954,6 +884,13 @@ def _process_date_selection(user_message, session_id, user):
         
         return {'success': True, 'message': message}
     
+    except SlotFull as e:
+        # Keep the booking details so the patient can simply pick another time
+        message = f"⏰ **Slot Full**\n\n"
+        message += f"{e}\n"
+        message += "*Example: Tomorrow afternoon*"
+        return {'success': False, 'message': message}
+    
     except Exception as e:
         message = f"❌ **Booking Failed**\n\n"
         message += f"An error occurred: {str(e)}\n"
@@ -965,7 +902,6 @@ def _get_symptom_based_recommendations_for_booking(user_message, patient_name, p
     """Get test recommendations based on symptoms and auto-book if possible"""
     import re
     from datetime import datetime, timedelta
-    from .email_utils import send_booking_confirmation_email
     from lab_suggestion.ai_service import AIRecommendationService
     
     # Extract preferred appointment date/time from message
@@ -1036,18 +972,17 @@ def _get_symptom_based_recommendations_for_booking(user_message, patient_name, p
     recommendation_service = AIRecommendationService()
     recommendation = recommendation_service.recommend_tests(user_message)
     
-    if not recommendation or not recommendation.recommended_tests.exists():
+    # Recommendations come with their tests prefetched
+    recommended_tests = list(recommendation.recommended_tests.all()[:5]) if recommendation else []
+    if not recommended_tests:
         return {
             'success': False,
             'message': '❌ Could not find matching tests for your symptoms.\n\nPlease specify which test you want to book or contact us for help.'
         }
     
-    # Get the first/best recommended test
-    recommended_tests = recommendation.recommended_tests.all()[:5]
-    
-    if recommended_tests.count() == 1:
+    if len(recommended_tests) == 1:
         # Auto-book the single recommended test
-        test = recommended_tests.first()
+        test = recommended_tests[0]
         lab = Lab.objects.filter(tests=test).first()
         
         if not lab:
@@ -1057,19 +992,14 @@ def _get_symptom_based_recommendations_for_booking(user_message, patient_name, p
             }
         
         try:
-            booking = TestBooking.objects.create(
+            booking = save_booking(TestBooking(
                 name=patient_name,
                 email=patient_email,
                 test=test,
                 lab=lab,
                 booking_date=preferred_date,  # Use extracted preferred date/time
                 status='booked'
-            )
-            
-            try:
-                send_booking_confirmation_email(booking)
-            except Exception as e:
-                print(f"Email sending error: {str(e)}")
+            ), email='confirmation')
             
             message = f"✅ **Booking Confirmed!**\n\n"
             message += f"Perfect! Based on your symptoms, I've booked the ideal test.\n\n"
@@ -1086,12 +1016,14 @@ def _get_symptom_based_recommendations_for_booking(user_message, patient_name, p
             message += f"📞 Lab Contact: {lab.contact_phone}"
             
             return {'success': True, 'message': message}
+        except SlotFull as e:
+            return {'success': False, 'message': f"⏰ {e}\n\nTry another time, e.g. *tomorrow at 2 pm*."}
         except Exception as e:
             return {'success': False, 'message': f"❌ Booking failed: {str(e)}"}
     else:
         # Multiple recommendations - ask user to choose
         test_list = "\n".join([f"• **{t.name}** - Rs. {t.price if t.price else 'Contact Lab'}" for t in recommended_tests])
-        message = f"✨ **Perfect Match: {recommended_tests.count()} Tests Found!**\n\n"
+        message = f"✨ **Perfect Match: {len(recommended_tests)} Tests Found!**\n\n"
         message += f"Based on your symptoms of '{user_message}', here are the recommended tests:\n\n"
         message += test_list
         message += f"\n\nWhich one would you like to book? Just reply with the test name!\n"
@@ -1175,7 +1107,7 @@ def _get_symptom_based_recommendations(user_message):
         message += f"Based on what you shared, here are the tests I recommend:\n\n"
         
         for i, test in enumerate(unique_recommendations[:5], 1):
-            labs_offering = Lab.objects.filter(tests=test).count()
+            labs_offering = lab_offerings.get().count_for(test)
             message += f"{i}. **{test.name}**\n"
             if test.description:
                 message += f"   *{test.description}*\n"
@@ -1207,98 +1139,107 @@ def _get_symptom_based_recommendations(user_message):
 # Note: Full-page chatbot removed - using floating widget only (more popular pattern)
 # The floating widget is available on all pages via base.html
 
+def _chatbot_reply(user_message, session_id, user):
+    """Work out the chatbot's reply to one message, advancing any booking in progress"""
+    from django.core.cache import cache
+    
+    # Shared chatbot service (its catalog context is cached across requests)
+    chatbot = AIChatbotService.instance()
+    
+    # Check if user is trying to book or provided booking details
+    intents = detect_intents(user_message)
+    is_booking_intent = intents.is_booking_request
+    is_booking_details = 'booking_details' in intents
+    
+    # First, check if this message contains a test name and store it in cache
+    test_names = test_name_index.get()
+    mentioned = test_names.find_in(user_message)
+    detected_test = mentioned['name'] if mentioned else None
+    
+    import re
+    # If no exact match, try regex extraction for "book [test name]" pattern
+    if not detected_test:
+        test_match = re.search(r'(?:book|test:?\s*)\s*([A-Za-z\s0-9/:-]+?)(?:,|email|my|$)', user_message, re.IGNORECASE)
+        if test_match:
+            test_name_candidate = test_match.group(1).strip()
+            # Fuzzy match - names starting with the candidate first, then names containing it
+            candidates = test_names.search(test_name_candidate, limit=1)
+            if candidates:
+                detected_test = candidates[0]['name']
+    
+    # Store detected test in cache for later use (15 minute expiry)
+    if detected_test:
+        cache.set(f"booking_test_{session_id}", detected_test, 900)
+    
+    # Check if this is a booking attempt (has details like name/email)
+    current_booking_stage = cache.get(f"booking_stage_{session_id}")
+    
+    # If user is in the middle of a booking session, check stage first
+    if current_booking_stage == 'date_selection':
+        # User is selecting date/time (don't check for name/email requirement)
+        booking_result = _process_date_selection(user_message, session_id, user)
+        if booking_result['success']:
+            # Booking complete!
+            bot_response = booking_result['message']
+            suggestions = ["View my bookings", "Book another test", "Go to home"]
+            cache.delete(f"booking_stage_{session_id}")
+            cache.delete(f"booking_test_{session_id}")
+            cache.delete(f"booking_details_{session_id}")
+        else:
+            # Ask to select date/time again
+            bot_response = booking_result['message']
+            suggestions = booking_result.get('suggestions', ["Today", "Tomorrow", "This Week"])
+    
+    elif is_booking_details and (is_booking_intent or detected_test or cache.get(f"booking_test_{session_id}")):
+        # Stage 1: Collect name, email, phone
+        booking_result = _process_ai_booking(user_message, session_id, user, intents)
+        bot_response = booking_result['message']
+        suggestions = booking_result.get('suggestions', ["Today", "Tomorrow", "This Week"])
+        
+        # Check if we have the booking details (ask for date/time next)
+        if 'Details Confirmed' in bot_response or 'Now, please select' in bot_response:
+            # Move to date selection stage
+            cache.set(f"booking_stage_{session_id}", 'date_selection', 1800)  # 30 min TTL
+        else:
+            suggestions = ["Try again with correct details", "What tests do you have?", "Find labs near me"]
+    else:
+        # Generate normal response
+        bot_response, suggestions = chatbot.generate_response(user_message, session_id, intents)
+    
+    return bot_response, suggestions
+
+
+def _parse_chatbot_request(request):
+    """(message, session_id) from a chatbot API request body; ValueError if it isn't a JSON object with a string message"""
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        raise ValueError('Invalid JSON')
+    if not isinstance(data, dict):
+        raise ValueError('Request body must be a JSON object')
+    message = data.get('message', '')
+    session_id = data.get('session_id') or str(uuid.uuid4())
+    if not isinstance(message, str) or not isinstance(session_id, str):
+        raise ValueError('message and session_id must be strings')
+    return message.strip(), session_id
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def chatbot_api(request):
     """API endpoint for chatbot interactions"""
     try:
-        from django.core.cache import cache
-        data = json.loads(request.body)
-        user_message = data.get('message', '').strip()
-        session_id = data.get('session_id', str(uuid.uuid4()))
-        
-        if not user_message:
-            return JsonResponse({'error': 'Message is required'}, status=400)
-        
-        # Initialize chatbot service
-        chatbot = AIChatbotService()
-        
-        # Check if user is trying to book or provided booking details
-        user_message_lower = user_message.lower()
-        is_booking_intent = any(word in user_message_lower for word in ['book', 'reserve', 'schedule', 'appointment'])
-        is_booking_details = any(word in user_message_lower for word in ['my name is', 'i am', 'email:', 'email is', 'book for me', '@'])
-        
-        # First, check if this message contains a test name and store it in cache
-        from .models import Test
-        all_tests = Test.objects.all()
-        detected_test = None
-        
-        import re
-        # Look for test keywords in the message
-        for test in all_tests:
-            if test.name.lower() in user_message_lower:
-                detected_test = test.name
-                break
-        
-        # If no exact match, try regex extraction for "book [test name]" pattern
-        if not detected_test:
-            test_match = re.search(r'(?:book|test:?\s*)\s*([A-Za-z\s0-9/:-]+?)(?:,|email|my|$)', user_message, re.IGNORECASE)
-            if test_match:
-                test_name_candidate = test_match.group(1).strip().lower()
-                # Fuzzy match - find test that contains the candidate keywords
-                for test in all_tests:
-                    test_name_lower = test.name.lower()
-                    # Check if test name contains most keywords
-                    if test_name_lower.startswith(test_name_candidate) or test_name_candidate in test_name_lower:
-                        detected_test = test.name
-                        break
-        
-        # Store detected test in cache for later use (15 minute expiry)
-        if detected_test:
-            cache.set(f"booking_test_{session_id}", detected_test, 900)
-        
-        # Check if this is a booking attempt (has details like name/email)
-        current_booking_stage = cache.get(f"booking_stage_{session_id}")
-        
-        # If user is in the middle of a booking session, check stage first
-        if current_booking_stage == 'date_selection':
-            # User is selecting date/time (don't check for name/email requirement)
-            booking_result = _process_date_selection(user_message, session_id, request.user)
-            if booking_result['success']:
-                # Booking complete!
-                bot_response = booking_result['message']
-                suggestions = ["View my bookings", "Book another test", "Go to home"]
-                cache.delete(f"booking_stage_{session_id}")
-                cache.delete(f"booking_test_{session_id}")
-                cache.delete(f"booking_details_{session_id}")
-            else:
-                # Ask to select date/time again
-                bot_response = booking_result['message']
-                suggestions = booking_result.get('suggestions', ["Today", "Tomorrow", "This Week"])
-        
-        elif is_booking_details and (is_booking_intent or detected_test or cache.get(f"booking_test_{session_id}")):
-            # Stage 1: Collect name, email, phone
-            booking_result = _process_ai_booking(user_message, session_id, request.user)
-            bot_response = booking_result['message']
-            suggestions = booking_result.get('suggestions', ["Today", "Tomorrow", "This Week"])
-            
-            # Check if we have the booking details (ask for date/time next)
-            if 'Details Confirmed' in bot_response or 'Now, please select' in bot_response:
-                # Move to date selection stage
-                cache.set(f"booking_stage_{session_id}", 'date_selection', 1800)  # 30 min TTL
-            else:
-                suggestions = ["Try again with correct details", "What tests do you have?", "Find labs near me"]
-        else:
-            # Generate normal response
-            bot_response, suggestions = chatbot.generate_response(user_message, session_id)
+        user_message, session_id = _parse_chatbot_request(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if not user_message:
+        return JsonResponse({'error': 'Message is required'}, status=400)
+    
+    try:
+        bot_response, suggestions = _chatbot_reply(user_message, session_id, request.user)
         
-        # Save to database
-        chat_message = ChatMessage.objects.create(
-            session_id=session_id,
-            user_message=user_message,
-            bot_response=bot_response,
-            user=request.user if request.user.is_authenticated else None
-        )
+        # Log the conversation (saved in batches unless CHAT_LOG_WRITE_BEHIND is off)
+        chat_message = record_chat_message(session_id, user_message, bot_response, request.user)
         
         return JsonResponse({
             'response': bot_response,
@@ -1311,6 +1252,57 @@ def chatbot_api(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+def _sse_event(event, data):
+    """One Server-Sent Events frame carrying `data` as JSON"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _reply_chunks(text):
+    """Split a reply into line-sized pieces for streaming"""
+    return text.splitlines(keepends=True) or [text]
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def chatbot_stream_api(request):
+    """Streaming variant of chatbot_api: sends the reply as Server-Sent Events"""
+    try:
+        user_message, session_id = _parse_chatbot_request(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if not user_message:
+        return JsonResponse({'error': 'Message is required'}, status=400)
+    user = await request.auser()
+    
+    async def events():
+        # Something reaches the client straight away, before the reply is worked out
+        yield _sse_event('start', {'session_id': session_id})
+        try:
+            bot_response, suggestions = await sync_to_async(_chatbot_reply)(user_message, session_id, user)
+        except Exception as e:
+            yield _sse_event('error', {'error': str(e)})
+            return
+        
+        # Log the conversation while the reply streams out
+        save = asyncio.ensure_future(arecord_chat_message(session_id, user_message, bot_response, user))
+        try:
+            for chunk in _reply_chunks(bot_response):
+                yield _sse_event('chunk', {'text': chunk})
+            yield _sse_event('done', {
+                'suggestions': suggestions,
+                'session_id': session_id,
+                'timestamp': timezone.now().isoformat()
+            })
+        finally:
+            # Still wait for the save when the client goes away mid-stream
+            await save
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Keep nginx from buffering the stream
+    return response
+
+
 def ai_recommendations_view(request):
     """View for AI-powered test recommendations based on symptoms"""
     recommended_tests = None
@@ -1366,24 +1358,19 @@ def book_test(request, test_id, lab_id):
             booking = form.save(commit=False)
             booking.test = test
             booking.lab = lab
-            booking.save()
-            
-            # Send confirmation email
             try:
-                email_sent = send_booking_confirmation_email(booking)
-                if email_sent:
-                    messages.success(request, f'Your Booking has been Booked! A confirmation email has been sent to {booking.email}')
-                else:
-                    messages.warning(request, f'Your Booking has been Booked! However, we could not send the confirmation email.')
-            except Exception as e:
-                print(f"Email sending error: {str(e)}")
-                messages.warning(request, f'Your Booking has been Booked! However, there was an issue sending the confirmation email.')
-            
-            return render(request, 'booking_confirmation.html', {
-                'booking': booking,
-                'test': test,
-                'lab': lab
-            })
+                # The confirmation email is queued in the same transaction as the booking
+                save_booking(booking, email='confirmation')
+            except SlotFull as e:
+                form.add_error('booking_date', str(e))
+            else:
+                messages.success(request, f'Your Booking has been Booked! A confirmation email will be sent to {booking.email} shortly.')
+                
+                return render(request, 'booking_confirmation.html', {
+                    'booking': booking,
+                    'test': test,
+                    'lab': lab
+                })
     else:
         form = TestBookingForm()
     
@@ -1420,6 +1407,7 @@ def check_booking_status(request):
 def update_booking(request, booking_id):
     """View to update booking date or details"""
     booking = get_object_or_404(TestBooking, booking_id=booking_id, status='booked')
+    held = held_slot(booking)
     
     if request.method == 'POST':
         form = TestBookingForm(request.POST, instance=booking)
@@ -1430,18 +1418,16 @@ def update_booking(request, booking_id):
             return render(request, 'update_booking.html', {'form': form, 'booking': booking})
         
         if form.is_valid():
-            form.save()
-            
-            # Send update notification email
+            if 'booking_date' in form.changed_data:
+                # Remind the patient again for the new time
+                form.instance.reminder_sent_at = None
             try:
-                email_sent = send_booking_update_email(booking)
-                if email_sent:
-                    messages.success(request, f'Your booking has been updated successfully! A confirmation email has been sent.')
-                else:
-                    messages.warning(request, f'Your booking has been updated successfully! However, we could not send the notification email.')
-            except Exception as e:
-                print(f"Email sending error: {str(e)}")
-                messages.warning(request, f'Your booking has been updated successfully! However, there was an issue sending the notification email.')
+                save_booking(form.instance, held, email='update')
+            except SlotFull as e:
+                form.add_error('booking_date', str(e))
+                return render(request, 'update_booking.html', {'form': form, 'booking': booking})
+            
+            messages.success(request, f'Your booking has been updated successfully! A confirmation email will be sent shortly.')
             
             return redirect('check_booking_status')
     else:
@@ -1464,25 +1450,79 @@ def cancel_booking(request, booking_id):
             messages.error(request, 'Email does not match the booking email.')
             return render(request, 'cancel_booking.html', {'booking': booking})
         
+        held = held_slot(booking)
         booking.status = 'cancelled'
-        booking.save()
+        save_booking(booking, held, email='cancellation')
         
-        # Send cancellation notification email
-        try:
-            email_sent = send_booking_cancellation_email(booking)
-            if email_sent:
-                messages.success(request, f'Your booking {booking.booking_id} has been cancelled successfully. A confirmation email has been sent.')
-            else:
-                messages.warning(request, f'Your booking {booking.booking_id} has been cancelled successfully. However, we could not send the notification email.')
-        except Exception as e:
-            print(f"Email sending error: {str(e)}")
-            messages.warning(request, f'Your booking {booking.booking_id} has been cancelled successfully. However, there was an issue sending the notification email.')
+        messages.success(request, f'Your booking {booking.booking_id} has been cancelled successfully. A confirmation email will be sent shortly.')
         
         return redirect('check_booking_status')
     
     return render(request, 'cancel_booking.html', {'booking': booking})
 
 
+def _booking_cursor(booking):
+    """Keyset pagination cursor for a booking: microseconds since the epoch and id"""
+    since_epoch = booking.booking_date - datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+    return f"{since_epoch // datetime.timedelta(microseconds=1)}-{booking.id}"
+
+
+def _parse_booking_cursor(cursor):
+    """(booking_date, id) from a cursor, or None if it is malformed"""
+    try:
+        microseconds, booking_id = (int(part) for part in cursor.split('-'))
+    except (AttributeError, ValueError):
+        return None
+    epoch = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+    return epoch + datetime.timedelta(microseconds=microseconds), booking_id
+
+
+def _keyset_page(bookings, descending, after=None, before=None, size=BOOKINGS_PER_PAGE):
+    """One page of `bookings` ordered by (booking_date, id), resuming after or before a cursor
+
+    Returns (page, next_cursor, previous_cursor); the cursors are None at either end.
+    """
+    forward = before is None
+    cursor = _parse_booking_cursor(after if forward else before)
+    # Walking backwards means reading the opposite order and flipping the page
+    read_descending = descending == forward
+    if cursor:
+        booking_date, booking_id = cursor
+        if read_descending:
+            bookings = bookings.filter(Q(booking_date__lt=booking_date) | Q(booking_date=booking_date, id__lt=booking_id))
+        else:
+            bookings = bookings.filter(Q(booking_date__gt=booking_date) | Q(booking_date=booking_date, id__gt=booking_id))
+    ordering = ('-booking_date', '-id') if read_descending else ('booking_date', 'id')
+    page = list(bookings.order_by(*ordering)[:size + 1])
+    has_more = len(page) > size
+    page = page[:size]
+    if not forward:
+        page.reverse()
+    if not page:
+        return page, None, None
+    has_next = has_more if forward else True
+    has_previous = (cursor is not None) if forward else has_more
+    return (
+        page,
+        _booking_cursor(page[-1]) if has_next else None,
+        _booking_cursor(page[0]) if has_previous else None,
+    )
+
+
+def _lab_bookings_on(lab, day, status=''):
+    """A lab's bookings on one day, optionally with one status"""
+    # A (lab, booking_date) range, so the lab calendar indexes do the filtering
+    day_start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+    bookings = TestBooking.objects.filter(
+        lab=lab,
+        booking_date__gte=day_start,
+        booking_date__lt=day_start + datetime.timedelta(days=1),
+    ).select_related('test')
+    if status and status in dict(TestBooking.BOOKING_STATUS_CHOICES):
+        bookings = bookings.filter(status=status)
+    return bookings
+
+
 @login_required
 def view_lab_bookings(request):
     """Lab can view and manage all bookings for their lab"""
@@ -1492,38 +1532,21 @@ def view_lab_bookings(request):
         messages.error(request, 'Lab not found.')
         return redirect('manage_lab')
     
-    # Get all bookings for this lab
-    all_bookings = TestBooking.objects.filter(lab=lab).order_by('-booking_date')
-    
     # Get filter date from request (default to today)
-    from datetime import datetime, timedelta
     filter_date_str = request.GET.get('filter_date')
     
     if filter_date_str:
         try:
-            filter_date = datetime.strptime(filter_date_str, '%Y-%m-%d').date()
+            filter_date = datetime.datetime.strptime(filter_date_str, '%Y-%m-%d').date()
         except ValueError:
-            filter_date = datetime.now().date()
+            filter_date = timezone.localdate()
     else:
-        filter_date = datetime.now().date()
+        filter_date = timezone.localdate()
     
     # Get time sort and status filter from request
     time_sort = request.GET.get('time_sort', 'asc')  # 'asc' for 0:00am-12:00pm, 'desc' for 12:00pm-11:59pm
     filter_status = request.GET.get('filter_status', '')  # Empty string means show all
     
-    # Filter bookings by date (compare just the date part)
-    bookings = [b for b in all_bookings if b.booking_date.date() == filter_date]
-    
-    # Filter by status if selected
-    if filter_status and filter_status in dict(TestBooking.BOOKING_STATUS_CHOICES):
-        bookings = [b for b in bookings if b.status == filter_status]
-    
-    # Sort by time
-    if time_sort == 'asc':
-        bookings = sorted(bookings, key=lambda x: x.booking_date.time())
-    else:  # desc
-        bookings = sorted(bookings, key=lambda x: x.booking_date.time(), reverse=True)
-    
     # Handle status update
     if request.method == 'POST':
         booking_id = request.POST.get('booking_id')
@@ -1532,34 +1555,43 @@ def view_lab_bookings(request):
         try:
             booking = TestBooking.objects.get(booking_id=booking_id, lab=lab)
             if new_status in dict(TestBooking.BOOKING_STATUS_CHOICES):
+                held = held_slot(booking)
                 booking.status = new_status
-                booking.save()
-                
-                # Send update email to user if status changed
-                if new_status in ['test_done', 'not_arrived', 'cancelled']:
-                    try:
-                        send_booking_update_email(booking)
-                    except Exception as e:
-                        print(f"Email sending error: {str(e)}")
+                # Tell the user about status changes, queued with the change itself
+                email = 'update' if new_status in ['test_done', 'not_arrived', 'cancelled'] else None
+                save_booking(booking, held, email=email)
                 
                 messages.success(request, f'Booking {booking_id} status updated to {new_status}.')
             else:
                 messages.error(request, 'Invalid status.')
         except TestBooking.DoesNotExist:
             messages.error(request, 'Booking not found.')
+        except SlotFull as e:
+            messages.error(request, f'Booking {booking_id} cannot be reopened. {e}')
         
         # Redirect back to bookings page with same filter using URL path
         from django.urls import reverse
-        return redirect(f"{reverse('view_lab_bookings')}?filter_date={filter_date_str}&time_sort={time_sort}&filter_status={filter_status}")
+        return redirect(f"{reverse('view_lab_bookings')}?filter_date={filter_date.isoformat()}&time_sort={time_sort}&filter_status={filter_status}")
+    
+    # Sort by time, a page at a time
+    bookings, next_cursor, previous_cursor = _keyset_page(
+        _lab_bookings_on(lab, filter_date, filter_status),
+        descending=time_sort != 'asc',
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        size=BOOKINGS_PER_PAGE,
+    )
     
     context = {
         'lab': lab,
         'bookings': bookings,
         'filter_date': filter_date,
-        'filter_date_str': filter_date_str or datetime.now().strftime('%Y-%m-%d'),
+        'filter_date_str': filter_date_str or filter_date.strftime('%Y-%m-%d'),
         'status_choices': TestBooking.BOOKING_STATUS_CHOICES,
         'time_sort': time_sort,
         'filter_status': filter_status,
+        'next_cursor': next_cursor,
+        'previous_cursor': previous_cursor,
     }
     return render(request, 'view_lab_bookings.html', context)
 
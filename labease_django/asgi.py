@@ -14,3 +14,11 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'labease_django.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402  (settings are configured above)
+
+if settings.DEBUG:
+    # Serve static files the way runserver does, so the admin keeps its styles
+    from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+
+    application = ASGIStaticFilesHandler(application)
@@ -82,6 +82,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file rather than SQLite's in-memory default, so threaded tests see real write-lock waits
+        # (an in-memory shared-cache database raises "table is locked" instead of waiting)
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -132,6 +135,7 @@ LOGIN_REDIRECT_URL = '/lab/dashboard/'
 LOGOUT_REDIRECT_URL = '/'
 
 # Caching Configuration - Store session test selections
+# The cache is per process; catalog indexes stay consistent across workers through the CatalogVersion row
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
@@ -139,6 +143,21 @@ CACHES = {
     }
 }
 
+# Chatbot conversation log - messages are buffered and saved in batches
+# Set CHAT_LOG_WRITE_BEHIND = False to save every message before the reply is sent
+CHAT_LOG_WRITE_BEHIND = True
+CHAT_LOG_BATCH_SIZE = 50
+CHAT_LOG_FLUSH_INTERVAL_MS = 250
+
+# Chatbot answers cached per process for the current catalog version (0 disables the cache)
+CHATBOT_RESPONSE_CACHE_SIZE = 512
+
+# Bookings a lab accepts per test per hour, unless the lab sets its own slots per hour for the test
+BOOKING_SLOTS_PER_HOUR = 4
+
+# `python manage.py send_booking_reminders` reminds patients of bookings starting within this many hours
+BOOKING_REMINDER_HOURS = 24
+
 # Email Configuration
 # Use SMTP Backend with Gmail
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -150,3 +169,9 @@ EMAIL_USE_TLS = False  # Disable TLS when using SSL
 
 # For debugging, use console backend (emails will show in terminal):
 # EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
+# Booking emails are queued in the EmailOutbox table and sent by `python manage.py send_queued_emails`
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_SECONDS = 60  # Delay before the first retry, doubling after each failed attempt
+EMAIL_OUTBOX_BATCH_SIZE = 100  # Emails the worker claims and sends per batch
+EMAIL_CONNECTION_IDLE_TIMEOUT = 30  # Seconds the worker keeps an unused SMTP connection open
@@ -99,5 +99,5 @@ echo "  ./start.sh"
 echo ""
 echo "Or manually:"
 echo "  source venv/bin/activate"
-echo "  python manage.py runserver"
+echo "  uvicorn labease_django.asgi:application --reload"
 echo ""
@@ -1,7 +1,7 @@
 #!/bin/bash
 
 # LabEase Start Script
-# This script starts the Django development server
+# This script starts the Django app under an ASGI server (uvicorn) so the chat reply streams
 
 set -e  # Exit on error
 
@@ -29,13 +29,20 @@ python manage.py migrate --noinput
 # Collect static files (if needed in production)
 # python manage.py collectstatic --noinput
 
+# Start the email worker; it delivers the booking emails queued in the outbox
+echo ""
+echo "Starting the email worker..."
+python manage.py send_queued_emails &
+WORKER_PID=$!
+trap 'kill $WORKER_PID 2>/dev/null' EXIT
+
 # Start the server
 echo ""
-echo "Starting Django development server..."
+echo "Starting LabEase under uvicorn..."
 echo "Server will be available at: http://localhost:8000"
 echo "Press Ctrl+C to stop the server"
 echo ""
 echo "========================================="
 echo ""
 
-python manage.py runserver
+uvicorn labease_django.asgi:application --host 127.0.0.1 --port 8000 --reload